@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# Measure the detection throughput of the conan-recipe-generator over synthetic source trees
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from argparse import ArgumentParser
+import io
+import json
+import os
+from pathlib import Path
+import random
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_SEED = 20200101
+TREE_NAME = "synthetic-1.0.0"
+# Archives are generated once per seed and size, and reused by later runs
+DEFAULT_FIXTURE_DIR = Path(tempfile.gettempdir()) / "crg-benchmark-trees"
+
+SOURCE_SUFFIXES = (".c", ".cpp", ".h", ".hpp", ".txt", ".md", ".py", ".in")
+LICENSE_NAMES = ("LICENSE", "COPYING", "COPYRIGHT", "LICENCE.md")
+CONFIGURE_SIZE = 4 << 20
+
+# Metrics compared by --compare: (key, True if higher is better)
+COMPARED_METRICS = (
+    ("files_per_second", True),
+    ("detect_s", False),
+    ("compress_cmake_s", False),
+    ("properties_s", False),
+    ("peak_rss", False),
+    ("syscalls_read", False),
+    ("syscalls_write", False),
+)
+
+
+class SyntheticTree(object):
+    """
+    Deterministic source tree of a number of files, generated from a seed.
+    Every directory has a CMakeLists.txt adding its subdirectories,
+    the top directory has autotools scripts (with a large generated configure) and license files.
+    """
+    def __init__(self, nb_files: int, seed: int, max_depth: int=12, max_children: int=6):
+        self.nb_files = nb_files
+        self.seed = seed
+        self.max_depth = max_depth
+        self.max_children = max_children
+
+    def _add(self, tar: tarfile.TarFile, name: str, data: bytes) -> None:
+        info = tarfile.TarInfo("{}/{}".format(TREE_NAME, name))
+        info.size = len(data)
+        info.mtime = 0
+        tar.addfile(info, io.BytesIO(data))
+
+    def _add_dir(self, tar: tarfile.TarFile, name: str) -> None:
+        info = tarfile.TarInfo("{}/{}".format(TREE_NAME, name) if name else TREE_NAME)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        info.mtime = 0
+        tar.addfile(info)
+
+    @staticmethod
+    def _configure(rnd: random.Random) -> bytes:
+        lines = [
+            "#! /bin/sh",
+            "# Guess values for system-dependent variables and create Makefiles.",
+            "PACKAGE_NAME='synthetic'",
+            "PACKAGE_VERSION='1.0.0'",
+        ]
+        size = sum(len(line) + 1 for line in lines)
+        while size < CONFIGURE_SIZE:
+            line = "ac_cv_{}=${{ac_cv_{}-no}} # {}".format(rnd.getrandbits(32), rnd.getrandbits(32), "x" * rnd.randrange(80))
+            lines.append(line)
+            size += len(line) + 1
+        return "\n".join(lines).encode()
+
+    def write(self, path: Path) -> None:
+        rnd = random.Random(self.seed)
+        with tarfile.open(str(path), mode="w:gz", compresslevel=1) as tar:
+            self._add_dir(tar, "")
+            self._add(tar, "configure.ac", b"AC_INIT([synthetic], [1.0.0])\nAM_INIT_AUTOMAKE\nLT_INIT\nAC_OUTPUT\n")
+            self._add(tar, "configure", self._configure(rnd))
+            for license_name in LICENSE_NAMES:
+                self._add(tar, license_name, b"Permission is hereby granted, free of charge\n" * 20)
+            nb_files = 2 + len(LICENSE_NAMES)
+
+            # Breadth first creation of nested directories, until the requested number of files is reached.
+            # Every queued directory still has to get its CMakeLists.txt, so those are reserved from the budget.
+            queue = [("", 0)]
+            dir_index = 0
+            while queue:
+                dir_name, depth = queue.pop(0)
+                nb_files += 1
+                budget = self.nb_files - nb_files - len(queue)
+                children = []
+                if depth < self.max_depth:
+                    for _ in range(min(rnd.randrange(1, self.max_children + 1), max(budget, 0))):
+                        dir_index += 1
+                        children.append("d{}".format(dir_index))
+                prefix = dir_name + "/" if dir_name else ""
+                script = ""
+                if not dir_name:
+                    script += "cmake_minimum_required(VERSION 3.15)\n# project(commented VERSION 0.0)\nproject(synthetic VERSION 1.0.0 LANGUAGES C CXX)\n"
+                script += "".join("add_subdirectory({})\n".format(child) for child in children)
+                self._add(tar, prefix + "CMakeLists.txt", script.encode())
+                for child in children:
+                    self._add_dir(tar, prefix + child)
+                    queue.append((prefix + child, depth + 1))
+                for _ in range(min(rnd.randrange(1, 40), max(self.nb_files - nb_files - len(queue), 0))):
+                    suffix = rnd.choice(SOURCE_SUFFIXES)
+                    content = "/* {} */\n".format(rnd.getrandbits(64)).encode() * rnd.randrange(0, 8)
+                    self._add(tar, "{}f{}{}".format(prefix, nb_files, suffix), content)
+                    nb_files += 1
+
+    def archive(self, fixture_dir: Path) -> Path:
+        path = fixture_dir / "{}-{}-{}.tar.gz".format(TREE_NAME, self.nb_files, self.seed)
+        if not path.exists():
+            fixture_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            self.write(tmp_path)
+            os.replace(str(tmp_path), str(path))
+        return path
+
+
+def read_proc_io() -> Dict[str, int]:
+    """Counters of /proc/self/io (Linux only): syscr and syscw count the read and write system calls"""
+    try:
+        with open("/proc/self/io") as f:
+            return {key: int(value) for key, _, value in (line.partition(": ") for line in f)}
+    except (IOError, ValueError):
+        return {}
+
+
+def run_once(archive_path: Path, mode: str, parse_jobs: Optional[int], confidence: Optional[float]) -> Dict:
+    """Detect the properties of the archive in a fresh work directory (called in a separate process)"""
+    from conan_recipe_generator.detect_properties import ConanPackageDetector, DetectorOptions
+    from conan_recipe_generator.metrics import Metrics, peak_rss
+    from conan_recipe_generator.pipeline import RECIPE_URL, default_package_properties
+
+    options = DetectorOptions(extract=mode == "extract", parse_jobs=parse_jobs, use_detection_cache=False, confidence=confidence)
+    metrics = Metrics()
+    with tempfile.TemporaryDirectory(prefix="crg-benchmark-") as workpath:
+        with ConanPackageDetector(workpath=Path(workpath), download_url=str(archive_path), download_sha256=None, options=options, metrics=metrics) as detector:
+            io_start = read_proc_io()
+            start = time.perf_counter()
+            detector.detect()
+            detect_s = time.perf_counter() - start
+            io_end = read_proc_io()
+
+            start = time.perf_counter()
+            detector._compress_cmake()
+            compress_cmake_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            detector.properties(url=RECIPE_URL, default_packages=default_package_properties())
+            properties_s = time.perf_counter() - start
+
+            nb_files = detector._source_tree.inventory.file_count
+
+    def io_delta(key):
+        if key not in io_start or key not in io_end:
+            return None
+        return io_end[key] - io_start[key]
+
+    return {
+        "files": nb_files,
+        "detect_s": detect_s,
+        "compress_cmake_s": compress_cmake_s,
+        "properties_s": properties_s,
+        "files_per_second": nb_files / detect_s,
+        "peak_rss": peak_rss(),
+        "syscalls_read": io_delta("syscr"),
+        "syscalls_write": io_delta("syscw"),
+        "phases": metrics.to_dict(),
+    }
+
+
+def measure(python: str, archive_path: Path, mode: str, parse_jobs: Optional[int], confidence: Optional[float], runs: int) -> Dict:
+    """Run every measurement in a new process, so the peak RSS is of that run alone"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (str(ROOT), env.get("PYTHONPATH"))))
+    command = [python, str(Path(__file__).resolve()), "--run-once", str(archive_path), "--mode", mode]
+    if parse_jobs is not None:
+        command.extend(["--parse-jobs", str(parse_jobs)])
+    if confidence is not None:
+        command.extend(["--confidence", str(confidence)])
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(command, env=env, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+
+    result = {"runs": runs}
+    for key in ("files", "detect_s", "compress_cmake_s", "properties_s", "files_per_second", "peak_rss", "syscalls_read", "syscalls_write"):
+        values = [sample[key] for sample in samples if sample[key] is not None]
+        result[key] = statistics.median(values) if values else None
+    # The phases of the median run
+    samples.sort(key=lambda sample: sample["detect_s"])
+    result["phases"] = samples[len(samples) // 2]["phases"]
+    return result
+
+
+def compare(baseline: Dict, results: Dict, threshold: float) -> List[str]:
+    """Print the change of every metric relative to the baseline, and return the regressions above threshold percent"""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            print("{:<24} not in baseline".format(name))
+            continue
+        for key, higher_is_better in COMPARED_METRICS:
+            if not old.get(key) or result.get(key) is None:
+                continue
+            change = (result[key] - old[key]) / old[key] * 100
+            regression = -change if higher_is_better else change
+            flag = ""
+            if regression > threshold:
+                flag = "  REGRESSION"
+                regressions.append("{} {}".format(name, key))
+            print("{:<24} {:<18} {:>14.4g} -> {:>14.4g} ({:+6.1f}%){}".format(name, key, old[key], result[key], change, flag))
+    return regressions
+
+
+def main(args=None):
+    parser = ArgumentParser(description="Measure the detection throughput over synthetic source trees")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="Comma separated numbers of files of the trees (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed of the generated trees")
+    parser.add_argument("--mode", choices=("extract", "stream", "both"), default="both", help="Detect on the extracted tree, the streamed archive, or both")
+    parser.add_argument("--parse-jobs", type=int, default=None, help="Number of parser threads")
+    parser.add_argument("--confidence", type=float, default=None, help="Scan breadth first, until the detection reaches this confidence")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs of every scenario")
+    parser.add_argument("--python", default=sys.executable, help="Python interpreter to measure")
+    parser.add_argument("--fixtures", type=Path, default=DEFAULT_FIXTURE_DIR, help="Directory of the generated archives (default: %(default)s)")
+    parser.add_argument("--output", "-o", default=None, help="Write the results as json to this file")
+    parser.add_argument("--compare", metavar="BASELINE", default=None, help="Compare the results with the json output of an earlier run")
+    parser.add_argument("--threshold", type=float, default=10., help="Regression threshold of --compare in percent (default: %(default)s)")
+    parser.add_argument("--run-once", metavar="ARCHIVE", default=None, help="Measure a single run, and print it as json (used internally)")
+    ns = parser.parse_args(args)
+
+    if ns.run_once:
+        print(json.dumps(run_once(Path(ns.run_once), ns.mode, ns.parse_jobs, ns.confidence)))
+        return 0
+
+    modes = ("extract", "stream") if ns.mode == "both" else (ns.mode, )
+    results = {
+        "python": ns.python,
+        "seed": ns.seed,
+        "confidence": ns.confidence,
+        "scenarios": {},
+    }
+    for size in (int(size) for size in ns.sizes.split(",")):
+        start = time.perf_counter()
+        archive_path = SyntheticTree(size, ns.seed).archive(ns.fixtures)
+        print("{} files: archive '{}' ({:.1f} s)".format(size, archive_path, time.perf_counter() - start))
+        for mode in modes:
+            name = "{}-{}".format(size, mode)
+            result = measure(ns.python, archive_path, mode, ns.parse_jobs, ns.confidence, ns.runs)
+            results["scenarios"][name] = result
+            print("{:<24} detect {:8.3f} s, {:10.0f} files/s, peak rss {:6.1f} MiB, syscalls r/w {}/{}".format(
+                name, result["detect_s"], result["files_per_second"], (result["peak_rss"] or 0) / (1 << 20),
+                result["syscalls_read"], result["syscalls_write"]))
+
+    if ns.output:
+        with open(ns.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if ns.compare:
+        with open(ns.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, ns.threshold)
+        if regressions:
+            print("Regressions above {}%: {}".format(ns.threshold, ", ".join(regressions)), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Measure the complete conan-recipe-generator pipeline against archives served by a local http server
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from argparse import ArgumentParser
+import functools
+import http.server
+import json
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+from typing import Dict, List, Optional
+import zipfile
+
+from detection import DEFAULT_FIXTURE_DIR, DEFAULT_SEED, TREE_NAME, SyntheticTree
+
+ROOT = Path(__file__).resolve().parent.parent
+
+FORMATS = {
+    ".tar.gz": "w:gz",
+    ".tar.xz": "w:xz",
+    ".tar.bz2": "w:bz2",
+    ".zip": None,
+}
+
+
+def make_fixture(fixture_dir: Path, nb_files: int, seed: int, suffix: str) -> Path:
+    """Repack the synthetic tree of nb_files files into an archive of the format of suffix"""
+    tar_path = SyntheticTree(nb_files, seed).archive(fixture_dir)
+    path = fixture_dir / "{}-{}".format(nb_files, seed) / (TREE_NAME + suffix)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tarfile.open(str(tar_path), mode="r|gz") as source:
+        if FORMATS[suffix] is None:
+            with zipfile.ZipFile(str(tmp_path), mode="w", compression=zipfile.ZIP_DEFLATED) as zip:
+                for member in source:
+                    if member.isdir():
+                        zip.writestr(zipfile.ZipInfo(member.name + "/"), b"")
+                    else:
+                        zip.writestr(zipfile.ZipInfo(member.name), source.extractfile(member).read())
+        else:
+            with tarfile.open(str(tmp_path), mode=FORMATS[suffix]) as target:
+                for member in source:
+                    target.addfile(member, source.extractfile(member) if member.isfile() else None)
+    os.replace(str(tmp_path), str(path))
+    return path
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(object):
+    """Http server on localhost, serving the files of a directory from a background thread"""
+    def __init__(self, directory: Path):
+        handler = functools.partial(QuietHandler, directory=str(directory))
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def url(self, name: str) -> str:
+        return "http://127.0.0.1:{}/{}".format(self._server.server_address[1], name)
+
+    def __enter__(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def run_main(python: str, url: str, cache_path: Path, stream: bool, rescan: bool=False) -> Dict:
+    """Run the command line tool in a fresh output directory, and return its metrics"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (str(ROOT), env.get("PYTHONPATH"))))
+    env["CRG_CACHE"] = str(cache_path)
+    with tempfile.TemporaryDirectory(prefix="crg-benchmark-") as output_dir:
+        metrics_path = Path(output_dir) / "metrics.json"
+        command = [python, "-m", "conan_recipe_generator.main", "--url", url, "--metrics", str(metrics_path)]
+        if stream:
+            command.append("--stream")
+        if rescan:
+            command.append("--rescan")
+        subprocess.run(command, env=env, cwd=output_dir, check=True, stdout=subprocess.DEVNULL)
+        with metrics_path.open() as f:
+            return json.load(f)["phases"]
+
+
+def summarize(samples: List[Dict]) -> Dict:
+    """Median throughputs and times of the runs"""
+    def phase_value(phases, phase, key):
+        return phases.get(phase, {}).get(key, 0)
+
+    def throughput(phases, phase, key):
+        # No throughput when nothing was transferred, e.g. a download served from the cache
+        wall_time = phase_value(phases, phase, "wall_time")
+        value = phase_value(phases, phase, key)
+        return value / wall_time if wall_time and value else None
+
+    def median(values) -> Optional[float]:
+        values = [value for value in values if value is not None]
+        return statistics.median(values) if values else None
+
+    return {
+        "runs": len(samples),
+        "total_s": median(phase_value(phases, "total", "wall_time") for phases in samples),
+        "download_s": median(phase_value(phases, "download", "wall_time") for phases in samples),
+        "download_bytes_per_s": median(throughput(phases, "download", "bytes_read") for phases in samples),
+        "hash_s": median(phase_value(phases, "hash", "wall_time") for phases in samples),
+        "hash_bytes_per_s": median(throughput(phases, "hash", "bytes_read") for phases in samples),
+        "extract_s": median(phase_value(phases, "extract", "wall_time") + phase_value(phases, "stream", "wall_time") for phases in samples),
+        "extract_bytes_per_s": median(throughput(phases, "extract", "bytes_written") for phases in samples),
+        "render_s": median(phase_value(phases, "render", "wall_time") for phases in samples),
+        "phases": samples[-1],
+    }
+
+
+def format_rate(value: Optional[float]) -> str:
+    return "-" if value is None else "{:.1f} MiB/s".format(value / (1 << 20))
+
+
+def main(args=None):
+    parser = ArgumentParser(description="Measure the complete pipeline against archives served by a local http server")
+    parser.add_argument("--files", type=int, default=10000, help="Number of files of the archives (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed of the generated tree")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Comma separated archive formats (default: %(default)s)")
+    parser.add_argument("--stream", action="store_true", help="Detect while streaming the archive, instead of extracting it")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs of every scenario")
+    parser.add_argument("--python", default=sys.executable, help="Python interpreter to measure")
+    parser.add_argument("--fixtures", type=Path, default=DEFAULT_FIXTURE_DIR, help="Directory of the generated archives (default: %(default)s)")
+    parser.add_argument("--output", "-o", default=None, help="Write the results as json to this file")
+    ns = parser.parse_args(args)
+
+    suffixes = ns.formats.split(",")
+    for suffix in suffixes:
+        if suffix not in FORMATS:
+            parser.error("unknown format '{}', choose from {}".format(suffix, ", ".join(FORMATS)))
+
+    results = {
+        "python": ns.python,
+        "files": ns.files,
+        "seed": ns.seed,
+        "stream": ns.stream,
+        "scenarios": {},
+    }
+    fixture_paths = {suffix: make_fixture(ns.fixtures, ns.files, ns.seed, suffix) for suffix in suffixes}
+    with FixtureServer(ns.fixtures / "{}-{}".format(ns.files, ns.seed)) as server:
+        for suffix, fixture_path in fixture_paths.items():
+            url = server.url(fixture_path.name)
+            cold_samples = []
+            warm_samples = []
+            cached_samples = []
+            for _ in range(ns.runs):
+                # Cold: empty caches.
+                # Warm: the stored archive and the extracted tree are reused, the detection runs again (--rescan).
+                # Cached: the detection result is reused, nothing is downloaded or extracted.
+                with tempfile.TemporaryDirectory(prefix="crg-benchmark-cache-") as cache_path:
+                    cold_samples.append(run_main(ns.python, url, Path(cache_path), ns.stream))
+                    warm_samples.append(run_main(ns.python, url, Path(cache_path), ns.stream, rescan=True))
+                    cached_samples.append(run_main(ns.python, url, Path(cache_path), ns.stream))
+            for cache_state, samples in (("cold", cold_samples), ("warm", warm_samples), ("cached", cached_samples)):
+                name = "{}-{}".format(suffix.lstrip("."), cache_state)
+                result = summarize(samples)
+                result["archive_bytes"] = fixture_path.stat().st_size
+                results["scenarios"][name] = result
+                print("{:<14} total {:7.3f} s, download {}, hash {}, extract {}, render {:6.1f} ms".format(
+                    name, result["total_s"], format_rate(result["download_bytes_per_s"]), format_rate(result["hash_bytes_per_s"]),
+                    format_rate(result["extract_bytes_per_s"]), (result["render_s"] or 0) * 1000))
+
+    if ns.output:
+        with open(ns.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Measure the startup time of the conan-recipe-generator command line
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from argparse import ArgumentParser
+import json
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Startup time targets: milliseconds above the startup of the bare interpreter (median of the runs)
+TARGETS_MS = {
+    "help": 50,
+    "import_main": 40,
+}
+
+COMMANDS = {
+    "help": ["-m", "conan_recipe_generator.main", "--help"],
+    "import_main": ["-c", "import conan_recipe_generator.main"],
+    "import_detector": ["-c", "import conan_recipe_generator.detect_properties"],
+    "import_generator": ["-c", "import conan_recipe_generator.template.create"],
+}
+
+
+def measure(python: str, command, runs: int):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (str(ROOT), env.get("PYTHONPATH"))))
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([python] + command, env=env, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+        "runs": runs,
+    }
+
+
+def main(args=None):
+    parser = ArgumentParser(description="Measure the startup time of the command line tool")
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs of every command")
+    parser.add_argument("--python", default=sys.executable, help="Python interpreter to measure")
+    parser.add_argument("--output", "-o", default=None, help="Write the results as json to this file")
+    parser.add_argument("--check", action="store_true", help="Exit with an error when a target is exceeded")
+    ns = parser.parse_args(args)
+
+    baseline = measure(ns.python, ["-c", "pass"], ns.runs)
+    results = {
+        "python": ns.python,
+        "baseline": baseline,
+        "commands": {},
+    }
+    failed = []
+    for name, command in COMMANDS.items():
+        result = measure(ns.python, command, ns.runs)
+        result["above_baseline_ms"] = result["median_ms"] - baseline["median_ms"]
+        target = TARGETS_MS.get(name)
+        if target is not None:
+            result["target_ms"] = target
+            if result["above_baseline_ms"] > target:
+                failed.append(name)
+        results["commands"][name] = result
+        print("{:<18} median {:7.1f} ms (+{:6.1f} ms above bare interpreter){}".format(
+            name, result["median_ms"], result["above_baseline_ms"],
+            "" if target is None else ", target +{} ms".format(target)))
+
+    if ns.output:
+        with open(ns.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if failed:
+        print("Startup time target exceeded: {}".format(", ".join(failed)), file=sys.stderr)
+        if ns.check:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
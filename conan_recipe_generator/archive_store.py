@@ -0,0 +1,129 @@
+# Content-addressed storage of downloaded source archives
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Dict, Optional, Tuple
+import urllib.parse
+
+from .fetch import Backoff, DownloadError, Downloader, DownloadSink
+from .locking import FileLock
+from .metrics import Metrics
+
+
+class ArchiveStore(object):
+    """
+    Archives are stored by their sha256 digest, so every archive is downloaded and hashed only once.
+    An index maps the url of every downloaded archive to its digest,
+    such that archives without known checksum are not downloaded again either.
+    Concurrent fetches of the same url wait for each other, instead of downloading the archive twice.
+    """
+    INDEX_NAME = "index.json"
+
+    def __init__(self, path: Path, backoff: Optional[Backoff]=None, metrics: Optional[Metrics]=None):
+        self._path = path
+        self._metrics = metrics or Metrics()
+        self._downloader = Downloader(backoff=backoff)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def object_path(self, digest: str, suffix: str) -> Path:
+        return self._path / digest[:2] / (digest + suffix)
+
+    def _lock_path(self, name: str) -> Path:
+        return self._path / "locks" / (name + ".lock")
+
+    def fetch(self, url: str, suffix: str, sha256: Optional[str]=None, tmp_dir: Optional[Path]=None) -> Tuple[Path, str]:
+        """
+        Return the path and the sha256 digest of the archive at url.
+        The archive is only downloaded when it is not yet present in the store.
+        Partial downloads are written to tmp_dir, which must be on the same file system as the store.
+        """
+        import asyncio
+        return asyncio.run(self.fetch_async(url, suffix, sha256, tmp_dir))
+
+    async def fetch_async(self, url: str, suffix: str, sha256: Optional[str]=None, tmp_dir: Optional[Path]=None) -> Tuple[Path, str]:
+        """Coroutine of fetch, such that many archives can be fetched at once"""
+        import asyncio
+        lock = FileLock(self._lock_path(hashlib.sha1(url.encode()).hexdigest()))
+        # Waiting for a concurrent fetch of the same url blocks, so it does not hold up the event loop
+        await asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+        try:
+            return await self._fetch(url, suffix, sha256, tmp_dir)
+        finally:
+            lock.release()
+
+    async def _fetch(self, url: str, suffix: str, sha256: Optional[str], tmp_dir: Optional[Path]) -> Tuple[Path, str]:
+        if sha256 is not None:
+            sha256 = sha256.lower()
+        # The digest of the index is only a lookup: the archive at url may have changed since it was downloaded
+        known = sha256 if sha256 is not None else self._read_index().get(url)
+        if known is not None:
+            archive_path = self.object_path(known, suffix)
+            if archive_path.exists():
+                return archive_path, known
+
+        digest, tmp_path = await self._download(url, tmp_dir or self._path / "tmp")
+        if sha256 is not None and digest != sha256:
+            tmp_path.unlink()
+            raise DownloadError("sha256 of '{}' is '{}', expected '{}'".format(url, digest, sha256))
+
+        archive_path = self.object_path(digest, suffix)
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(str(tmp_path), str(archive_path))
+        self._update_index(url, digest)
+        return archive_path, digest
+
+    async def _download(self, url: str, tmp_dir: Path) -> Tuple[str, Path]:
+        """
+        Download url to a temporary file, and return its digest and path.
+        The digest is calculated while downloading, so the archive is never read back.
+        """
+        if not urllib.parse.urlparse(url).scheme:
+            url = Path(url).resolve().as_uri()
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=str(tmp_dir), suffix=".part")
+        tmp_path = Path(tmp_name)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                sink = DownloadSink(f, metrics=self._metrics)
+                await self._downloader.download_async(url, sink)
+            return sink.hexdigest(), tmp_path
+        except BaseException:
+            tmp_path.unlink()
+            raise
+
+    def _read_index(self) -> Dict[str, str]:
+        try:
+            with (self._path / self.INDEX_NAME).open() as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def _update_index(self, url: str, digest: str) -> None:
+        with FileLock(self._lock_path("index")):
+            index = self._read_index()
+            index[url] = digest
+            fd, tmp_name = tempfile.mkstemp(dir=str(self._path), suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f, indent=1, sort_keys=True)
+            os.replace(tmp_name, str(self._path / self.INDEX_NAME))
@@ -0,0 +1,159 @@
+# Generate recipes for many source archives using a pool of worker processes
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor
+import dataclasses
+from pathlib import Path
+import sys
+from typing import Callable, Dict, Iterable, List, Optional, TextIO
+
+from .archive_store import ArchiveStore
+from .detect_properties import DetectorOptions, url_archive_extension
+from .metrics import Metrics
+from .pipeline import generate_recipe
+from .properties import ConanRecipeProperties
+from .template.create import ConanRecipeGenerator
+from .workspace import JobWorkspace
+
+
+@dataclasses.dataclass(frozen=True)
+class BatchEntry(object):
+    url: str
+    sha256: Optional[str] = None
+
+
+@dataclasses.dataclass(frozen=True)
+class BatchResult(object):
+    entry: BatchEntry
+    target_path: Optional[Path] = None
+    error: Optional[str] = None
+    # Detected properties, for jobs that only detect
+    properties: Optional[ConanRecipeProperties] = None
+    # Metrics of the job, as returned by Metrics.to_dict (so results can be pickled cheaply)
+    metrics: Dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+def read_manifest(stream: TextIO) -> List[BatchEntry]:
+    """
+    Read a manifest of source archives.
+    Every line contains an url, optionally followed by its sha256 checksum.
+    Empty lines and lines starting with '#' are ignored.
+    """
+    entries = []
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split()
+        if len(fields) > 2:
+            raise ValueError("manifest line {}: expected 'URL [SHA256]', got '{}'".format(lineno, line))
+        entries.append(BatchEntry(url=fields[0], sha256=fields[1] if len(fields) > 1 else None))
+    return entries
+
+
+# Every worker process creates its generator (and its jinja2 environment) once, and reuses it for all its jobs.
+_worker_generator: Optional[ConanRecipeGenerator] = None
+
+
+def _init_worker(bytecode_cache_path: Path) -> None:
+    global _worker_generator
+    _worker_generator = ConanRecipeGenerator(bytecode_cache_path=bytecode_cache_path)
+
+
+def _error_message(e: Exception) -> str:
+    return "{}: {}".format(type(e).__name__, e)
+
+
+def _run_job(entry: BatchEntry, workpath: Path, options: Optional[DetectorOptions]) -> BatchResult:
+    metrics = Metrics()
+    try:
+        target_path = generate_recipe(_worker_generator, workpath=workpath, download_url=entry.url, download_sha256=entry.sha256, options=options, metrics=metrics)
+        return BatchResult(entry=entry, target_path=target_path, metrics=metrics.to_dict())
+    except Exception as e:
+        return BatchResult(entry=entry, error=_error_message(e), metrics=metrics.to_dict())
+
+
+async def _prefetch(store: ArchiveStore, entry: BatchEntry, workpath: Path) -> None:
+    if url_archive_extension(entry.url) is None:
+        # Not an archive: the job reports the error
+        return
+    with JobWorkspace(workpath) as workspace:
+        await store.fetch_async(entry.url, suffix=url_archive_extension(entry.url), sha256=entry.sha256, tmp_dir=workspace.path)
+
+
+BatchJob = Callable[[BatchEntry, Path, Optional[DetectorOptions]], BatchResult]
+
+
+async def _run_entries(entries: List[BatchEntry], workpath: Path, options: Optional[DetectorOptions], executor: Executor, downloads: int, job: BatchJob=_run_job) -> List[BatchResult]:
+    """
+    Download the archives concurrently in this process, and start the job of an entry as soon as its archive is stored.
+    The jobs find the archive in the archive store, so downloads and detections overlap.
+    job runs in the executor, so it must be a module level function.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(downloads)
+
+    async def run(entry: BatchEntry) -> BatchResult:
+        metrics = Metrics()
+        store = ArchiveStore(workpath / "archives", metrics=metrics)
+        try:
+            async with semaphore:
+                with metrics.phase("download"):
+                    await _prefetch(store, entry, workpath)
+        except Exception as e:
+            return BatchResult(entry=entry, error=_error_message(e), metrics=metrics.to_dict())
+        try:
+            result = await loop.run_in_executor(executor, job, entry, workpath, options)
+        except Exception as e:
+            # e.g. a worker process that got killed
+            return BatchResult(entry=entry, error=_error_message(e), metrics=metrics.to_dict())
+        metrics.merge(Metrics.from_dict(result.metrics))
+        return dataclasses.replace(result, metrics=metrics.to_dict())
+
+    return await asyncio.gather(*(run(entry) for entry in entries))
+
+
+def run_batch(entries: Iterable[BatchEntry], workpath: Path, jobs: Optional[int]=None, options: Optional[DetectorOptions]=None, downloads: int=4) -> List[BatchResult]:
+    entries = list(entries)
+    bytecode_cache_path = workpath / "templates"
+    # Compile the templates once, instead of in every worker
+    ConanRecipeGenerator(bytecode_cache_path=bytecode_cache_path).precompile()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(bytecode_cache_path, )) as executor:
+        return asyncio.run(_run_entries(entries, workpath, options, executor, downloads))
+
+
+def merge_metrics(results: Iterable[BatchResult]) -> Metrics:
+    """Sum the metrics of all jobs"""
+    total = Metrics()
+    for result in results:
+        total.merge(Metrics.from_dict(result.metrics))
+    return total
+
+
+def print_summary(results: Iterable[BatchResult], file: TextIO=sys.stdout) -> None:
+    results = list(results)
+    nb_failed = sum(1 for result in results if not result.success)
+    print("Summary: {} succeeded, {} failed".format(len(results) - nb_failed, nb_failed), file=file)
+    for result in results:
+        if result.success:
+            print("  OK     {} -> '{}'".format(result.entry.url, result.target_path), file=file)
+        else:
+            print("  FAILED {}: {}".format(result.entry.url, result.error), file=file)
@@ -0,0 +1,257 @@
+# Tokenizer of CMake scripts
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import collections
+import re
+from typing import Dict, List, Optional
+
+from .scan_budget import check_deadline
+
+
+# Every pattern matches at a known position and has no ambiguous repetitions: the lexer runs in linear time
+# White space and line comments. Line comments must end at a newline, so nothing after it is found inside a comment by backtracking.
+_BLANK = r"[ \t\r\n]*(?:\#(?!\[=*\[)[^\n]*(?![^\n])[ \t\r\n]*)*"
+_BLANK_RE = re.compile(_BLANK)
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_COMMAND_OPEN_RE = re.compile(r"[ \t]*\(")
+# A command without nested parentheses, comments or bracket arguments, after white space and line comments.
+# Loops are unrolled: runs of plain characters are matched at once, and every alternative starts with a distinct character.
+_SIMPLE_COMMAND_RE = re.compile(_BLANK + r"""
+    ([A-Za-z_][A-Za-z0-9_]*)([ \t]*\()
+    [^()"\#\[\\]*(?:(?:"[^"\\]*(?:\\.[^"\\]*)*"|\\.)[^()"\#\[\\]*)*\)""", flags=re.DOTALL | re.VERBOSE)
+_BRACKET_OPEN_RE = re.compile(r"\[(=*)\[")
+_ESCAPE_RE = re.compile(r"\\(\n|.)", flags=re.DOTALL)
+
+_ESCAPES = {
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    # Escaped newlines continue quoted arguments on the next line
+    "\n": "",
+}
+
+
+def _unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)), text)
+
+
+def _skip_bracket(content: str, pos: int, equals: str) -> int:
+    """Return the position after the bracket closing at or after pos (or the end of content, if it is not closed)"""
+    end = content.find("]{}]".format(equals), pos)
+    if end < 0:
+        return len(content)
+    return end + len(equals) + 2
+
+
+def _skip_comment(content: str, pos: int) -> int:
+    """Skip the comment starting with the '#' at pos"""
+    m = _BRACKET_OPEN_RE.match(content, pos + 1)
+    if m:
+        return _skip_bracket(content, m.end(), m.group(1))
+    end = content.find("\n", pos)
+    return len(content) if end < 0 else end
+
+
+# One token of the arguments of a command, after optional white space
+_ARGUMENT_TOKEN_RE = re.compile(r'''[ \t\r\n]*(?:
+    (?P<quoted>"[^"\\]*(?:\\.[^"\\]*)*")
+    |(?P<unquoted>(?:[^ \t\r\n()\#"\\\[]|\\.|\[(?!=*\[))[^ \t\r\n()\#"\\\[]*(?:(?:\\.|\[(?!=*\[))[^ \t\r\n()\#"\\\[]*)*)
+    |(?P<open>\()
+    |(?P<close>\))
+    |(?P<bracket>\[(?P<equals>=*)\[)
+    |(?P<comment>\#))''', flags=re.DOTALL | re.VERBOSE)
+
+
+def _lex_arguments(content: str, pos: int, arguments: List[str]) -> int:
+    """
+    Append the arguments of the command with the opening parenthesis before pos,
+    return the position after its closing parenthesis, or -1 if the command is not closed.
+    Parentheses inside the arguments (e.g. of if()) are matched, but are not arguments themselves.
+    """
+    depth = 1
+    match = _ARGUMENT_TOKEN_RE.match
+    while True:
+        m = match(content, pos)
+        if not m:
+            # The end of the script, an unterminated quoted argument or a trailing backslash
+            return -1
+        kind = m.lastgroup
+        pos = m.end()
+        if kind == "unquoted":
+            arguments.append(_unescape(m.group("unquoted")))
+        elif kind == "quoted":
+            arguments.append(_unescape(m.group("quoted")[1:-1]))
+        elif kind == "close":
+            depth -= 1
+            if depth == 0:
+                return pos
+        elif kind == "open":
+            depth += 1
+        elif kind == "comment":
+            pos = _skip_comment(content, pos - 1)
+        else:
+            equals = m.group("equals")
+            end = content.find("]{}]".format(equals), pos)
+            if end < 0:
+                return -1
+            text = content[pos:end]
+            # A newline directly after the opening bracket is not part of the argument
+            arguments.append(text[1:] if text.startswith("\n") else text)
+            pos = end + len(equals) + 2
+
+
+# The characters between the tokens that matter for finding the end of the arguments of a command
+_PLAIN_RE = re.compile(r'[^()"#\[\\]*')
+_QUOTED_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', flags=re.DOTALL)
+
+
+def _skip_arguments(content: str, pos: int) -> int:
+    """Like _lex_arguments, without splitting the arguments"""
+    depth = 1
+    size = len(content)
+    tokens = 0
+    while True:
+        tokens += 1
+        if tokens % 4096 == 0:
+            check_deadline()
+        pos = _PLAIN_RE.match(content, pos).end()
+        if pos >= size:
+            return -1
+        c = content[pos]
+        if c == ")":
+            depth -= 1
+            pos += 1
+            if depth == 0:
+                return pos
+        elif c == "(":
+            depth += 1
+            pos += 1
+        elif c == '"':
+            m = _QUOTED_RE.match(content, pos)
+            if not m:
+                return -1
+            pos = m.end()
+        elif c == "#":
+            pos = _skip_comment(content, pos)
+        elif c == "\\":
+            pos += 2
+        else:
+            m = _BRACKET_OPEN_RE.match(content, pos)
+            if m:
+                end = content.find("]{}]".format(m.group(1)), m.end())
+                if end < 0:
+                    return -1
+                pos = end + len(m.group(1)) + 2
+            else:
+                pos += 1
+
+
+class CMakeCommand(object):
+    """
+    A command invocation: its name (lower case, as CMake commands are case insensitive), arguments and line.
+    The arguments are split when they are first accessed: most commands of a script are never looked at.
+    """
+    def __init__(self, name: str, line: int, content: str, start: int):
+        self.name = name
+        self.line = line
+        self._content: Optional[str] = content
+        self._start = start
+        self._arguments: Optional[List[str]] = None
+
+    @property
+    def arguments(self) -> List[str]:
+        if self._arguments is None:
+            self._arguments = []
+            _lex_arguments(self._content, self._start, self._arguments)
+            self._content = None
+        return self._arguments
+
+    def keyword_value(self, keyword: str) -> Optional[str]:
+        """Return the argument following keyword, e.g. keyword_value('VERSION') of project(foo VERSION 1.0)"""
+        arguments = self.arguments
+        try:
+            return arguments[arguments.index(keyword) + 1]
+        except (IndexError, ValueError):
+            return None
+
+    def __repr__(self) -> str:
+        return "CMakeCommand(name={!r}, arguments={!r}, line={})".format(self.name, self.arguments, self.line)
+
+
+def tokenize_cmake(content: str) -> List[CMakeCommand]:
+    """
+    Split a CMake script into its command invocations.
+    Comments (also bracket comments) are skipped, quoted and bracket arguments are unquoted, escape sequences are replaced.
+    Variable references are left as they are. An invalid script yields the commands before the error.
+    """
+    commands = []
+    pos = 0
+    line = 1
+    line_pos = 0
+    size = len(content)
+    simple_command = _SIMPLE_COMMAND_RE.match
+    while pos < size:
+        if len(commands) % 1024 == 1023:
+            check_deadline()
+        # Most commands are found by a single match
+        m = simple_command(content, pos)
+        if m:
+            line += content.count("\n", line_pos, m.start(1))
+            line_pos = m.start(1)
+            commands.append(CMakeCommand(m.group(1).lower(), line, content, m.end(2)))
+            pos = m.end()
+            continue
+        # Skip what the failed match skipped, so it is not scanned again
+        pos = _BLANK_RE.match(content, pos).end()
+        if pos >= size:
+            break
+        if content[pos] == "#":
+            # A bracket comment
+            pos = _skip_comment(content, pos)
+            continue
+        line += content.count("\n", line_pos, pos)
+        line_pos = pos
+        m = _IDENTIFIER_RE.match(content, pos)
+        if m:
+            m_open = _COMMAND_OPEN_RE.match(content, m.end())
+            if m_open:
+                pos = _skip_arguments(content, m_open.end())
+                if pos < 0:
+                    break
+                commands.append(CMakeCommand(m.group(0).lower(), line, content, m_open.end()))
+                continue
+        # Not a command: skip the rest of the line
+        end = content.find("\n", pos)
+        pos = size if end < 0 else end
+    return commands
+
+
+class CMakeCommandIndex(object):
+    """The commands of a CMake script, by name"""
+    def __init__(self, commands: List[CMakeCommand]):
+        self._commands: Dict[str, List[CMakeCommand]] = collections.defaultdict(list)
+        for command in commands:
+            self._commands[command.name].append(command)
+
+    @classmethod
+    def from_content(cls, content: str) -> "CMakeCommandIndex":
+        return cls(tokenize_cmake(content))
+
+    def commands(self, name: str) -> List[CMakeCommand]:
+        """Return the invocations of a command, in script order"""
+        return self._commands.get(name.lower(), [])
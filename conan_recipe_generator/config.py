@@ -18,7 +18,32 @@ import json
 import os
 from pathlib import Path
 import tempfile
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional, Union
+
+from .limits import ResourceLimits
+from .prune import PruneRules
+from .scan_budget import ScanBudget
+
+
+SIZE_SUFFIXES = {
+    "K": 1 << 10,
+    "M": 1 << 20,
+    "G": 1 << 30,
+    "T": 1 << 40,
+}
+
+
+def parse_size(size: Union[int, str]) -> int:
+    """Parse a size in bytes, optionally with a K, M, G or T suffix (e.g. '10G')"""
+    if isinstance(size, int):
+        return size
+    size = size.strip().upper()
+    if size.endswith("B"):
+        size = size[:-1]
+    factor = SIZE_SUFFIXES.get(size[-1:], 1)
+    if factor != 1:
+        size = size[:-1]
+    return int(float(size) * factor)
 
 
 class CrgConfig(object):
@@ -40,8 +65,75 @@ class CrgConfig(object):
             work = self.get_tempfolder() / "crg_work"
         return Path(work)
 
+    def get_extract_cache_quota(self) -> Optional[int]:
+        """Maximum size of the cache with extracted archives, None means no limit"""
+        quota = os.environ.get("CRG_EXTRACT_CACHE_QUOTA") or self._data.get("extract_cache_quota", "10G")
+        if quota in (None, "", "none"):
+            return None
+        return parse_size(quota)
+
+    def get_parse_jobs(self) -> Optional[int]:
+        """Number of threads parsing build scripts, None means the default of ThreadPoolExecutor"""
+        jobs = os.environ.get("CRG_PARSE_JOBS") or self._data.get("parse_jobs")
+        if not jobs:
+            return None
+        return int(jobs)
+
+    def get_scan_confidence(self) -> Optional[float]:
+        """Confidence at which the detector stops parsing build scripts (between 0 and 1), None means scan everything"""
+        confidence = os.environ.get("CRG_SCAN_CONFIDENCE") or self._data.get("scan_confidence")
+        if confidence in (None, "", "none"):
+            return None
+        return float(confidence)
+
+    def get_prune_rules(self) -> PruneRules:
+        """
+        The directories skipped while scanning: the built-in rules, with the patterns of CRG_PRUNE (separated by commas)
+        or the prune list of the configuration. Set prune_defaults to false to drop the built-in rules.
+        """
+        patterns = os.environ.get("CRG_PRUNE")
+        if patterns is not None:
+            patterns = patterns.split(",")
+        else:
+            patterns = self._data.get("prune", [])
+        return PruneRules.from_config(patterns, defaults=bool(self._data.get("prune_defaults", True)))
+
+    def get_scan_budget(self) -> ScanBudget:
+        """The bytes read and the time spent scanning a single build script, 'none' means no limit"""
+        default = ScanBudget()
+        max_bytes = os.environ.get("CRG_SCAN_MAX_BYTES") or self._data.get("scan_max_bytes", default.max_bytes)
+        max_seconds = os.environ.get("CRG_SCAN_MAX_SECONDS") or self._data.get("scan_max_seconds", default.max_seconds)
+        return ScanBudget(
+            max_bytes=None if max_bytes in (None, "", "none") else parse_size(max_bytes),
+            max_seconds=None if max_seconds in (None, "", "none") else float(max_seconds),
+        )
+
+    def get_resource_limits(self) -> ResourceLimits:
+        """The limits on the size of a release and the memory of its detection, 'none' means no limit"""
+        default = ResourceLimits()
+
+        def get(variable: str, key: str, default_value: object, parse: Callable[[object], object]) -> object:
+            value = os.environ.get(variable) or self._data.get(key, default_value)
+            if value in (None, "", "none"):
+                return None
+            return parse(value)
+
+        return ResourceLimits(
+            max_extracted_bytes=get("CRG_MAX_EXTRACTED_BYTES", "max_extracted_bytes", default.max_extracted_bytes, parse_size),
+            max_files=get("CRG_MAX_FILES", "max_files", default.max_files, int),
+            max_compression_ratio=get("CRG_MAX_COMPRESSION_RATIO", "max_compression_ratio", default.max_compression_ratio, float),
+            max_memory=get("CRG_MAX_MEMORY", "max_memory", default.max_memory, parse_size),
+        )
+
+    def get_external_decompressors(self) -> bool:
+        """Whether to decompress with external (parallel) decompressors such as pigz, or only with python"""
+        value = os.environ.get("CRG_EXTERNAL_DECOMPRESSORS") or self._data.get("external_decompressors", True)
+        if isinstance(value, str):
+            return value.lower() not in ("0", "false", "no", "off")
+        return bool(value)
+
     def get_config_variable(self, name: str, default: Optional[object]) -> object:
-        return self._config.get(name, default)
+        return self._data.get(name, default)
 
     def read_config_data(self, section: str) -> Optional[Dict]:
         try:
@@ -59,8 +151,23 @@ class CrgConfig(object):
     def default_home() -> Path:
         crg_home = os.environ.get("CRG_HOME")
         if crg_home is not None:
-            return Path(cfg_home)
+            return Path(crg_home)
         return (Path("~") / ".local" / "conan-recipe-generator").expanduser()
 
 
-GLOBAL_CONFIG = CrgConfig()
+_global_config: Optional[CrgConfig] = None
+
+
+def get_global_config() -> CrgConfig:
+    """Return the configuration, which is read on first use"""
+    global _global_config
+    if _global_config is None:
+        _global_config = CrgConfig()
+    return _global_config
+
+
+def __getattr__(name: str) -> object:
+    # GLOBAL_CONFIG is created lazily, such that importing this module does not read the configuration
+    if name == "GLOBAL_CONFIG":
+        return get_global_config()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,209 @@
+# Decompression and extraction of source archives, with parallel decompressors when available
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import dataclasses
+import os
+from pathlib import Path
+import posixpath
+import shutil
+import subprocess
+import tarfile
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+import zipfile
+
+from .limits import LimitGuard
+
+
+PIPE_BUFFER_SIZE = 1 << 20
+
+
+class DecompressError(Exception):
+    pass
+
+
+def _open_zstd(path: Path) -> BinaryIO:
+    try:
+        from compression import zstd
+        return zstd.open(str(path), "rb")
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise DecompressError("Cannot decompress '{}': install zstd, or the zstandard python package".format(path))
+    return zstandard.ZstdDecompressor().stream_reader(path.open("rb"), closefd=True)
+
+
+def _open_gzip(path: Path) -> BinaryIO:
+    import gzip
+    return gzip.open(str(path), "rb")
+
+
+def _open_bz2(path: Path) -> BinaryIO:
+    import bz2
+    return bz2.open(str(path), "rb")
+
+
+def _open_lzma(path: Path) -> BinaryIO:
+    import lzma
+    return lzma.open(str(path), "rb")
+
+
+@dataclasses.dataclass(frozen=True)
+class Codec(object):
+    """
+    A compression format of tarballs.
+    The external commands are tried in order (the parallel ones first), python_open is the fallback.
+    Every command writes the decompressed content of the file appended to its arguments to stdout.
+    """
+    name: str
+    suffixes: Tuple[str, ...]
+    commands: Tuple[Tuple[str, ...], ...]
+    python_open: Optional[Callable[[Path], BinaryIO]] = None
+
+
+CODECS = (
+    Codec("gzip", (".tar.gz", ".tgz"), (("pigz", "-dc"), ("gzip", "-dc")), _open_gzip),
+    Codec("bzip2", (".tar.bz2", ".tbz2"), (("lbzip2", "-dc"), ("pbzip2", "-dc"), ("bzip2", "-dc")), _open_bz2),
+    Codec("xz", (".tar.xz", ".txz"), (("xz", "-dc", "-T0"), ), _open_lzma),
+    Codec("zstd", (".tar.zst", ".tzst"), (("zstd", "-dc", "-q"), ), _open_zstd),
+    Codec("lzip", (".tar.lz", ), (("plzip", "-dc"), ("lzip", "-dc"))),
+)
+
+
+# All supported archive suffixes
+ARCHIVE_SUFFIXES = (".tar", ".zip", ) + tuple(suffix for codec in CODECS for suffix in codec.suffixes)
+
+
+def codec_for(filename: str) -> Optional[Codec]:
+    """Return the codec of a compressed tarball, None for other files (plain tar, zip)"""
+    for codec in CODECS:
+        if filename.endswith(codec.suffixes):
+            return codec
+    return None
+
+
+def _find_command(codec: Codec) -> Optional[Tuple[str, ...]]:
+    for command in codec.commands:
+        executable = shutil.which(command[0])
+        if executable:
+            return (executable, ) + command[1:]
+    return None
+
+
+@contextlib.contextmanager
+def _open_command(command: Tuple[str, ...], path: Path) -> Iterator[BinaryIO]:
+    process = subprocess.Popen(command + (str(path), ), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=PIPE_BUFFER_SIZE)
+    try:
+        yield process.stdout
+        # Drain the stream (e.g. the padding after the end of a tarball), so the decompressor does not die of a broken pipe
+        while process.stdout.read(PIPE_BUFFER_SIZE):
+            pass
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        process.stdout.close()
+    stderr = process.stderr.read()
+    process.stderr.close()
+    if process.wait() != 0:
+        raise DecompressError("'{}' failed to decompress '{}': {}".format(" ".join(command), path, stderr.decode(errors="replace").strip()))
+
+
+@contextlib.contextmanager
+def open_decompressed(path: Path, use_commands: bool=True) -> Iterator[BinaryIO]:
+    """
+    Open the decompressed content of a file as a stream, which only supports sequential reads.
+    Uncompressed files are opened as they are.
+    """
+    codec = codec_for(path.name)
+    if codec is None:
+        with path.open("rb") as f:
+            yield f
+        return
+    command = _find_command(codec) if use_commands else None
+    if command is not None:
+        with _open_command(command, path) as stream:
+            yield stream
+        return
+    if codec.python_open is None:
+        raise DecompressError("Cannot decompress '{}': install one of {}".format(path, ", ".join(candidate[0] for candidate in codec.commands)))
+    with codec.python_open(path) as stream:
+        yield stream
+
+
+@contextlib.contextmanager
+def open_tar_stream(archive_path: Path, use_commands: bool=True) -> Iterator[tarfile.TarFile]:
+    """
+    Open a (compressed) tarball in stream mode: the members must be visited in archive order.
+    The decompressed content is never seeked, so it can be read from the pipe of a decompressor.
+    """
+    # Tarballs without known suffix are decompressed by tarfile, if they are compressed at all
+    mode = "r|" if codec_for(archive_path.name) else "r|*"
+    with open_decompressed(archive_path, use_commands=use_commands) as stream:
+        with tarfile.open(fileobj=stream, mode=mode) as tar:
+            yield tar
+
+
+def _check_member_name(name: str) -> None:
+    normalized = posixpath.normpath(name)
+    if posixpath.isabs(normalized) or normalized == ".." or normalized.startswith("../"):
+        raise DecompressError("Archive member '{}' points outside the destination".format(name))
+
+
+def _safe_tar_members(tar: tarfile.TarFile, guard: Optional[LimitGuard]=None) -> Iterator[tarfile.TarInfo]:
+    for member in tar:
+        _check_member_name(member.name)
+        if guard is not None and member.isfile():
+            guard.add_file(member.size)
+        if member.issym():
+            # Symbolic links are relative to the directory of the link, hard links to the top of the archive
+            _check_member_name(posixpath.join(posixpath.dirname(member.name), member.linkname))
+        elif member.islnk():
+            _check_member_name(member.linkname)
+        if member.isdev():
+            continue
+        yield member
+
+
+def _extract_zip(archive_path: Path, destination: Path, guard: Optional[LimitGuard]=None) -> None:
+    with zipfile.ZipFile(str(archive_path)) as zip:
+        if guard is not None:
+            # The central directory lists all members: check them before extracting anything
+            for info in zip.infolist():
+                if not info.is_dir():
+                    guard.add_file(info.file_size)
+        for info in zip.infolist():
+            _check_member_name(info.filename)
+            extracted = zip.extract(info, str(destination))
+            # zipfile drops the permissions: restore the executable bits of scripts (such as configure)
+            mode = (info.external_attr >> 16) & 0o777
+            if mode and not info.is_dir():
+                os.chmod(extracted, mode)
+
+
+def extract_archive(archive_path: Path, destination: Path, use_commands: bool=True, guard: Optional[LimitGuard]=None) -> None:
+    """Extract a zip file or (compressed) tarball to destination, raise LimitExceeded when it breaks the limits of guard"""
+    destination.mkdir(parents=True, exist_ok=True)
+    if zipfile.is_zipfile(str(archive_path)):
+        _extract_zip(archive_path, destination, guard=guard)
+        return
+    with open_tar_stream(archive_path, use_commands=use_commands) as tar:
+        # Python versions with extraction filters check the members too
+        kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+        tar.extractall(str(destination), members=_safe_tar_members(tar, guard=guard), **kwargs)
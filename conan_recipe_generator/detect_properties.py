@@ -16,30 +16,34 @@
 
 import collections
 import dataclasses
+import enum
+import hashlib
 import itertools
-import os
 from pathlib import Path
 import urllib.parse
-import re
-import shlex
-import shutil
 import sys
-from typing import Dict, Iterable, List, Optional, Set
-
-import conans
-
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .archive_store import ArchiveStore
+from .config import get_global_config
+from .decompress import ARCHIVE_SUFFIXES, extract_archive
+from .detection_cache import DetectionCache
+from .detectors import DetectorRegistry, FileDetector, default_registry
+from .limits import LimitGuard, ResourceLimits
+from .metrics import Metrics
+from .parse_cache import ParseCache, content_digest
+from .prune import PruneRules
+from .scan_budget import ScanBudget, ScanTimeout
+from .script_parsers import ParsedScript
+from .source_tree import ArchiveSourceTree, DirectorySourceTree, GitSourceTree, SourceTree, resolve_git_commit
+from .tree_cache import CachedTree, ExtractedTreeCache
+from .workspace import JobWorkspace
 from .properties import AutotoolsReconfType, AutotoolsProperties, BuildSystemsProperties, CMakeProperties, ConanRecipeProperties, DefaultPackageProperties, MesonProperties, MsbuildProperties, PackageProperties
 
 
 
-KNOWN_ARCHIVE_EXTS = [
-    ".tar",
-    ".tar.bz2",
-    ".tar.gz",
-    ".tar.xz",
-    ".tgz",
-    ".zip",
-]
+KNOWN_ARCHIVE_EXTS = sorted(ARCHIVE_SUFFIXES)
 
 
 @dataclasses.dataclass(frozen=True)
@@ -56,20 +60,69 @@ class DetectedText(object):
             return 0
 
 
-def extract_basename(filename: str) -> Optional[str]:
+def archive_extension(filename: str) -> Optional[str]:
     for known_ext in KNOWN_ARCHIVE_EXTS:
         if filename[-len(known_ext):] == known_ext:
-            return filename[:-len(known_ext)]
+            return known_ext
+    return None
+
+
+def url_archive_extension(url: str) -> Optional[str]:
+    return archive_extension(Path(urllib.parse.urlparse(url).path).name)
+
+
+def extract_basename(filename: str) -> Optional[str]:
+    known_ext = archive_extension(filename)
+    if known_ext:
+        return filename[:-len(known_ext)]
     return None
 
 
+# Bump when a change of the detector changes its results, such that cached detections are not reused
+DETECTOR_VERSION = 8
+
+
+@dataclasses.dataclass(frozen=True)
+class DetectorOptions(object):
+    extract: bool = True
+    parse_jobs: Optional[int] = None
+    use_detection_cache: bool = True
+    # Stop parsing build scripts once the confidence of the detection reaches this value, None scans everything
+    confidence: Optional[float] = None
+    prune_rules: PruneRules = PruneRules()
+    # Limits on the bytes read and the time spent parsing a single file
+    budget: ScanBudget = ScanBudget()
+    # Limits on the size of a release and the memory of the detector, breaking them is an error (not part of the detection key)
+    limits: ResourceLimits = ResourceLimits()
+
+    def detection_key(self) -> str:
+        """The part of the detection cache key for the options that change the detection results"""
+        key = ""
+        if self.confidence is not None:
+            key += "-c{}".format(self.confidence)
+        if self.prune_rules != PruneRules():
+            key += "-p{}".format(self.prune_rules.key())
+        if self.budget != ScanBudget():
+            key += "-b{}".format(self.budget.key())
+        return key
+
+
 class ConanPackageDetector(object):
-    def __init__(self, workpath: Path, download_url: str, download_sha256: Optional[str]):
+    """
+    Detect the properties of a source release.
+    The caches below workpath can be shared by concurrently running detectors,
+    every detector uses its own job workspace for temporary files.
+    A detector holds on to the extracted tree until it is closed.
+    """
+    BUILD_SYSTEM_CLASSES = {cls.NAME(): cls for cls in (AutotoolsProperties, CMakeProperties, MesonProperties, MsbuildProperties)}
+
+    def __init__(self, workpath: Path, download_url: str, download_sha256: Optional[str], options: Optional[DetectorOptions]=None, metrics: Optional[Metrics]=None, registry: Optional[DetectorRegistry]=None):
         self.detected_names: Set[DetectedText] = set()
         self.detected_versions: Set[DetectedText] = set()
         self.detected_homepages: Set[DetectedText] = set()
         self.detected_descriptions: Set[DetectedText] = set()
         self.detected_licenses: List[Path] = list()
+        self.detected_license_digests: Dict[Path, str] = dict()
         self.detected_cpp = False
 
         self.detected_autotools: List[AutotoolsProperties] = list()
@@ -78,11 +131,39 @@ class ConanPackageDetector(object):
         self.detected_msbuild: List[MsbuildProperties] = list()
 
         self._workpath = workpath
-        self._extract_path = workpath / "extract"
         self._download_url = download_url
         self._download_sha256 = download_sha256
-
-        self._extracted_path: Optional[Path] = None
+        self._options = options or DetectorOptions()
+        self.metrics = metrics or Metrics()
+        self._registry = registry or default_registry()
+
+        # Sub-directories, included by cmake and meson scripts
+        self._subdirectories: Dict[object, List[Path]] = dict()
+        self._autotools_per_dir: Dict[Path, AutotoolsProperties] = dict()
+
+        self._root_name: Optional[str] = None
+        self._source_tree: Optional[SourceTree] = None
+        self._workspace: Optional[JobWorkspace] = None
+        self._cached_tree: Optional[CachedTree] = None
+        self._guard = LimitGuard(self._options.limits, download_url)
+        self._parse_cache: Optional[ParseCache] = None
+
+    def close(self) -> None:
+        if self._parse_cache:
+            self._parse_cache.close()
+            self._parse_cache = None
+        if self._cached_tree:
+            self._cached_tree.release()
+            self._cached_tree = None
+        if self._workspace:
+            self._workspace.close()
+            self._workspace = None
+
+    def __enter__(self) -> "ConanPackageDetector":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
 
     def detect_name_version(self, path: Path):
         for split in ("-", "_"):
@@ -94,30 +175,39 @@ class ConanPackageDetector(object):
             except ValueError:
                 pass
 
-    def _download_extract(self):
-        url_components = urllib.parse.urlparse(self._download_url)
-        filename = Path(url_components.path).name
-
-        archive_path = self._workpath / filename
-
-        if self._download_sha256 is None:
-            try:
-                os.unlink(str(archive_path))
-            except FileNotFoundError:
-                pass
-        if not archive_path.exists() or conans.tools.sha256sum(str(archive_path)) != self._download_sha256:
-            conans.tools.download(url=self._download_url, filename=str(archive_path), sha256=self._download_sha256, retry=5, retry_wait=5)
-
-        self._download_sha256 = conans.tools.sha256sum(str(archive_path))
+    def _download(self) -> Path:
+        archive_store = ArchiveStore(self._workpath / "archives", metrics=self.metrics)
+        archive_path, self._download_sha256 = archive_store.fetch(self._download_url, suffix=url_archive_extension(self._download_url), sha256=self._download_sha256, tmp_dir=self._workspace.path)
         print("sha256 of '{}' is '{}'".format(self._download_url, self._download_sha256))
+        return archive_path
+
+    def _extract_archive(self, archive_path: Path) -> SourceTree:
+        use_commands = get_global_config().get_external_decompressors()
+        tree_cache = ExtractedTreeCache(self._workpath / "extracted", quota=get_global_config().get_extract_cache_quota())
+        self._guard = LimitGuard(self._options.limits, self._download_url, archive_size=archive_path.stat().st_size)
+        with self.metrics.phase("extract") as phase:
+            self._cached_tree = tree_cache.open(self._download_sha256, lambda path: extract_archive(archive_path, path, use_commands=use_commands, guard=self._guard), tmp_dir=self._workspace.path)
+            if self._cached_tree.extracted:
+                phase.bytes_read += archive_path.stat().st_size
+                phase.bytes_written += self._cached_tree.size
+        if self._cached_tree.extracted:
+            print("Extracted archive to '{}'".format(self._cached_tree.path))
+        else:
+            print("Using extracted archive at '{}'".format(self._cached_tree.path))
 
-        try:
-            shutil.rmtree(self._extract_path)
-        except FileNotFoundError:
-            pass
-        self._extract_path.mkdir()
-        conans.tools.unzip(filename=str(archive_path), destination=str(self._extract_path))
-        print("Extracted archive to '{}'".format(self._extract_path))
+        extracted_paths = tuple(self._cached_tree.path.iterdir())
+        if len(extracted_paths) != 1:
+            raise Exception("Don't know how to handle archives (yet) that extract more than one file")
+        return DirectorySourceTree(extracted_paths[0], prune_rules=self._options.prune_rules)
+
+    def _stream_archive(self, archive_path: Path) -> SourceTree:
+        self._guard = LimitGuard(self._options.limits, self._download_url, archive_size=archive_path.stat().st_size)
+        with self.metrics.phase("stream") as phase:
+            source_tree = ArchiveSourceTree(archive_path, wants_content=self.wants_content, use_commands=get_global_config().get_external_decompressors(), prune_rules=self._options.prune_rules, content_limit=self.content_limit, guard=self._guard)
+            phase.bytes_read += archive_path.stat().st_size
+            phase.files += source_tree.inventory.file_count
+        print("Streamed archive '{}'".format(archive_path))
+        return source_tree
 
     def detect_pre_download(self):
         basename = extract_basename(self._download_url)
@@ -127,110 +217,314 @@ class ConanPackageDetector(object):
 
     def detect(self):
         self.detect_pre_download()
-        self._download_extract()
+        self._workspace = JobWorkspace(self._workpath)
+        with self.metrics.phase("download"):
+            archive_path = self._download()
 
-        extracted_paths = tuple(self._extract_path.iterdir())
-        if len(extracted_paths) != 1:
-            raise Exception("Don't know how to handle archives (yet) that extract more than one file")
-        self._extracted_path = extracted_paths[0]
-
-        self.detect_name_version(self._extracted_path)
-
-        for root, dirs, files in os.walk(str(self._extracted_path)):
-            root = Path(root)
-            rel_root = self._make_extracted_path(root)
-            root_autotools = None
-            for file in files:
-                if file.lower() == "version":
-                    try:
-                        version = open(root / file).readline().strip()
-                        self.detected_versions.add(DetectedText(text=version, path=rel_root))
-                    except IOError:
-                        pass
-                if file == "CMakeLists.txt":
-                    cmake = CMakeProperties(path=rel_root)
-                    self._detect_cmake_script(cmake, root / file)
-                    self.detected_cmake.append(cmake)
-                if file in ("configure", "configure.ac", "configure.in", ):
-                    if not root_autotools:
-                        # autotools object is added at end of loop of current directory
-                        root_autotools = AutotoolsProperties(path=rel_root)
-                    self._detect_autoconfigure_script(root_autotools, root / file)
-                if "meson.build" in files:
-                    meson = MesonProperties(path=rel_root)
-                    self._detect_meson_script(meson, root / file)
-                    self.detected_meson.add(meson)
-                for known_license in self.KNOWN_LICENSES_PREFIX:
-                    if file.lower().startswith(known_license):
-                        self.detected_licenses.append(rel_root / file)
-                        break
-                file_suffix = Path(file).suffix
-                if file_suffix == ".C" or file_suffix.lower in (".cc", ".cpp", ".cxx", ):
-                    self.detected_cpp = True
-            if root_autotools:
-                self.detected_autotools.append(root_autotools)
-
-    def _make_extracted_path(self, path: Path) -> Path:
-        return path.relative_to(self._extracted_path)
-
-    KNOWN_LICENSES_PREFIX = [
-        "license",
-        "copying",
-        "copyright",
-    ]
-
-    def _detect_autoconfigure_script(self, autotools: AutotoolsProperties, scriptpath: Path):
-        filename = scriptpath.name
-        if filename in ("configure", ):
-            autotools.script = True
-        if filename in ("configure.ac", "configure.in", ):
-            content = scriptpath.read_text()
-
-            # Detect autotools type
-            if "LT_" in content:
-                autotools.autoreconf = AutotoolsReconfType.LIBTOOL
-            elif "AM_INIT_AUTOMAKE" in content:
-                autotools.autoreconf = AutotoolsReconfType.AUTOMAKE
-            else:
-                autotools.autoreconf = AutotoolsReconfType.AUTOCONF
-
-            # Extract name, version and url from AC_INIT
-            for m in re.finditer(r"AC_INIT[ \t]*\(\[?(?P<name>[a-zA-Z0-9-.]+)\]?[ \t]*,[ \t]?\[?(?P<version>[a-zA-Z0-9.-]+)\]?([ \t]*,[ \t]*\[(?P<bugreport>[a-zA-Z]+)\])?([ \t]*,[ \t]*\[(?P<tarname>[a-zA-Z]+)\])?([ \t]*,[ \t]*\[(?P<homepage>[a-zA-Z]+)\])?", content):
-                relpath = self._make_extracted_path(scriptpath.parent)
-                self.detected_names.add(DetectedText(text=m.group("name"), path=relpath, origin=autotools.tag))
-                self.detected_versions.add(DetectedText(text=m.group("version"), path=relpath, origin=autotools.tag))
-                if m.group("homepage"):
-                    self.detected_homepages.add(DetectedText(text=m.group("homepage"), path=relpath, origin=autotools.tag))
+        if self._options.extract:
+            self._detect_cached(lambda: self._extract_archive(archive_path))
+        else:
+            self._detect_cached(lambda: self._stream_archive(archive_path))
+
+    def _detect_cached(self, open_source_tree: Callable[[], SourceTree]) -> None:
+        """Restore the detection from the cache, or detect on the source tree and cache the result"""
+        detection_cache = DetectionCache(self._workpath / "detections")
+        if self._options.use_detection_cache:
+            with self.metrics.phase("detection_cache"):
+                record = detection_cache.load(self._detection_key())
+                cached = record is not None and self._from_record(record)
+            if cached:
+                print("Using cached detection of '{}'".format(self._detection_key()))
+                return
+
+        self._source_tree = open_source_tree()
+        self._detect_tree()
+        with self.metrics.phase("detection_cache"):
+            detection_cache.save(self._detection_key(), self._to_record())
+
+    def _detect_tree(self):
+        self._root_name = self._source_tree.name
+        self.detect_name_version(Path(self._root_name))
+
+        if self._options.confidence is None:
+            self._parse_merge(self._collect_candidates(self._source_tree.walk()))
+        else:
+            self._scan_breadth_first(self._options.confidence)
+
+        # Only the distinct suffixes need to be checked, not every file.
+        # Archives and git trees list the files of pruned directories too: they do not count.
+        for file_suffix in self._source_tree.suffixes():
+            if file_suffix == ".C" or file_suffix.lower() in (".cc", ".cpp", ".cxx", ):
+                self.detected_cpp = True
                 break
 
-    def _detect_cmake_script(self, cmake: CMakeProperties, scriptpath: Path):
-        content = scriptpath.read_text()
-        relpath = self._make_extracted_path(scriptpath.parent)
-        for m in re.finditer(r"project[ \t\n]*\(([^)]+)\)", content, flags=re.IGNORECASE):
+    def _collect_candidates(self, walk: Iterable[Tuple[Path, List[str]]], name_only: bool=False) -> List[Tuple[Path, FileDetector]]:
+        """
+        Collect the files of the walked directories to hand to their detectors, and record the license files.
+        With name_only, only the license files are recorded and collected.
+        """
+        candidates = []
+        lookup = self._registry.lookup
+        next_memory_check = 0
+        with self.metrics.phase("walk") as phase:
+            for rel_root, files in walk:
+                phase.files += len(files)
+                if phase.files >= next_memory_check:
+                    self._guard.check_memory()
+                    next_memory_check = phase.files + LimitGuard.MEMORY_SAMPLE_INTERVAL
+                for file in files:
+                    detectors = lookup(file)
+                    if not detectors:
+                        continue
+                    is_license = False
+                    for detector in detectors:
+                        if detector.kind == "license":
+                            is_license = True
+                        if not name_only or detector.kind == "license":
+                            candidates.append((rel_root / file, detector))
+                    if is_license:
+                        self.detected_licenses.append(rel_root / file)
+        return candidates
+
+    def _parse_merge(self, candidates: List[Tuple[Path, FileDetector]]) -> None:
+        # The parsers run concurrently, the results are merged in walk order, independent of the order in which the parsers finish
+        with self.metrics.phase("parse") as phase:
+            for index, ((path, detector), (parsed, nb_bytes, budget_hit, cache_hit)) in enumerate(zip(candidates, self._parse_candidates(candidates))):
+                if index % LimitGuard.MEMORY_SAMPLE_INTERVAL == 0:
+                    self._guard.check_memory()
+                phase.bytes_read += nb_bytes
+                if cache_hit:
+                    phase.cache_hits += 1
+                if budget_hit:
+                    phase.budget_hits += 1
+                    phase.budget_hit_files.append({"path": path.as_posix(), "reason": budget_hit})
+                if parsed is not None:
+                    phase.files += 1
+                    self._merge_parsed(path, detector, parsed)
+            if self._parse_cache:
+                self._parse_cache.flush()
+
+    def confidence(self) -> float:
+        """
+        Confidence in the detection so far, between 0 and 1.
+        Results from the top directory count: its name and version, and its build system.
+        """
+        score = 0.
+        if any(detected.path is not None and detected.depth == 0 for detected in self.detected_names):
+            score += .4
+        if any(detected.path is not None and detected.depth == 0 for detected in self.detected_versions):
+            score += .4
+        if any(not build_system.path.parts for build_system in itertools.chain(self.detected_autotools, self.detected_cmake, self.detected_meson)):
+            score += .2
+        return score
+
+    def _scan_breadth_first(self, threshold: float) -> None:
+        """
+        Scan the tree one depth at a time, and stop parsing once the confidence reaches threshold.
+        The deeper directories are then only scanned for license files.
+        """
+        name_only = False
+        for depth, level in itertools.groupby(self._source_tree.walk(breadth_first=True), key=lambda item: len(item[0].parts)):
+            candidates = self._collect_candidates(level, name_only=name_only)
+            self._parse_merge(candidates)
+            if not name_only:
+                if self.confidence() >= threshold:
+                    print("Detection is confident after scanning depth {}: only scanning for license files".format(depth))
+                    name_only = True
+
+    def wants_content(self, filename: str) -> bool:
+        """Return True if a detector reads the content of files with this name"""
+        return self._registry.wants_content(filename)
+
+    def content_limit(self, filename: str) -> Optional[int]:
+        """Return how many bytes of a file with this name are read, None for all of it"""
+        return self._options.budget.limit(self._registry.content_limit(filename))
+
+    def _parser_key(self, detector: FileDetector) -> str:
+        return "{}-v{}".format(detector.key(), DETECTOR_VERSION)
+
+    def _parse_candidates(self, candidates: List[Tuple[Path, FileDetector]]) -> Iterable[Tuple[Optional[ParsedScript], int, Optional[str], bool]]:
+        """
+        Parse the candidates, return the result, the number of bytes read, how the scan budget was exceeded (if it was)
+        and whether the result was cached, of every candidate. A parser that runs out of time has no result.
+        Results are cached by the digest of the scanned content: a file that is unchanged since an earlier release is not parsed again.
+        """
+        budget = self._options.budget
+        if any(detector.parser is not None for _, detector in candidates) and self._parse_cache is None:
+            self._parse_cache = ParseCache(self._workpath / "parses.sqlite")
+        parse_cache = self._parse_cache
+
+        def parse(candidate):
+            path, detector = candidate
+            if detector.parser is None:
+                return ParsedScript(), 0, None, False
+            budget_hit = None
+            size = self._source_tree.inventory.size(path)
+            # Only the budget counts: a detector that reads part of a file by design (max_bytes) does not exceed it
+            if budget.max_bytes is not None and size is not None and size > budget.max_bytes and (detector.max_bytes is None or detector.max_bytes > budget.max_bytes):
+                budget_hit = "only the first {} of {} bytes are scanned".format(budget.max_bytes, size)
+            parser_key = self._parser_key(detector)
+            start = time.monotonic()
             try:
-                project_args = shlex.split(m.group(1))
-            except ValueError:
+                with self._source_tree.open_buffer(path, budget.limit(detector.max_bytes)) as data:
+                    nb_bytes = len(data)
+                    digest = content_digest(data)
+                    if self._options.use_detection_cache:
+                        parsed = parse_cache.load(digest, parser_key)
+                        if parsed is not None:
+                            return parsed, nb_bytes, budget_hit, True
+                    with budget.deadline():
+                        # Binary parsers scan the buffer (a memory map of an extracted file) without a copy
+                        content = data if detector.binary else bytes(data).decode(errors="replace")
+                        parsed = detector.parse(content)
+            except IOError:
+                return None, 0, None, False
+            except ScanTimeout:
+                return None, 0, "the scan took more than {} seconds".format(budget.max_seconds), False
+            # Parsers that do not check the deadline run to completion: their results are kept
+            if budget.max_seconds is not None and time.monotonic() - start > budget.max_seconds:
+                budget_hit = "the scan took more than {} seconds".format(budget.max_seconds)
+            parse_cache.save(digest, parser_key, parsed)
+            return parsed, nb_bytes, budget_hit, False
+
+        if len(candidates) < 2 or self._options.parse_jobs == 1:
+            return map(parse, candidates)
+        # concurrent.futures imports logging, which is slow: only import it when needed
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self._options.parse_jobs) as executor:
+            return list(executor.map(parse, candidates))
+
+    def _merge_parsed(self, path: Path, detector: FileDetector, parsed: ParsedScript) -> None:
+        if detector.kind == "license":
+            if parsed.content_digest:
+                self.detected_license_digests[path] = parsed.content_digest
+            return
+        rel_root = path.parent
+        filename = path.name
+        # Texts found by the version file detector and by plugin detectors have no build system as origin
+        origin = None
+        if detector.kind == "cmake":
+            cmake = CMakeProperties(path=rel_root)
+            self.detected_cmake.append(cmake)
+            self._subdirectories[cmake.tag] = self._check_subdirectories(rel_root, parsed.subdirectories, filename)
+            origin = cmake.tag
+        elif detector.kind in ("autotools", "autotools_script", ):
+            # One autotools object per directory
+            autotools = self._autotools_per_dir.get(rel_root)
+            if autotools is None:
+                autotools = AutotoolsProperties(path=rel_root)
+                self._autotools_per_dir[rel_root] = autotools
+                self.detected_autotools.append(autotools)
+            if detector.kind == "autotools_script":
+                autotools.script = True
+            else:
+                autotools.autoreconf = parsed.autoreconf
+            origin = autotools.tag
+        elif detector.kind == "meson":
+            meson = MesonProperties(path=rel_root)
+            self.detected_meson.append(meson)
+            self._subdirectories[meson.tag] = self._check_subdirectories(rel_root, parsed.subdirectories, filename)
+            origin = meson.tag
+
+        self.detected_names.update(DetectedText(text=text, path=rel_root, origin=origin) for text in parsed.names)
+        self.detected_versions.update(DetectedText(text=text, path=rel_root, origin=origin) for text in parsed.versions)
+        self.detected_descriptions.update(DetectedText(text=text, path=rel_root, origin=origin) for text in parsed.descriptions)
+        self.detected_homepages.update(DetectedText(text=text, path=rel_root, origin=origin) for text in parsed.homepages)
+
+    def _check_subdirectories(self, rel_root: Path, subdirectories: List[str], filename: str) -> List[Path]:
+        subdirectory_paths = [Path(subdir) for subdir in subdirectories]
+        for subdirectory_path in subdirectory_paths:
+            # Scripts in pruned directories are not looked at, they count as existing
+            if self._options.prune_rules.is_pruned(rel_root / subdirectory_path):
                 continue
-            try:
-                name = project_args[0]
-                self.detected_names.add(DetectedText(name, path=relpath, origin=cmake.tag))
-            except IndexError:
-                pass
-            try:
-                version = project_args[project_args.index("VERSION") + 1]
-                self.detected_versions.add(DetectedText(version, path=relpath, origin=cmake.tag))
-            except (IndexError, ValueError):
-                pass
-            try:
-                description = project_args[project_args.index("DESCRIPTION") + 1]
-                self.detected_descriptions.add(DetectedText(description, path=relpath, origin=cmake.tag))
-            except (IndexError, ValueError):
-                pass
-            try:
-                homepage = project_args[project_args.index("HOMEPAGE_URL") + 1]
-                self.detected_homepages.add(DetectedText(homepage, path=relpath, origin=cmake.tag))
-            except (IndexError, ValueError):
-                pass
+            if not self._source_tree.exists(rel_root / subdirectory_path / filename):
+                print("script '{}' points to non-existing '{}' script".format(rel_root / filename, rel_root / subdirectory_path / filename), file=sys.stderr)
+        return subdirectory_paths
+
+    def _detection_key(self) -> str:
+        return "{}-v{}{}{}".format(self._download_sha256, DETECTOR_VERSION, self._options.detection_key(), self._registry.key())
+
+    def _to_record(self) -> Dict:
+        """
+        Serialize the detected properties.
+        Texts without path are derived from the url and the name of the top directory, so they are not stored.
+        """
+        taggables = list(itertools.chain(self.detected_autotools, self.detected_cmake, self.detected_meson, self.detected_msbuild))
+        tag_indices = {taggable.tag: index for index, taggable in enumerate(taggables)}
+
+        def build_system_record(taggable) -> Dict:
+            record = {"kind": taggable.NAME()}
+            for field in dataclasses.fields(taggable):
+                if field.name == "_tag":
+                    continue
+                value = getattr(taggable, field.name)
+                if isinstance(value, Path):
+                    value = value.as_posix()
+                elif isinstance(value, enum.Enum):
+                    value = value.value
+                record[field.name] = value
+            if taggable.tag in self._subdirectories:
+                record["subdirectories"] = [subdir.as_posix() for subdir in self._subdirectories[taggable.tag]]
+            return record
+
+        def texts_record(detecteds: Set[DetectedText]) -> List:
+            items = ([d.text, d.path.as_posix(), tag_indices.get(d.origin)] for d in detecteds if d.path is not None)
+            return sorted(items, key=lambda item: (item[0], item[1], -1 if item[2] is None else item[2]))
+
+        return {
+            "detector_version": DETECTOR_VERSION,
+            "root_name": self._root_name,
+            "cpp": self.detected_cpp,
+            "licenses": [license.as_posix() for license in self.detected_licenses],
+            "license_digests": {license.as_posix(): digest for license, digest in self.detected_license_digests.items()},
+            "build_systems": [build_system_record(taggable) for taggable in taggables],
+            "names": texts_record(self.detected_names),
+            "versions": texts_record(self.detected_versions),
+            "descriptions": texts_record(self.detected_descriptions),
+            "homepages": texts_record(self.detected_homepages),
+        }
+
+    def _from_record(self, record: Dict) -> bool:
+        """Restore the detected properties from a record, return False if the record is invalid"""
+        if record.get("detector_version") != DETECTOR_VERSION:
+            return False
+        try:
+            taggables = []
+            for build_system in record["build_systems"]:
+                build_system = dict(build_system)
+                cls = self.BUILD_SYSTEM_CLASSES[build_system.pop("kind")]
+                subdirectories = build_system.pop("subdirectories", None)
+                build_system["path"] = Path(build_system["path"])
+                if build_system.get("autoreconf") is not None:
+                    build_system["autoreconf"] = AutotoolsReconfType(build_system["autoreconf"])
+                taggable = cls(**build_system)
+                if subdirectories is not None:
+                    self._subdirectories[taggable.tag] = [Path(subdir) for subdir in subdirectories]
+                taggables.append(taggable)
+
+            def texts(items) -> Set[DetectedText]:
+                return set(DetectedText(text=text, path=Path(path), origin=taggables[origin].tag if origin is not None else None) for text, path, origin in items)
+
+            self.detected_names.update(texts(record["names"]))
+            self.detected_versions.update(texts(record["versions"]))
+            self.detected_descriptions.update(texts(record["descriptions"]))
+            self.detected_homepages.update(texts(record["homepages"]))
+            self.detected_licenses.extend(Path(license) for license in record["licenses"])
+            self.detected_license_digests.update((Path(license), digest) for license, digest in record["license_digests"].items())
+            self.detected_cpp = bool(record["cpp"])
+            self._root_name = record["root_name"]
+        except (KeyError, IndexError, TypeError, ValueError):
+            return False
+
+        for taggable in taggables:
+            {
+                AutotoolsProperties: self.detected_autotools,
+                CMakeProperties: self.detected_cmake,
+                MesonProperties: self.detected_meson,
+                MsbuildProperties: self.detected_msbuild,
+            }[type(taggable)].append(taggable)
+        self.detect_name_version(Path(self._root_name))
+        return True
 
     def lookup_tag(self, tag) -> Optional[object]:
         for taggable in itertools.chain(self.detected_autotools, self.detected_cmake, self.detected_meson, self.detected_msbuild):
@@ -238,11 +532,6 @@ class ConanPackageDetector(object):
                 return taggable
         return None
 
-    def _detect_meson_script(self, meson: MesonProperties, scriptpath: Path):
-        # content = scriptpath.read_text()
-        # relpath = self._make_extracted_path(scriptpath.parent)
-        return
-
     def properties(self, url: str, default_packages: DefaultPackageProperties) -> ConanRecipeProperties:
         name = self._select_first(self.detected_names) or "UNKNOWN_NAME"
         version = self._select_first(self.detected_versions) or "UNKNOWN_VERSION"
@@ -278,7 +567,8 @@ class ConanPackageDetector(object):
             package=PackageProperties(
                 build_context=bool(autotools or meson),
                 license_paths=license_paths,
-                glob_rename=self._extracted_path.name != "{}-{}".format(name, version),
+                license_digests={license.as_posix(): digest for license, digest in self.detected_license_digests.items()},
+                glob_rename=self._root_name != "{}-{}".format(name, version),
                 with_cxx=self.detected_cpp,
             ),
         )
@@ -299,6 +589,8 @@ class ConanPackageDetector(object):
 
         # Order the detected for each text
         def _sort_detected_importance(detecteds: List[DetectedText]):
+            # Sort on text and path first, so ties do not depend on the iteration order of the set
+            detecteds.sort(key=lambda d: (d.text, d.path.as_posix() if d.path else ""))
             # 1st sort on depth
             detecteds.sort(key=lambda d: d.depth)
             # 2nd sort on presence tag
@@ -314,19 +606,8 @@ class ConanPackageDetector(object):
     def _compress_cmake(self) -> List[CMakeProperties]:
         cmake_included_paths = set()
         for cmake in self.detected_cmake:
-            cmake_abs_path = self._extracted_path / cmake.path / "CMakeLists.txt"
-            cmake_text = cmake_abs_path.read_text()
-            for m in re.finditer(r"add_subdirectory\(([a-z0-9_ ]+)\)", cmake_text, flags=re.IGNORECASE):
-                as_args = shlex.split(m.group(1))
-                try:
-                    subcmake_relpath = Path(as_args[0])
-                except IndexError:
-                    continue
-                subcmake_path = cmake.path / subcmake_relpath
-                subcmake_abs_path = cmake_abs_path / subcmake_relpath
-                if not subcmake_abs_path.exists():
-                    print("cmake script '{}' points to non-existing '{}' cmake script".format(cmake.path, cmake.path / subcmake_path), file=sys.stderr)
-                cmake_included_paths.add(subcmake_path)
+            for subcmake_relpath in self._subdirectories[cmake.tag]:
+                cmake_included_paths.add(cmake.path / subcmake_relpath)
 
         cmake_reduced = list(cmake for cmake in self.detected_cmake if cmake.path not in cmake_included_paths)
         cmake_reduced.sort(key=lambda c: len(c.path.parts), reverse=True)
@@ -335,19 +616,8 @@ class ConanPackageDetector(object):
     def _compress_meson(self) -> List[MesonProperties]:
         meson_included_paths = set()
         for meson in self.detected_meson:
-            meson_abs_path = self._extract_path / meson.path / "meson.build"
-            meson_text = meson_abs_path.read_text()
-            for m in re.finditer(r"subdir[ \t\n]*\([ \t\n]*['\"]([^'\"]+)", meson_text):
-                subdir_args = shlex.split(m.group(1))
-                try:
-                    submeson_relpath = Path(subdir_args[0])
-                except IndexError:
-                    continue
-                submeson_path = meson.path / submeson_relpath
-                submeson_abs_path = meson_abs_path / submeson_relpath
-                if not submeson_abs_path.exists():
-                    print("meson script '{}' points to non-existing '{}' meson script".format(meson.path, meson.path / submeson_path), file=sys.stderr)
-                meson_included_paths.add(submeson_path)
+            for submeson_relpath in self._subdirectories[meson.tag]:
+                meson_included_paths.add(meson.path / submeson_relpath)
 
         meson_reduced = list(meson for meson in self.detected_meson if meson.path not in meson_included_paths)
         meson_reduced.sort(key=lambda c: len(c.path.parts), reverse=True)
@@ -357,3 +627,43 @@ class ConanPackageDetector(object):
         autotools = list(self.detected_autotools)
         autotools.sort(key=lambda x: len(x.path.parts))
         return autotools
+
+
+class GitPackageDetector(ConanPackageDetector):
+    """
+    Detect the properties of a ref (usually a release tag) of a local git repository.
+    The tree entries and build scripts are read from the object database: nothing is checked out.
+    There is no source archive, so the recipe gets placeholders for its url and checksum.
+    """
+    def __init__(self, workpath: Path, repository: Path, ref: str, options: Optional[DetectorOptions]=None, metrics: Optional[Metrics]=None, registry: Optional[DetectorRegistry]=None):
+        super().__init__(workpath=workpath, download_url="UNKNOWN_DOWNLOAD_URL", download_sha256="UNKNOWN_SHA256", options=options, metrics=metrics, registry=registry)
+        self._repository = repository
+        self._ref = ref
+        self._commit: Optional[str] = None
+
+    def _tree_name(self) -> str:
+        """Name of the top directory of a release archive of the ref, e.g. 'foo-1.2.3' for tag 'v1.2.3' of repository 'foo'"""
+        repository_name = self._repository.resolve().name
+        if repository_name.endswith(".git"):
+            repository_name = repository_name[:-len(".git")]
+        version = self._ref.rpartition("/")[2]
+        if version[:1] in "vV" and version[1:2].isdigit():
+            version = version[1:]
+        return "{}-{}".format(repository_name, version)
+
+    def _read_git_tree(self) -> SourceTree:
+        with self.metrics.phase("git") as phase:
+            self._guard = LimitGuard(self._options.limits, "{}@{}".format(self._repository, self._ref))
+            source_tree = GitSourceTree(self._repository, self._commit, name=self._tree_name(), wants_content=self.wants_content, prune_rules=self._options.prune_rules, content_limit=self.content_limit, guard=self._guard)
+            phase.files += source_tree.inventory.file_count
+        print("Read tree of '{}' ({}) from '{}'".format(self._ref, self._commit, self._repository))
+        return source_tree
+
+    def detect(self):
+        self._commit = resolve_git_commit(self._repository, self._ref)
+        self._detect_cached(self._read_git_tree)
+
+    def _detection_key(self) -> str:
+        # The record stores the name of the top directory, which depends on the repository and ref, not only on the commit
+        tree_key = hashlib.sha1(self._tree_name().encode()).hexdigest()[:8]
+        return "git-{}-{}-v{}{}{}".format(self._commit, tree_key, DETECTOR_VERSION, self._options.detection_key(), self._registry.key())
@@ -0,0 +1,49 @@
+# Persistent cache of detection results
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Dict, Optional
+
+
+class DetectionCache(object):
+    """
+    Detection results, stored as json by a key of the archive digest and the detector version.
+    Records are written atomically, so concurrent writers of the same key do not need a lock.
+    """
+    def __init__(self, path: Path):
+        self._path = path
+
+    def _record_path(self, key: str) -> Path:
+        return self._path / key[:2] / (key + ".json")
+
+    def load(self, key: str) -> Optional[Dict]:
+        try:
+            with self._record_path(key).open() as f:
+                record = json.load(f)
+        except (IOError, ValueError):
+            return None
+        return record if isinstance(record, dict) else None
+
+    def save(self, key: str, record: Dict) -> None:
+        record_path = self._record_path(key)
+        record_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=str(record_path.parent), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(record, f, indent=1)
+        os.replace(tmp_name, str(record_path))
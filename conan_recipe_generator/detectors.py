@@ -0,0 +1,203 @@
+# Registry of the file detectors, selected by file name
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import dataclasses
+import hashlib
+import importlib
+import sys
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .script_parsers import ParsedScript, parse_autoconf_script, parse_cmake_script, parse_configure_script, parse_license_file, parse_meson_script, parse_version_file
+
+
+ENTRY_POINT_GROUP = "conan_recipe_generator.detectors"
+
+# The interesting part of autotools scripts (AC_INIT, the PACKAGE_* variables of a generated configure) is at the top,
+# generated configure scripts are often megabytes
+AUTOTOOLS_SCAN_LIMIT = 256 * 1024
+# License files are digested, not parsed: the start of a file identifies its license
+LICENSE_SCAN_LIMIT = 256 * 1024
+
+
+@dataclasses.dataclass(frozen=True)
+class FileDetector(object):
+    """
+    Handler of the files with matching names.
+    Names match exactly, or by prefix or suffix (case insensitive when lower is True).
+    parser is a function parsing the content of a file, or the 'module:function' name of it, which is imported on first use.
+    Files without parser are only recorded.
+    A parser gets the decoded text of a file, or with binary, a bytes-like object (possibly a memory map of the file).
+    Only the first max_bytes bytes of a file are read, if set.
+    The built-in kinds (cmake, autotools, autotools_script, meson, version and license) have their own results,
+    the names, versions, descriptions and homepages found by detectors of other kinds are added to the candidates.
+    Bump version when a change of the detector changes its results.
+    """
+    kind: str
+    names: Tuple[str, ...] = ()
+    prefixes: Tuple[str, ...] = ()
+    suffixes: Tuple[str, ...] = ()
+    lower: bool = False
+    parser: Union[None, str, Callable[[str], ParsedScript], Callable[[bytes], ParsedScript]] = None
+    binary: bool = False
+    max_bytes: Optional[int] = None
+    version: int = 1
+
+    def key(self) -> str:
+        """Identifies the results of the parser, e.g. to cache them"""
+        parser = self.parser
+        if not isinstance(parser, str):
+            parser = "{}:{}".format(getattr(parser, "__module__", None), getattr(parser, "__qualname__", type(parser).__name__))
+        return "{}-{}-{}".format(self.kind, self.version, parser)
+
+    def parse(self, content: Union[str, bytes]) -> ParsedScript:
+        parser = self.parser
+        if isinstance(parser, str):
+            module_name, _, function_name = parser.partition(":")
+            parser = getattr(importlib.import_module(module_name), function_name)
+            # Resolve once: the dataclass is frozen
+            object.__setattr__(self, "parser", parser)
+        return parser(content)
+
+
+BUILTIN_DETECTORS = (
+    FileDetector("version", names=("version", ), lower=True, parser=parse_version_file, max_bytes=4096),
+    FileDetector("cmake", names=("CMakeLists.txt", ), parser=parse_cmake_script),
+    FileDetector("autotools", names=("configure.ac", "configure.in", ), parser=parse_autoconf_script, binary=True, max_bytes=AUTOTOOLS_SCAN_LIMIT),
+    FileDetector("autotools_script", names=("configure", ), parser=parse_configure_script, binary=True, max_bytes=AUTOTOOLS_SCAN_LIMIT),
+    FileDetector("meson", names=("meson.build", ), parser=parse_meson_script),
+    FileDetector("license", prefixes=("license", "copying", "copyright", ), lower=True, parser=parse_license_file, binary=True, max_bytes=LICENSE_SCAN_LIMIT),
+)
+
+
+class DetectorRegistry(object):
+    """
+    Dispatch table of file detectors.
+    A lookup costs a dictionary lookup per distinct prefix or suffix length, independent of the number of detectors.
+    """
+    def __init__(self, detectors: Iterable[FileDetector]=()):
+        self._detectors: List[FileDetector] = []
+        self._exact: Dict[str, Tuple[FileDetector, ...]] = {}
+        self._exact_lower: Dict[str, Tuple[FileDetector, ...]] = {}
+        self._prefixes: Dict[int, Dict[str, Tuple[FileDetector, ...]]] = {}
+        self._suffixes: Dict[int, Dict[str, Tuple[FileDetector, ...]]] = {}
+        for detector in detectors:
+            self.register(detector)
+
+    @property
+    def detectors(self) -> Tuple[FileDetector, ...]:
+        return tuple(self._detectors)
+
+    @staticmethod
+    def _add(table: Dict[str, Tuple[FileDetector, ...]], key: str, detector: FileDetector) -> None:
+        table[key] = table.get(key, ()) + (detector, )
+
+    def register(self, detector: FileDetector) -> None:
+        self._detectors.append(detector)
+        for name in detector.names:
+            if detector.lower:
+                self._add(self._exact_lower, name.lower(), detector)
+            else:
+                self._add(self._exact, name, detector)
+        # Prefixes and suffixes are stored lower case, and are checked case sensitively after the lookup
+        for prefix in detector.prefixes:
+            self._add(self._prefixes.setdefault(len(prefix), {}), prefix.lower(), detector)
+        for suffix in detector.suffixes:
+            self._add(self._suffixes.setdefault(len(suffix), {}), suffix.lower(), detector)
+
+    def lookup(self, filename: str) -> Tuple[FileDetector, ...]:
+        """Return the detectors of a file, in registration order"""
+        found = self._exact.get(filename, ())
+        if not self._exact_lower and not self._prefixes and not self._suffixes:
+            return found
+        lower = filename.lower()
+        found += self._exact_lower.get(lower, ())
+        for length, table in self._prefixes.items():
+            for detector in table.get(lower[:length], ()):
+                if detector.lower or filename.startswith(detector.prefixes):
+                    found += (detector, )
+        for length, table in self._suffixes.items():
+            if len(lower) > length:
+                for detector in table.get(lower[-length:], ()):
+                    if detector.lower or filename.endswith(detector.suffixes):
+                        found += (detector, )
+        if len(found) > 1:
+            found = tuple(sorted(set(found), key=self._detectors.index))
+        return found
+
+    def wants_content(self, filename: str) -> bool:
+        """Return True if a detector reads the content of files with this name"""
+        return any(detector.parser is not None for detector in self.lookup(filename))
+
+    def content_limit(self, filename: str) -> Optional[int]:
+        """Return how many bytes of a file with this name the detectors read, None for all of it"""
+        limits = [detector.max_bytes for detector in self.lookup(filename) if detector.parser is not None]
+        if not limits or None in limits:
+            return None
+        return max(limits)
+
+    def key(self) -> str:
+        """Part of the detection cache key for the detectors that are not built in"""
+        extra = ["{}-{}".format(detector.kind, detector.version) for detector in self._detectors if detector not in BUILTIN_DETECTORS]
+        if not extra:
+            return ""
+        return "-d" + hashlib.sha1("\n".join(sorted(extra)).encode()).hexdigest()[:8]
+
+
+def _entry_points() -> list:
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return []
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        return list(entry_points.select(group=ENTRY_POINT_GROUP))
+    return list(entry_points.get(ENTRY_POINT_GROUP, ()))
+
+
+def load_plugin_detectors() -> List[FileDetector]:
+    """
+    Load the detectors of the entry points of group conan_recipe_generator.detectors.
+    An entry point refers to a FileDetector, a sequence of them, or a function returning either.
+    """
+    detectors = []
+    for entry_point in _entry_points():
+        try:
+            loaded = entry_point.load()
+            if callable(loaded) and not isinstance(loaded, FileDetector):
+                loaded = loaded()
+            if isinstance(loaded, FileDetector):
+                loaded = (loaded, )
+            for detector in loaded:
+                if not isinstance(detector, FileDetector):
+                    raise TypeError("expected a FileDetector, got {!r}".format(detector))
+                detectors.append(detector)
+        except Exception as e:
+            print("Ignoring detector plugin '{}': {}: {}".format(entry_point.name, type(e).__name__, e), file=sys.stderr)
+    return detectors
+
+
+_default_registry: Optional[DetectorRegistry] = None
+
+
+def default_registry() -> DetectorRegistry:
+    """The built-in detectors and the plugin detectors, loaded on first use (not when importing this module)"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = DetectorRegistry(BUILTIN_DETECTORS + tuple(load_plugin_detectors()))
+    return _default_registry
@@ -0,0 +1,335 @@
+# Downloads over pooled http connections, resuming interrupted transfers
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import dataclasses
+import hashlib
+import random
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Optional, Tuple
+import urllib.parse
+
+from .metrics import Metrics
+
+if TYPE_CHECKING:
+    import http.client
+
+
+CHUNK_SIZE = 1 << 20
+USER_AGENT = "conan-recipe-generator"
+MAX_REDIRECTS = 10
+
+
+class DownloadError(Exception):
+    pass
+
+
+class TransientDownloadError(DownloadError):
+    """A failure that might not happen again, such as a dropped connection or a 5xx response"""
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class Backoff(object):
+    """
+    Jittered exponential backoff: the n-th retry waits a random time between 0 and min(maximum, base * 2 ** n) seconds.
+    The jitter spreads the retries of concurrent downloads from the same host.
+    """
+    retries: int = 5
+    base: float = 1.
+    maximum: float = 30.
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.maximum, self.base * 2 ** attempt))
+
+
+class DownloadSink(object):
+    """
+    Destination of a download: writes the content to a file while hashing it.
+    A resumed transfer appends to the sink, a restarted transfer truncates it.
+    """
+    def __init__(self, f: BinaryIO, metrics: Optional[Metrics]=None):
+        self._f = f
+        self._hash = hashlib.sha256()
+        self._metrics = metrics or Metrics()
+        self.offset = 0
+
+    def write(self, chunk: bytes) -> None:
+        hash_phase = self._metrics.get("hash")
+        hash_start = time.perf_counter()
+        self._hash.update(chunk)
+        hash_phase.wall_time += time.perf_counter() - hash_start
+        hash_phase.bytes_read += len(chunk)
+        self._f.write(chunk)
+        download_phase = self._metrics.get("download")
+        download_phase.bytes_read += len(chunk)
+        download_phase.bytes_written += len(chunk)
+        self.offset += len(chunk)
+
+    def restart(self) -> None:
+        self._f.seek(0)
+        self._f.truncate()
+        self._hash = hashlib.sha256()
+        self.offset = 0
+
+    def hexdigest(self) -> str:
+        self._metrics.get("hash").calls += 1
+        self._metrics.get("download").files += 1
+        return self._hash.hexdigest()
+
+
+class ConnectionPool(object):
+    """
+    Idle http connections, per host.
+    The number of connections to a host is limited, get blocks until a connection becomes available.
+    """
+    def __init__(self, max_per_host: int=4, timeout: float=60):
+        self._max_per_host = max_per_host
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str], List["http.client.HTTPConnection"]] = {}
+        self._slots: Dict[Tuple[str, str], threading.BoundedSemaphore] = {}
+        self._proxies: Dict[Tuple[str, str], Optional[str]] = {}
+
+    def proxy(self, scheme: str, netloc: str) -> Optional[str]:
+        """The proxy of the host, from the environment (or the registry on Windows)"""
+        key = (scheme, netloc)
+        if key not in self._proxies:
+            # urllib.request is only imported for its proxy configuration
+            import urllib.request
+            proxy = urllib.request.getproxies().get(scheme)
+            if proxy is not None and urllib.request.proxy_bypass(urllib.parse.urlsplit("//" + netloc).hostname or netloc):
+                proxy = None
+            self._proxies[key] = proxy
+        return self._proxies[key]
+
+    def _connect(self, scheme: str, netloc: str) -> "http.client.HTTPConnection":
+        # http.client pulls in email: only import it when something is downloaded
+        import http.client
+        proxy = self.proxy(scheme, netloc)
+        if scheme == "https":
+            import ssl
+            context = ssl.create_default_context()
+            if proxy:
+                connection = http.client.HTTPSConnection(urllib.parse.urlsplit(proxy).netloc, timeout=self._timeout, context=context)
+                connection.set_tunnel(netloc)
+                return connection
+            return http.client.HTTPSConnection(netloc, timeout=self._timeout, context=context)
+        return http.client.HTTPConnection(urllib.parse.urlsplit(proxy).netloc if proxy else netloc, timeout=self._timeout)
+
+    def get(self, scheme: str, netloc: str, fresh: bool=False) -> Tuple["http.client.HTTPConnection", bool]:
+        """Return a connection to the host, and whether it is a reused connection"""
+        key = (scheme, netloc)
+        with self._lock:
+            slots = self._slots.setdefault(key, threading.BoundedSemaphore(self._max_per_host))
+        slots.acquire()
+        if not fresh:
+            with self._lock:
+                idle = self._idle.get(key)
+                if idle:
+                    return idle.pop(), True
+        try:
+            return self._connect(scheme, netloc), False
+        except Exception:
+            slots.release()
+            raise
+
+    def put(self, scheme: str, netloc: str, connection: "http.client.HTTPConnection", reuse: bool) -> None:
+        """Return a connection to the pool, or close it when it cannot be reused"""
+        key = (scheme, netloc)
+        if reuse:
+            with self._lock:
+                self._idle.setdefault(key, []).append(connection)
+        else:
+            connection.close()
+        self._slots[key].release()
+
+    def close(self) -> None:
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+_DEFAULT_POOL: Optional[ConnectionPool] = None
+
+
+def default_pool() -> ConnectionPool:
+    """The connection pool shared by all downloads of this process"""
+    global _DEFAULT_POOL
+    if _DEFAULT_POOL is None:
+        _DEFAULT_POOL = ConnectionPool()
+    return _DEFAULT_POOL
+
+
+class Downloader(object):
+    """
+    Download urls to a sink.
+    http and https downloads use pooled connections, and a failed transfer is resumed with a Range request
+    after a jittered exponential backoff. Other urls (file://, ftp://) are fetched by urllib, without resume.
+    """
+    CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+    def __init__(self, pool: Optional[ConnectionPool]=None, backoff: Optional[Backoff]=None):
+        self._pool = pool or default_pool()
+        self._backoff = backoff or Backoff()
+
+    def download(self, url: str, sink: DownloadSink) -> None:
+        import asyncio
+        asyncio.run(self.download_async(url, sink))
+
+    async def download_async(self, url: str, sink: DownloadSink) -> None:
+        """Download url to sink. The transfers run in the default executor, the backoff waits do not hold a thread."""
+        # asyncio is only imported when something is downloaded
+        import asyncio
+        loop = asyncio.get_running_loop()
+        validator = {}
+        attempt = 0
+        while True:
+            try:
+                await loop.run_in_executor(None, self._transfer, url, sink, validator)
+                return
+            except TransientDownloadError as e:
+                if attempt >= self._backoff.retries:
+                    raise DownloadError("Could not download '{}': {}".format(url, e)) from e
+                delay = self._backoff.delay(attempt)
+                attempt += 1
+                print("Download of '{}' failed ({}), resuming at byte {} in {:.1f} seconds".format(url, e, sink.offset, delay))
+                await asyncio.sleep(delay)
+
+    def _transfer(self, url: str, sink: DownloadSink, validator: Dict[str, str]) -> None:
+        """One attempt to transfer the (remaining) content of url into sink"""
+        scheme = urllib.parse.urlsplit(url).scheme
+        if scheme not in ("http", "https"):
+            self._transfer_urllib(url, sink)
+            return
+        for _ in range(MAX_REDIRECTS):
+            location = self._transfer_http(url, sink, validator)
+            if location is None:
+                return
+            url = urllib.parse.urljoin(url, location)
+        raise DownloadError("Too many redirects downloading '{}'".format(url))
+
+    def _transfer_http(self, url: str, sink: DownloadSink, validator: Dict[str, str]) -> Optional[str]:
+        """Transfer content of url into sink, return the location of a redirect"""
+        import http.client
+        parts = urllib.parse.urlsplit(url)
+        headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "identity"}
+        if sink.offset:
+            headers["Range"] = "bytes={}-".format(sink.offset)
+            # Only resume when the content did not change since the first attempt
+            if "ETag" in validator or "Last-Modified" in validator:
+                headers["If-Range"] = validator.get("ETag") or validator["Last-Modified"]
+
+        # Requests through a plain http proxy use the absolute url
+        if parts.scheme == "http" and self._pool.proxy(parts.scheme, parts.netloc):
+            target = url
+        else:
+            target = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+        connection, reused = self._pool.get(parts.scheme, parts.netloc)
+        reuse = False
+        try:
+            while True:
+                try:
+                    connection.request("GET", target, headers=headers)
+                    response = connection.getresponse()
+                    break
+                except (OSError, http.client.HTTPException) as e:
+                    if not reused:
+                        raise TransientDownloadError(str(e)) from e
+                # The server closed the idle connection: retry at once on a new connection
+                self._pool.put(parts.scheme, parts.netloc, connection, reuse=False)
+                # The slot is given back: when no new connection is made, there is nothing to put back
+                connection = None
+                connection, reused = self._pool.get(parts.scheme, parts.netloc, fresh=True)
+
+            if response.status in (301, 302, 303, 307, 308):
+                response.read()
+                reuse = not response.will_close
+                location = response.getheader("Location")
+                if not location:
+                    raise DownloadError("Redirect without location downloading '{}'".format(url))
+                return location
+            if response.status == 416 and sink.offset:
+                # The stored part does not fit the content anymore: start over
+                response.read()
+                reuse = not response.will_close
+                sink.restart()
+                raise TransientDownloadError("requested range not satisfiable")
+            if response.status >= 400:
+                response.read()
+                reuse = not response.will_close
+                message = "HTTP Error {}: {}".format(response.status, response.reason)
+                if response.status >= 500 or response.status in (408, 429):
+                    raise TransientDownloadError(message)
+                raise DownloadError("Could not download '{}': {}".format(url, message))
+
+            if response.status == 206:
+                m = self.CONTENT_RANGE_RE.match(response.getheader("Content-Range", ""))
+                if not m or int(m.group(1)) != sink.offset:
+                    response.close()
+                    sink.restart()
+                    raise TransientDownloadError("unexpected content range '{}'".format(response.getheader("Content-Range")))
+            elif sink.offset:
+                # The server ignored the Range header (or the content changed): the complete content follows
+                sink.restart()
+            for header in ("ETag", "Last-Modified"):
+                if response.getheader(header) and not sink.offset:
+                    validator[header] = response.getheader(header)
+
+            # read(amt) returns the data received so far when the connection drops, it does not raise
+            expected = sink.offset + response.length if response.length is not None else None
+            try:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sink.write(chunk)
+            except (OSError, http.client.HTTPException) as e:
+                raise TransientDownloadError(str(e)) from e
+            if expected is not None and sink.offset < expected:
+                raise TransientDownloadError("connection closed after {} of {} bytes".format(sink.offset, expected))
+            reuse = not response.will_close
+            return None
+        finally:
+            if connection is not None:
+                self._pool.put(parts.scheme, parts.netloc, connection, reuse=reuse)
+
+    @staticmethod
+    def _transfer_urllib(url: str, sink: DownloadSink) -> None:
+        # urllib.request pulls in http, ssl and email: only import it when something is downloaded
+        import urllib.error
+        import urllib.request
+
+        sink.restart()
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request) as response:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sink.write(chunk)
+        except urllib.error.HTTPError as e:
+            raise DownloadError("Could not download '{}': {}".format(url, e)) from e
+        except (OSError, urllib.error.URLError) as e:
+            # A missing local file does not appear by retrying
+            if isinstance(getattr(e, "reason", e), (FileNotFoundError, NotADirectoryError)):
+                raise DownloadError("Could not download '{}': {}".format(url, e)) from e
+            raise TransientDownloadError(str(e)) from e
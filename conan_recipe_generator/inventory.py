@@ -0,0 +1,224 @@
+# Compact index of all files of a source tree
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import bisect
+import os
+from pathlib import Path, PurePath
+import sys
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+class FileInventory(object):
+    """
+    Paths and sizes of all files of a source tree, built in a single walk.
+    The per-file data lives in arrays, names and directory components are interned,
+    so large trees cost few python objects.
+    After finish(), the files of every directory are contiguous and sorted by name,
+    and the directories are sorted by path (parents before their children).
+    """
+    __slots__ = ("_dir_parent", "_dir_name", "_dir_lookup", "_dir_start",
+                 "_file_dir", "_file_name", "_file_size", "_file_suffix", "_suffixes", "_suffix_lookup")
+
+    ROOT = 0
+
+    def __init__(self):
+        self._dir_parent = array("l", [-1])
+        self._dir_name: List[str] = [""]
+        self._dir_lookup: Dict[Tuple[int, str], int] = {}
+        self._dir_start = array("L")
+
+        self._file_dir = array("L")
+        self._file_name: List[str] = []
+        self._file_size = array("q")
+        self._file_suffix = array("L")
+        self._suffixes: List[str] = []
+        self._suffix_lookup: Dict[str, int] = {}
+
+    @classmethod
+    def from_directory(cls, root: Path, prune_dir: Optional[Callable[[Tuple[str, ...]], bool]]=None) -> "FileInventory":
+        """
+        Build the inventory of a directory.
+        Directories for which prune_dir returns True (called with the parts of their relative path) are recorded, but not entered.
+        """
+        inventory = cls()
+        stack = [(cls.ROOT, str(root), ())]
+        while stack:
+            dir_index, dir_path, dir_parts = stack.pop()
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        child_parts = dir_parts + (entry.name, )
+                        child_index = inventory._add_child_dir(dir_index, entry.name)
+                        if prune_dir is None or not prune_dir(child_parts):
+                            stack.append((child_index, entry.path, child_parts))
+                    else:
+                        try:
+                            size = entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            size = -1
+                        inventory._add_file(dir_index, entry.name, size)
+        inventory.finish()
+        return inventory
+
+    def _add_child_dir(self, parent: int, name: str) -> int:
+        key = (parent, name)
+        index = self._dir_lookup.get(key)
+        if index is None:
+            index = len(self._dir_name)
+            self._dir_lookup[(parent, sys.intern(name))] = index
+            self._dir_parent.append(parent)
+            self._dir_name.append(sys.intern(name))
+        return index
+
+    def add_dir(self, parts: Sequence[str]) -> int:
+        index = self.ROOT
+        for part in parts:
+            index = self._add_child_dir(index, part)
+        return index
+
+    def _add_file(self, dir_index: int, name: str, size: int) -> None:
+        suffix = os.path.splitext(name)[1]
+        suffix_index = self._suffix_lookup.get(suffix)
+        if suffix_index is None:
+            suffix_index = len(self._suffixes)
+            self._suffixes.append(suffix)
+            self._suffix_lookup[suffix] = suffix_index
+        self._file_dir.append(dir_index)
+        self._file_name.append(sys.intern(name))
+        self._file_size.append(size)
+        self._file_suffix.append(suffix_index)
+
+    def add_file(self, parts: Sequence[str], size: int) -> None:
+        self._add_file(self.add_dir(parts[:-1]), parts[-1], size)
+
+    def _dir_parts(self, index: int) -> Tuple[str, ...]:
+        parts = []
+        while index != self.ROOT:
+            parts.append(self._dir_name[index])
+            index = self._dir_parent[index]
+        return tuple(reversed(parts))
+
+    def finish(self) -> None:
+        # Renumber the directories, sorted by path
+        dir_order = sorted(range(len(self._dir_name)), key=self._dir_parts)
+        new_index = array("L", bytes(array("L").itemsize * len(dir_order)))
+        for new, old in enumerate(dir_order):
+            new_index[old] = new
+        self._dir_parent = array("l", (new_index[self._dir_parent[old]] if old != self.ROOT else -1 for old in dir_order))
+        self._dir_name = [self._dir_name[old] for old in dir_order]
+        self._dir_lookup = {(self._dir_parent[i], name): i for i, name in enumerate(self._dir_name) if i != self.ROOT}
+
+        # Group the files by directory, sorted by name
+        file_order = sorted(range(len(self._file_name)), key=lambda i: (new_index[self._file_dir[i]], self._file_name[i]))
+        self._file_dir = array("L", (new_index[self._file_dir[i]] for i in file_order))
+        self._file_name = [self._file_name[i] for i in file_order]
+        self._file_size = array("q", (self._file_size[i] for i in file_order))
+        self._file_suffix = array("L", (self._file_suffix[i] for i in file_order))
+
+        self._dir_start = array("L", bytes(array("L").itemsize * (len(self._dir_name) + 1)))
+        for dir_index in self._file_dir:
+            self._dir_start[dir_index + 1] += 1
+        for i in range(len(self._dir_name)):
+            self._dir_start[i + 1] += self._dir_start[i]
+
+    @property
+    def file_count(self) -> int:
+        return len(self._file_name)
+
+    @property
+    def dir_count(self) -> int:
+        return len(self._dir_name)
+
+    @property
+    def suffixes(self) -> List[str]:
+        """All distinct file suffixes of the tree"""
+        return list(self._suffixes)
+
+    def dir_path(self, index: int) -> Path:
+        return Path(*self._dir_parts(index))
+
+    def dir_files(self, index: int) -> List[str]:
+        return self._file_name[self._dir_start[index]:self._dir_start[index + 1]]
+
+    def _pruned(self, prune_dir: Callable[[Tuple[str, ...]], bool]) -> bytearray:
+        """Flags of the directories for which prune_dir, or that of a parent, returns True"""
+        pruned = bytearray(len(self._dir_name))
+        for index in range(1, len(self._dir_name)):
+            pruned[index] = pruned[self._dir_parent[index]] or prune_dir(self._dir_parts(index))
+        return pruned
+
+    def walk_suffixes(self, prune_dir: Optional[Callable[[Tuple[str, ...]], bool]]=None) -> List[str]:
+        """The distinct file suffixes of the directories that are not pruned"""
+        if prune_dir is None:
+            return list(self._suffixes)
+        pruned = self._pruned(prune_dir)
+        suffix_indices = set()
+        for index in range(len(self._dir_name)):
+            if not pruned[index]:
+                suffix_indices.update(self._file_suffix[self._dir_start[index]:self._dir_start[index + 1]])
+        return [self._suffixes[i] for i in sorted(suffix_indices)]
+
+    def walk(self, breadth_first: bool=False, prune_dir: Optional[Callable[[Tuple[str, ...]], bool]]=None) -> Iterator[Tuple[Path, List[str]]]:
+        """
+        Yield the path and the file names of every directory, parents before their children.
+        Breadth first, all directories of a depth are visited before the deeper directories.
+        Directories for which prune_dir returns True are skipped, with all their subdirectories.
+        """
+        order = range(len(self._dir_name))
+        if breadth_first:
+            # Parents sort before their children, so the depth of a parent is known before that of its children
+            depth = array("L", bytes(array("L").itemsize * len(self._dir_name)))
+            for index in range(1, len(self._dir_name)):
+                depth[index] = depth[self._dir_parent[index]] + 1
+            order = sorted(order, key=depth.__getitem__)
+        pruned = None
+        if prune_dir is not None:
+            pruned = self._pruned(prune_dir)
+        for index in order:
+            if pruned is not None and pruned[index]:
+                continue
+            yield self.dir_path(index), self.dir_files(index)
+
+    def find_dir(self, path: PurePath) -> Optional[int]:
+        index = self.ROOT
+        for part in path.parts:
+            index = self._dir_lookup.get((index, part))
+            if index is None:
+                return None
+        return index
+
+    def _find_file(self, path: PurePath) -> Optional[int]:
+        dir_index = self.find_dir(path.parent)
+        if dir_index is None:
+            return None
+        start, end = self._dir_start[dir_index], self._dir_start[dir_index + 1]
+        i = bisect.bisect_left(self._file_name, path.name, start, end)
+        if i < end and self._file_name[i] == path.name:
+            return i
+        return None
+
+    def is_file(self, path: PurePath) -> bool:
+        return self._find_file(path) is not None
+
+    def exists(self, path: PurePath) -> bool:
+        return self.find_dir(path) is not None or self._find_file(path) is not None
+
+    def size(self, path: PurePath) -> Optional[int]:
+        i = self._find_file(path)
+        if i is None:
+            return None
+        return self._file_size[i]
@@ -0,0 +1,90 @@
+# Limits on the resources an archive can take, to survive decompression bombs and broken archives
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import dataclasses
+import os
+from typing import Optional
+
+from .metrics import peak_rss
+
+
+class LimitExceeded(Exception):
+    pass
+
+
+def current_rss() -> Optional[int]:
+    """Return the resident set size of this process in bytes, or the peak if the current size is unknown"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+
+@dataclasses.dataclass(frozen=True)
+class ResourceLimits(object):
+    """
+    Limits on what a single source release can take. None means no limit.
+    The compression ratio is only checked once the content exceeds RATIO_MIN_BYTES: small archives of text compress well.
+    """
+    RATIO_MIN_BYTES = 64 << 20
+
+    max_extracted_bytes: Optional[int] = 16 << 30
+    max_files: Optional[int] = 2000000
+    max_compression_ratio: Optional[float] = 200.
+    max_memory: Optional[int] = 4 << 30
+
+
+class LimitGuard(object):
+    """
+    Enforces the limits while an archive is extracted or streamed, and while its tree is scanned.
+    The sizes are the sizes of the members in the archive: tarfile and zipfile never produce more data than that.
+    The memory is sampled (every MEMORY_SAMPLE_INTERVAL files): the resident set size of the process is cheap to read,
+    unlike tracing all allocations.
+    """
+    MEMORY_SAMPLE_INTERVAL = 4096
+
+    def __init__(self, limits: ResourceLimits, name: str, archive_size: Optional[int]=None):
+        self._limits = limits
+        self._name = name
+        self._archive_size = archive_size
+        self.files = 0
+        self.bytes = 0
+
+    def add_file(self, size: int) -> None:
+        """Account for a member of the archive, raise LimitExceeded when it breaks a limit"""
+        limits = self._limits
+        self.files += 1
+        self.bytes += size
+        if limits.max_files is not None and self.files > limits.max_files:
+            raise LimitExceeded("'{}' has more than {} files (max_files)".format(self._name, limits.max_files))
+        if limits.max_extracted_bytes is not None and self.bytes > limits.max_extracted_bytes:
+            raise LimitExceeded("'{}' expands to more than {} bytes (max_extracted_bytes)".format(self._name, limits.max_extracted_bytes))
+        if limits.max_compression_ratio is not None and self._archive_size and self.bytes > limits.RATIO_MIN_BYTES \
+                and self.bytes > limits.max_compression_ratio * self._archive_size:
+            raise LimitExceeded("'{}' expands to more than {} times its size of {} bytes (max_compression_ratio)".format(
+                self._name, limits.max_compression_ratio, self._archive_size))
+        if self.files % self.MEMORY_SAMPLE_INTERVAL == 0:
+            self.check_memory()
+
+    def check_memory(self) -> None:
+        """Raise LimitExceeded when the process uses more memory than allowed"""
+        limit = self._limits.max_memory
+        if limit is None:
+            return
+        rss = current_rss()
+        if rss is not None and rss > limit:
+            raise LimitExceeded("Processing '{}' takes more than {} bytes of memory (max_memory)".format(self._name, limit))
@@ -16,48 +16,145 @@
 
 from argparse import ArgumentParser
 from pathlib import Path
-
-from .config import GLOBAL_CONFIG
-from .detect_properties import ConanPackageDetector
-from .properties import DefaultPackageProperties
-from .template.create import ConanRecipeGenerator
+import sys
 
 
 def main(args=None):
     parser = ArgumentParser()
 
     location_parser = parser.add_argument_group("Location of the source archive")
-    location_parser.add_argument("--url", "-U", required=True, help="Url of the source archive")
+    location_group = location_parser.add_mutually_exclusive_group(required=True)
+    location_group.add_argument("--url", "-U", help="Url of the source archive")
+    location_group.add_argument("--git", metavar="PATH", help="Local git repository (read without checkout)")
+    location_group.add_argument("--batch", "-B", metavar="MANIFEST", help="File with on each line the url of a source archive, optionally followed by its sha256 checksum ('-' reads from stdin)")
+    location_group.add_argument("--precompile-templates", action="store_true", help="Compile all templates into the bytecode cache, and exit")
     location_parser.add_argument("--checksum", default=None, help="checksum of the source archive (sha256)")
+    location_parser.add_argument("--ref", default=None, help="Tag, branch or commit of the git repository (default: HEAD)")
+    location_parser.add_argument("--versions", metavar="LIST", default=None, help="Comma separated versions, oldest first: generate one recipe for all of them, '{version}' in --url is replaced by every version")
+
+    detect_parser = parser.add_argument_group("Detection")
+    detect_parser.add_argument("--stream", action="store_true", help="Detect the properties while streaming the archive, without extracting it to disk")
+    detect_parser.add_argument("--confidence", type=float, default=None, help="Scan breadth first, and stop parsing build scripts once the detection reaches this confidence (0 to 1)")
+    detect_parser.add_argument("--prune", metavar="PATTERN", action="append", default=[], help="Skip directories matching this pattern, '!PATTERN' removes a built-in pattern (can be repeated)")
+    detect_parser.add_argument("--no-prune", action="store_true", help="Scan all directories, including tests, documentation and third party code")
+    detect_parser.add_argument("--rescan", action="store_true", help="Ignore cached detection results, and scan the archive again")
+
+    metrics_parser = parser.add_argument_group("Metrics")
+    metrics_parser.add_argument("--metrics", metavar="PATH", default=None, help="Write the time and resource usage of every phase to this file")
+    metrics_parser.add_argument("--metrics-format", choices=("json", "prometheus"), default="json", help="Format of the metrics file (default: json)")
+
+    batch_parser = parser.add_argument_group("Batch mode")
+    batch_parser.add_argument("--jobs", "-j", type=int, default=None, help="Number of recipes to generate concurrently (default: number of cpu's)")
+    batch_parser.add_argument("--downloads", type=int, default=4, help="Number of archives to download concurrently (default: %(default)s)")
 
     ns = parser.parse_args(args)
 
-    generator = ConanRecipeGenerator()
+    if ns.batch and ns.checksum:
+        parser.error("--checksum cannot be used with --batch: add the checksums to the manifest")
+    if ns.ref and not ns.git:
+        parser.error("--ref can only be used with --git")
+    if ns.git and (ns.checksum or ns.stream):
+        parser.error("--checksum and --stream cannot be used with --git")
+    if ns.versions is not None:
+        if not ns.url or "{version}" not in ns.url:
+            parser.error("--versions needs an --url containing '{version}'")
+        if ns.checksum:
+            parser.error("--checksum cannot be used with --versions")
+    if ns.confidence is not None and not 0 <= ns.confidence <= 1:
+        parser.error("--confidence must be between 0 and 1")
+    if ns.jobs is not None and ns.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if ns.downloads < 1:
+        parser.error("--downloads must be at least 1")
 
-    download_url = ns.url
-    download_sha256 = ns.checksum
+    # The detector and jinja2 are slow to import: only import them when the arguments are valid
+    from .config import get_global_config
+    from .detect_properties import DetectorOptions
+    from .limits import LimitExceeded
+    from .metrics import Metrics
+    from .prune import NO_PRUNING, PruneRules
+    from .pipeline import generate_recipe, generate_recipe_from_git
+    from .template.create import ConanRecipeGenerator
 
-    workpath = GLOBAL_CONFIG.get_work_path()
+    if ns.no_prune:
+        prune_rules = NO_PRUNING
+    else:
+        # The patterns of the command line are added to those of the configuration
+        prune_rules = PruneRules.from_config(get_global_config().get_prune_rules().patterns + tuple(ns.prune), defaults=False)
+    options = DetectorOptions(
+        extract=not ns.stream,
+        parse_jobs=get_global_config().get_parse_jobs(),
+        use_detection_cache=not ns.rescan,
+        confidence=ns.confidence if ns.confidence is not None else get_global_config().get_scan_confidence(),
+        prune_rules=prune_rules,
+        budget=get_global_config().get_scan_budget(),
+        limits=get_global_config().get_resource_limits(),
+    )
+
+    workpath = get_global_config().get_work_path()
     workpath.mkdir(exist_ok=True, parents=True)
     print("work path is {}".format(workpath))
 
-    default_packages = DefaultPackageProperties(
-        autoconf="autoconf/2.69",
-        automake="automake/1.16.2",
-        libtool="libtool/2.4.6",
-        winbash="msys2/20190524",
-    )
+    if ns.precompile_templates:
+        ConanRecipeGenerator(bytecode_cache_path=workpath / "templates").precompile()
+        print("Compiled templates to '{}'".format(workpath / "templates"))
+        return 0
 
-    detector = ConanPackageDetector(workpath=workpath, download_url=download_url, download_sha256=download_sha256)
-    detector.detect()
-    props = detector.properties(
-        url="https://github.com/conan-io/conan-center-index",
-        default_packages=default_packages,
-    )
+    if ns.batch:
+        from .batch import merge_metrics, print_summary, read_manifest, run_batch
+        try:
+            if ns.batch == "-":
+                entries = read_manifest(sys.stdin)
+            else:
+                with open(ns.batch) as manifest:
+                    entries = read_manifest(manifest)
+        except OSError as e:
+            parser.error("--batch: cannot read the manifest: {}".format(e))
+        except ValueError as e:
+            parser.error("--batch: {}".format(e))
+        results = run_batch(entries, workpath=workpath, jobs=ns.jobs, options=options, downloads=ns.downloads)
+        print_summary(results)
+        if ns.metrics:
+            jobs = [{"url": result.entry.url, "success": result.success, "phases": result.metrics} for result in results]
+            merge_metrics(results).write(Path(ns.metrics), ns.metrics_format, extra={"jobs": jobs})
+        return 0 if all(result.success for result in results) else 1
+
+    if ns.versions is not None:
+        from .batch import merge_metrics
+        from .sweep import parse_versions, print_sweep_summary, run_sweep
+        try:
+            versions = parse_versions(ns.versions)
+        except ValueError as e:
+            parser.error("--versions: {}".format(e))
+        sweep = run_sweep(ns.url, versions, workpath=workpath, jobs=ns.jobs, options=options, downloads=ns.downloads)
+        print_sweep_summary(sweep)
+        metrics = merge_metrics(sweep.results)
+        try:
+            if sweep.properties is not None:
+                target_path = ConanRecipeGenerator(bytecode_cache_path=workpath / "templates").generate(sweep.properties, metrics=metrics)
+                print("Generated conan recipe for {} versions at '{}'".format(len(sweep.properties.releases), target_path))
+        finally:
+            if ns.metrics:
+                jobs = [{"url": result.entry.url, "version": version, "success": result.success, "phases": result.metrics} for version, result in zip(sweep.versions, sweep.results)]
+                metrics.write(Path(ns.metrics), ns.metrics_format, extra={"jobs": jobs})
+        return 0 if sweep.success else 1
 
-    target_path = generator.generate(props)
+    metrics = Metrics()
+    generator = ConanRecipeGenerator(bytecode_cache_path=workpath / "templates")
+    try:
+        if ns.git:
+            target_path = generate_recipe_from_git(generator, workpath=workpath, repository=Path(ns.git), ref=ns.ref or "HEAD", options=options, metrics=metrics)
+        else:
+            target_path = generate_recipe(generator, workpath=workpath, download_url=ns.url, download_sha256=ns.checksum, options=options, metrics=metrics)
+    except LimitExceeded as e:
+        print("Aborted: {}".format(e), file=sys.stderr)
+        return 1
+    finally:
+        if ns.metrics:
+            metrics.write(Path(ns.metrics), ns.metrics_format)
     print("Generated conan recipe at '{}'".format(target_path))
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
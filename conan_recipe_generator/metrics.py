@@ -0,0 +1,159 @@
+# Timing and resource usage of the phases of a run
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import dataclasses
+import json
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss() -> Optional[int]:
+    """Return the peak resident set size of this process in bytes, or None if unknown"""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+@dataclasses.dataclass
+class PhaseMetrics(object):
+    wall_time: float = 0.
+    cpu_time: float = 0.
+    bytes_read: int = 0
+    bytes_written: int = 0
+    files: int = 0
+    calls: int = 0
+    peak_rss: Optional[int] = None
+    # Files of which the scan was cut short by the scan budget
+    budget_hits: int = 0
+    # The path of every such file and why its scan was cut short (not exported to prometheus)
+    budget_hit_files: List[Dict[str, str]] = dataclasses.field(default_factory=list)
+    # Files of which the parse result was found in the parse cache
+    cache_hits: int = 0
+
+    def merge(self, other: "PhaseMetrics") -> None:
+        self.wall_time += other.wall_time
+        self.cpu_time += other.cpu_time
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        self.files += other.files
+        self.calls += other.calls
+        self.budget_hits += other.budget_hits
+        self.budget_hit_files.extend(other.budget_hit_files)
+        self.cache_hits += other.cache_hits
+        if other.peak_rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, other.peak_rss)
+
+
+class Metrics(object):
+    """
+    Resource usage of the phases of a run (download, extract, walk, parse, render, ...).
+    A phase can be entered multiple times, its metrics are summed.
+    The cpu time is the cpu time of the complete process, so it includes all threads.
+    """
+    PROMETHEUS_PREFIX = "crg_phase_"
+    PROMETHEUS_METRICS = (
+        ("wall_time", "wall_seconds", "Wall clock time spent in the phase"),
+        ("cpu_time", "cpu_seconds", "Process cpu time spent in the phase"),
+        ("bytes_read", "read_bytes", "Bytes read during the phase"),
+        ("bytes_written", "written_bytes", "Bytes written during the phase"),
+        ("files", "files", "Files handled during the phase"),
+        ("calls", "calls", "Number of times the phase was run"),
+        ("peak_rss", "peak_rss_bytes", "Peak resident set size of the process at the end of the phase"),
+        ("budget_hits", "budget_hits", "Files of which the scan was cut short by the scan budget"),
+        ("cache_hits", "cache_hits", "Files of which the parse result was found in the parse cache"),
+    )
+
+    def __init__(self):
+        self.phases: Dict[str, PhaseMetrics] = {}
+
+    def get(self, name: str) -> PhaseMetrics:
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = PhaseMetrics()
+            self.phases[name] = phase
+        return phase
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[PhaseMetrics]:
+        phase = self.get(name)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield phase
+        finally:
+            phase.wall_time += time.perf_counter() - wall_start
+            phase.cpu_time += time.process_time() - cpu_start
+            phase.calls += 1
+            rss = peak_rss()
+            if rss is not None:
+                phase.peak_rss = max(phase.peak_rss or 0, rss)
+
+    def merge(self, other: "Metrics") -> None:
+        for name, phase in other.phases.items():
+            self.get(name).merge(phase)
+
+    def to_dict(self) -> Dict:
+        return {name: dataclasses.asdict(phase) for name, phase in self.phases.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Metrics":
+        metrics = cls()
+        for name, phase in data.items():
+            metrics.phases[name] = PhaseMetrics(**phase)
+        return metrics
+
+    def to_prometheus(self) -> str:
+        """Format the metrics for the textfile collector of the Prometheus node exporter"""
+        lines = []
+        for attribute, metric_name, description in self.PROMETHEUS_METRICS:
+            name = self.PROMETHEUS_PREFIX + metric_name
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} gauge".format(name))
+            for phase_name, phase in self.phases.items():
+                value = getattr(phase, attribute)
+                if value is not None:
+                    lines.append("{}{{phase=\"{}\"}} {}".format(name, phase_name, value))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path, format: str, extra: Optional[Dict]=None) -> None:
+        """
+        Write the metrics as json or prometheus text.
+        The file is replaced atomically, so collectors never see a partial file.
+        """
+        if format == "prometheus":
+            text = self.to_prometheus()
+        else:
+            data = {"phases": self.to_dict()}
+            if extra:
+                data.update(extra)
+            text = json.dumps(data, indent=2) + "\n"
+        path = path.resolve()
+        fd, tmp_name = tempfile.mkstemp(dir=str(path.parent), prefix=path.name, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_name, str(path))
@@ -0,0 +1,117 @@
+# Persistent cache of the parse results of single files, by content digest
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+from pathlib import Path
+import threading
+from typing import List, Optional, Tuple
+
+from .properties import AutotoolsReconfType
+from .script_parsers import ParsedScript
+
+
+def content_digest(data) -> str:
+    """Digest of the scanned content of a file (a bytes-like object)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _to_json(parsed: ParsedScript) -> str:
+    return json.dumps({
+        "names": parsed.names,
+        "versions": parsed.versions,
+        "descriptions": parsed.descriptions,
+        "homepages": parsed.homepages,
+        "subdirectories": parsed.subdirectories,
+        "autoreconf": parsed.autoreconf.value if parsed.autoreconf is not None else None,
+        "content_digest": parsed.content_digest,
+    })
+
+
+def _from_json(text: str) -> Optional[ParsedScript]:
+    try:
+        record = json.loads(text)
+        return ParsedScript(
+            names=list(record["names"]),
+            versions=list(record["versions"]),
+            descriptions=list(record["descriptions"]),
+            homepages=list(record["homepages"]),
+            subdirectories=list(record["subdirectories"]),
+            autoreconf=AutotoolsReconfType(record["autoreconf"]) if record["autoreconf"] is not None else None,
+            content_digest=record.get("content_digest"),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class ParseCache(object):
+    """
+    Parse results of single build scripts, stored in a sqlite database by the digest of the content of the file
+    and the key of its parser (its kind and version).
+    Releases of a project share most of their build scripts: only the scripts that changed are parsed again.
+    The cache is shared by the parser threads of a detector, new results are written by flush, in one transaction.
+    sqlite locks the database, so concurrent processes can share it.
+    Errors of the database are not fatal: the file is parsed.
+    """
+    TIMEOUT = 30.
+
+    def __init__(self, path: Path):
+        # sqlite3 is only imported when a cache is used
+        import sqlite3
+        self._error = sqlite3.Error
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, str, str]] = []
+        self._connection = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(path), timeout=self.TIMEOUT, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS parses (digest TEXT NOT NULL, parser TEXT NOT NULL, result TEXT NOT NULL, PRIMARY KEY (digest, parser))")
+            self._connection.commit()
+        except (OSError, self._error):
+            self.close()
+
+    def load(self, digest: str, parser_key: str) -> Optional[ParsedScript]:
+        if self._connection is None:
+            return None
+        with self._lock:
+            try:
+                row = self._connection.execute("SELECT result FROM parses WHERE digest = ? AND parser = ?", (digest, parser_key)).fetchone()
+            except self._error:
+                return None
+        return _from_json(row[0]) if row is not None else None
+
+    def save(self, digest: str, parser_key: str, parsed: ParsedScript) -> None:
+        """Queue a result, written by the next flush"""
+        with self._lock:
+            self._pending.append((digest, parser_key, _to_json(parsed)))
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if self._connection is None or not pending:
+                return
+            try:
+                with self._connection:
+                    self._connection.executemany("INSERT OR REPLACE INTO parses (digest, parser, result) VALUES (?, ?, ?)", pending)
+            except self._error:
+                pass
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
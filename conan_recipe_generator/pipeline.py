@@ -0,0 +1,73 @@
+# Run the detect and generate steps for a single source archive
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+from typing import Optional
+
+from .detect_properties import ConanPackageDetector, DetectorOptions, GitPackageDetector
+from .metrics import Metrics
+from .properties import ConanRecipeProperties, DefaultPackageProperties
+from .template.create import ConanRecipeGenerator
+
+
+RECIPE_URL = "https://github.com/conan-io/conan-center-index"
+
+
+def default_package_properties() -> DefaultPackageProperties:
+    return DefaultPackageProperties(
+        autoconf="autoconf/2.69",
+        automake="automake/1.16.2",
+        libtool="libtool/2.4.6",
+        winbash="msys2/20190524",
+    )
+
+
+def _detect(detector: ConanPackageDetector) -> ConanRecipeProperties:
+    with detector:
+        detector.detect()
+        return detector.properties(
+            url=RECIPE_URL,
+            default_packages=default_package_properties(),
+        )
+
+
+def _generate(generator: ConanRecipeGenerator, detector: ConanPackageDetector, metrics: Metrics) -> Path:
+    with metrics.phase("total"):
+        props = _detect(detector)
+        return generator.generate(props, metrics=metrics)
+
+
+def detect_recipe_properties(workpath: Path, download_url: str, download_sha256: Optional[str], options: Optional[DetectorOptions]=None, metrics: Optional[Metrics]=None) -> ConanRecipeProperties:
+    """Detect the properties of a source archive, without generating a recipe"""
+    if metrics is None:
+        metrics = Metrics()
+    detector = ConanPackageDetector(workpath=workpath, download_url=download_url, download_sha256=download_sha256, options=options, metrics=metrics)
+    with metrics.phase("total"):
+        return _detect(detector)
+
+
+def generate_recipe(generator: ConanRecipeGenerator, workpath: Path, download_url: str, download_sha256: Optional[str], options: Optional[DetectorOptions]=None, metrics: Optional[Metrics]=None) -> Path:
+    if metrics is None:
+        metrics = Metrics()
+    detector = ConanPackageDetector(workpath=workpath, download_url=download_url, download_sha256=download_sha256, options=options, metrics=metrics)
+    return _generate(generator, detector, metrics)
+
+
+def generate_recipe_from_git(generator: ConanRecipeGenerator, workpath: Path, repository: Path, ref: str, options: Optional[DetectorOptions]=None, metrics: Optional[Metrics]=None) -> Path:
+    if metrics is None:
+        metrics = Metrics()
+    detector = GitPackageDetector(workpath=workpath, repository=repository, ref=ref, options=options, metrics=metrics)
+    return _generate(generator, detector, metrics)
@@ -17,7 +17,7 @@
 import dataclasses
 import enum
 from pathlib import Path
-from typing import Optional, Set, Tuple
+from typing import Dict, Optional, Set, Tuple
 
 
 @dataclasses.dataclass
@@ -141,6 +141,8 @@ class PackageProperties(object):
     with_shared: bool = True
     with_cxx: bool = True
     license_paths: Tuple[Path] = dataclasses.field(default_factory=tuple)
+    # sha256 of the content of every license file, by posix path
+    license_digests: Dict[str, str] = dataclasses.field(default_factory=dict)
     patches: Tuple[PatchProperties] = dataclasses.field(default_factory=tuple)
     extra_generators: Set[str] = dataclasses.field(default_factory=set)
     build_context: bool = False
@@ -157,6 +159,13 @@ class DefaultPackageProperties(object):
     winbash: str
 
 
+@dataclasses.dataclass
+class ReleaseProperties(object):
+    version: str
+    download_url: str
+    download_sha256: str
+
+
 @dataclasses.dataclass
 class ConanRecipeProperties(object):
     name: str
@@ -172,3 +181,5 @@ class ConanRecipeProperties(object):
     build_systems: BuildSystemsProperties = dataclasses.field(default_factory=BuildSystemsProperties)
     exports_sources: Set[str] = dataclasses.field(default_factory=list)
     package: PackageProperties = dataclasses.field(default_factory=PackageProperties)
+    # All versions listed by the recipe, empty for only version
+    releases: Tuple[ReleaseProperties, ...] = dataclasses.field(default_factory=tuple)
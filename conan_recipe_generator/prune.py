@@ -0,0 +1,104 @@
+# Rules for the directories that are skipped while scanning a source tree
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import dataclasses
+import fnmatch
+import hashlib
+from pathlib import PurePath
+import re
+from typing import Iterable, Optional, Pattern, Sequence, Tuple
+
+
+# Version control, vendored dependencies, tests and documentation never determine the properties of a package
+DEFAULT_PRUNE_PATTERNS = (
+    ".git",
+    ".hg",
+    ".svn",
+    "3rdparty",
+    "bundled",
+    "deps",
+    "doc",
+    "docs",
+    "extern",
+    "external",
+    "test",
+    "tests",
+    "third_party",
+    "thirdparty",
+    "vendor",
+)
+
+
+def _compile(patterns: Iterable[str]) -> Optional[Pattern]:
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:{})".format(fnmatch.translate(pattern)) for pattern in patterns))
+
+
+@dataclasses.dataclass(frozen=True)
+class PruneRules(object):
+    """
+    Glob patterns of directories to skip, with their subtrees.
+    A pattern without '/' matches the name of a directory at any depth (e.g. 'third_party'),
+    a pattern with '/' matches the path of a directory relative to the top of the tree (e.g. 'src/vendored*').
+    """
+    patterns: Tuple[str, ...] = DEFAULT_PRUNE_PATTERNS
+    _name_re: Optional[Pattern] = dataclasses.field(init=False, repr=False, compare=False)
+    _path_re: Optional[Pattern] = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # All patterns are matched by a single regular expression
+        object.__setattr__(self, "_name_re", _compile(pattern for pattern in self.patterns if "/" not in pattern))
+        object.__setattr__(self, "_path_re", _compile(pattern for pattern in self.patterns if "/" in pattern))
+
+    @classmethod
+    def from_config(cls, extra: Sequence[str], defaults: bool=True) -> "PruneRules":
+        """
+        Add patterns to the built-in patterns (or to none, if defaults is False).
+        A pattern starting with '!' removes a pattern, e.g. '!docs' scans docs directories.
+        """
+        patterns = list(DEFAULT_PRUNE_PATTERNS) if defaults else []
+        for pattern in extra:
+            pattern = pattern.strip().strip("/")
+            if not pattern:
+                continue
+            if pattern.startswith("!"):
+                if pattern[1:] in patterns:
+                    patterns.remove(pattern[1:])
+            elif pattern not in patterns:
+                patterns.append(pattern)
+        return cls(patterns=tuple(patterns))
+
+    def prunes_dir(self, parts: Sequence[str]) -> bool:
+        """Return True if the directory itself matches a pattern (its parents are not checked)"""
+        if not parts:
+            return False
+        if self._name_re is not None and self._name_re.match(parts[-1]):
+            return True
+        return self._path_re is not None and bool(self._path_re.match("/".join(parts)))
+
+    def is_pruned(self, path: PurePath) -> bool:
+        """Return True if the directory at path is pruned, or is in a pruned directory"""
+        parts = path.parts
+        return any(self.prunes_dir(parts[:depth]) for depth in range(1, len(parts) + 1))
+
+    def key(self) -> str:
+        """Short digest of the patterns, for cache keys"""
+        return hashlib.sha1("\n".join(self.patterns).encode()).hexdigest()[:8]
+
+
+NO_PRUNING = PruneRules(patterns=())
@@ -0,0 +1,69 @@
+# Limits on the bytes read and the time spent scanning a single file
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import dataclasses
+import threading
+import time
+from typing import Iterator, Optional
+
+
+class ScanTimeout(Exception):
+    """The time budget of the scan of a file is spent"""
+    pass
+
+
+_local = threading.local()
+
+
+@dataclasses.dataclass(frozen=True)
+class ScanBudget(object):
+    """
+    The budget of the scan of a single file: only the first max_bytes bytes are read,
+    and a parser running longer than max_seconds is stopped. None means no limit.
+    The built-in parsers run in linear time, so the byte budget bounds their time too;
+    the time budget catches slow machines and plugin parsers.
+    """
+    max_bytes: Optional[int] = 8 << 20
+    max_seconds: Optional[float] = 5.
+
+    def limit(self, max_bytes: Optional[int]) -> Optional[int]:
+        """Combine the byte limit of a detector with the byte budget"""
+        if self.max_bytes is None:
+            return max_bytes
+        if max_bytes is None:
+            return self.max_bytes
+        return min(max_bytes, self.max_bytes)
+
+    @contextlib.contextmanager
+    def deadline(self) -> Iterator[None]:
+        """Set the deadline checked by check_deadline, for the current thread"""
+        previous = getattr(_local, "deadline", None)
+        _local.deadline = None if self.max_seconds is None else time.monotonic() + self.max_seconds
+        try:
+            yield
+        finally:
+            _local.deadline = previous
+
+    def key(self) -> str:
+        return "{}-{}".format(self.max_bytes, self.max_seconds)
+
+
+def check_deadline() -> None:
+    """Raise ScanTimeout if the deadline of the current thread has passed. Long running parsers call this regularly."""
+    deadline = getattr(_local, "deadline", None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise ScanTimeout()
@@ -0,0 +1,224 @@
+# Parsers extracting package properties from build scripts
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import dataclasses
+import hashlib
+import re
+import shlex
+from typing import List, Optional
+
+from .cmake_lexer import CMakeCommandIndex
+from .properties import AutotoolsReconfType
+from .scan_budget import check_deadline
+
+
+@dataclasses.dataclass
+class ParsedScript(object):
+    """
+    Everything a parser found in one build script.
+    Parsers only look at the content of the script, so they can run concurrently.
+    """
+    names: List[str] = dataclasses.field(default_factory=list)
+    versions: List[str] = dataclasses.field(default_factory=list)
+    descriptions: List[str] = dataclasses.field(default_factory=list)
+    homepages: List[str] = dataclasses.field(default_factory=list)
+    subdirectories: List[str] = dataclasses.field(default_factory=list)
+    autoreconf: Optional[AutotoolsReconfType] = None
+    # sha256 of the content, of files of which only changes matter (license files)
+    content_digest: Optional[str] = None
+
+
+def parse_license_file(content: bytes) -> ParsedScript:
+    """License files are not interpreted: their digest shows whether the license changed between releases"""
+    return ParsedScript(content_digest=hashlib.sha256(content).hexdigest())
+
+
+def parse_version_file(content: str) -> ParsedScript:
+    return ParsedScript(versions=[content.partition("\n")[0].strip()])
+
+
+def parse_cmake_script(content: str) -> ParsedScript:
+    parsed = ParsedScript()
+    index = CMakeCommandIndex.from_content(content)
+    for project in index.commands("project"):
+        if not project.arguments:
+            continue
+        parsed.names.append(project.arguments[0])
+        for keyword, values in (("VERSION", parsed.versions), ("DESCRIPTION", parsed.descriptions), ("HOMEPAGE_URL", parsed.homepages), ):
+            value = project.keyword_value(keyword)
+            if value is not None:
+                values.append(value)
+    for add_subdirectory in index.commands("add_subdirectory"):
+        if add_subdirectory.arguments:
+            parsed.subdirectories.append(add_subdirectory.arguments[0])
+    return parsed
+
+
+_AC_INIT_RE = re.compile(rb"\bAC_INIT[ \t]*\(")
+# The characters of m4 arguments that need no attention: everything but quotes, parentheses, commas and comments ('#' and 'dnl'),
+# and inside quotes everything but quotes
+_M4_PLAIN_RE = re.compile(rb"[^\[\](),#d]*")
+_M4_QUOTED_RE = re.compile(rb"[^\[\]]*")
+
+
+def _m4_arguments(content: bytes, pos: int, max_arguments: int) -> List[str]:
+    """
+    Return the (unquoted) arguments of the m4 macro call with its opening parenthesis before pos.
+    A single pass over the content: every character is looked at once.
+    When the call is not closed, the arguments found so far are returned, the last one up to the end of its line.
+    """
+    arguments = []
+    current = bytearray()
+    quote_depth = 0
+    paren_depth = 0
+    size = len(content)
+    steps = 0
+    closed = False
+    while pos < size and len(arguments) < max_arguments:
+        steps += 1
+        if steps % 4096 == 0:
+            check_deadline()
+        end = (_M4_QUOTED_RE if quote_depth else _M4_PLAIN_RE).match(content, pos).end()
+        current += content[pos:end]
+        pos = end
+        if pos >= size:
+            break
+        c = content[pos:pos + 1]
+        pos += 1
+        if c == b"[":
+            # The outer quotes are removed, nested quotes are kept
+            if quote_depth:
+                current += c
+            quote_depth += 1
+        elif c == b"]":
+            quote_depth = max(quote_depth - 1, 0)
+            if quote_depth:
+                current += c
+        elif c == b"#":
+            # A comment, up to the end of the line
+            end = content.find(b"\n", pos)
+            pos = size if end < 0 else end
+        elif c == b"d":
+            if content[pos:pos + 2] == b"nl" and not _is_word_byte(content[pos + 2:pos + 3]) and not _is_word_byte(content[pos - 2:pos - 1]):
+                # dnl discards everything up to and including the end of the line
+                end = content.find(b"\n", pos)
+                pos = size if end < 0 else end + 1
+            else:
+                current += c
+        elif c == b"(":
+            paren_depth += 1
+            current += c
+        elif c == b")" and paren_depth:
+            paren_depth -= 1
+            current += c
+        elif c == b"," and not paren_depth:
+            arguments.append(current.decode(errors="replace").strip())
+            current = bytearray()
+        else:
+            # The closing parenthesis of the call
+            arguments.append(current.decode(errors="replace").strip())
+            closed = True
+            break
+    if not closed and len(arguments) < max_arguments:
+        # An unterminated call: the rest of the file is not part of the last argument
+        arguments.append(current.decode(errors="replace").strip().partition("\n")[0].strip())
+    return arguments
+
+
+def _is_word_byte(c: bytes) -> bool:
+    return c.isalnum() or c == b"_"
+
+
+def _autoconf_tarname(name: str) -> str:
+    """The tarname autoconf derives from a package name: 'GNU Hello' becomes 'hello'"""
+    if name.startswith("GNU "):
+        name = name[len("GNU "):]
+    return re.sub(r"[^a-z0-9_]", "-", name.lower())
+
+
+_M4_COMMENT_RE = re.compile(rb"#|(?<![\w])dnl(?![\w])")
+
+
+def _find_macro_call(regex, content: bytes):
+    """Return the first match of regex that is not in a comment ('#' or 'dnl', up to the end of the line)"""
+    for m in regex.finditer(content):
+        line_start = content.rfind(b"\n", 0, m.start()) + 1
+        if not _M4_COMMENT_RE.search(content, line_start, m.start()):
+            return m
+    return None
+
+
+def parse_autoconf_script(content: bytes) -> ParsedScript:
+    """Parse configure.ac: content is a bytes-like object (such as a memory map), it is not decoded"""
+    parsed = ParsedScript()
+
+    # Detect autotools type
+    if content.find(b"LT_") >= 0:
+        parsed.autoreconf = AutotoolsReconfType.LIBTOOL
+    elif content.find(b"AM_INIT_AUTOMAKE") >= 0:
+        parsed.autoreconf = AutotoolsReconfType.AUTOMAKE
+    else:
+        parsed.autoreconf = AutotoolsReconfType.AUTOCONF
+
+    # Extract name, version and url from AC_INIT(package, version, [bug-report], [tarname], [url])
+    m = _find_macro_call(_AC_INIT_RE, content)
+    if m:
+        arguments = _m4_arguments(content, m.end(), max_arguments=5) + [""] * 5
+        name, version, _, tarname, url = arguments[:5]
+        # Values computed by macros (e.g. m4_esyscmd([git-version-gen])) are not known before running autoconf
+        if "(" not in name and (tarname or name):
+            parsed.names.append(tarname or _autoconf_tarname(name))
+        if version and "(" not in version:
+            parsed.versions.append(version)
+        if url and "(" not in url:
+            parsed.homepages.append(url)
+    return parsed
+
+
+# The variables autoconf writes near the top of a generated configure script, e.g. PACKAGE_VERSION='1.2.3'
+_CONFIGURE_VARIABLE_RE = re.compile(rb"^PACKAGE_(NAME|TARNAME|VERSION|URL)='([^'\n]*)'", flags=re.MULTILINE)
+
+
+def parse_configure_script(content: bytes) -> ParsedScript:
+    """Parse a configure script generated by autoconf: content is a bytes-like object, it is not decoded"""
+    variables = {}
+    for m in _CONFIGURE_VARIABLE_RE.finditer(content):
+        variables.setdefault(m.group(1), m.group(2).decode(errors="replace"))
+        if len(variables) == 4:
+            break
+    parsed = ParsedScript()
+    # The tarname is the name of the release archive (e.g. 'hello' for 'GNU Hello')
+    name = variables.get(b"TARNAME") or variables.get(b"NAME")
+    if name:
+        parsed.names.append(name)
+    if variables.get(b"VERSION"):
+        parsed.versions.append(variables[b"VERSION"])
+    if variables.get(b"URL"):
+        parsed.homepages.append(variables[b"URL"])
+    return parsed
+
+
+def parse_meson_script(content: str) -> ParsedScript:
+    parsed = ParsedScript()
+    for m in re.finditer(r"subdir[ \t\n]*\([ \t\n]*['\"]([^'\"]+)", content):
+        check_deadline()
+        try:
+            subdir_args = shlex.split(m.group(1))
+        except ValueError:
+            continue
+        if subdir_args:
+            parsed.subdirectories.append(subdir_args[0])
+    return parsed
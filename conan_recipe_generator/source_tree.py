@@ -0,0 +1,280 @@
+# Access to the files of a source release, extracted on disk or streamed from its archive
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import mmap
+import os
+from pathlib import Path, PurePosixPath
+import subprocess
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+import zipfile
+
+from .decompress import open_tar_stream
+from .inventory import FileInventory
+from .limits import LimitGuard
+from .prune import NO_PRUNING, PruneRules
+
+
+class SourceTree(object):
+    """
+    The files of a source release.
+    All paths are relative to the top directory of the release.
+    The tree is walked once to build its inventory, all lookups are answered by the inventory.
+    Pruned directories are not walked, and the content of their files is not read.
+    """
+    _inventory: Optional[FileInventory] = None
+    _prune_rules: PruneRules = NO_PRUNING
+
+    @property
+    def name(self) -> str:
+        raise NotImplementedError()
+
+    def _build_inventory(self) -> FileInventory:
+        raise NotImplementedError()
+
+    @property
+    def inventory(self) -> FileInventory:
+        if self._inventory is None:
+            self._inventory = self._build_inventory()
+        return self._inventory
+
+    def walk(self, breadth_first: bool=False) -> Iterator[Tuple[Path, List[str]]]:
+        prune_dir = self._prune_rules.prunes_dir if self._prune_rules.patterns else None
+        return self.inventory.walk(breadth_first=breadth_first, prune_dir=prune_dir)
+
+    def suffixes(self) -> List[str]:
+        """The distinct suffixes of the files outside pruned directories"""
+        prune_dir = self._prune_rules.prunes_dir if self._prune_rules.patterns else None
+        return self.inventory.walk_suffixes(prune_dir=prune_dir)
+
+    def exists(self, path: Path) -> bool:
+        return self.inventory.exists(path)
+
+    def read_bytes(self, path: Path) -> bytes:
+        raise NotImplementedError()
+
+    def read_text(self, path: Path) -> str:
+        return self.read_bytes(path).decode(errors="replace")
+
+    @contextlib.contextmanager
+    def open_buffer(self, path: Path, limit: Optional[int]=None) -> Iterator[Union[bytes, mmap.mmap]]:
+        """Open the first limit bytes (or all) of a file as a bytes-like object, valid until the context exits"""
+        data = self.read_bytes(path)
+        yield data if limit is None or len(data) <= limit else data[:limit]
+
+
+def _no_limit(filename: str) -> Optional[int]:
+    return None
+
+
+class DirectorySourceTree(SourceTree):
+    def __init__(self, root: Path, prune_rules: PruneRules=NO_PRUNING):
+        self._root = root
+        self._prune_rules = prune_rules
+
+    @property
+    def name(self) -> str:
+        return self._root.name
+
+    def _build_inventory(self) -> FileInventory:
+        # Pruned directories are not even listed
+        return FileInventory.from_directory(self._root, prune_dir=self._prune_rules.prunes_dir if self._prune_rules.patterns else None)
+
+    def read_bytes(self, path: Path) -> bytes:
+        return (self._root / path).read_bytes()
+
+    @contextlib.contextmanager
+    def open_buffer(self, path: Path, limit: Optional[int]=None) -> Iterator[Union[bytes, mmap.mmap]]:
+        """Map the file in memory: it is not copied, and only the pages that are looked at are read"""
+        with (self._root / path).open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if limit is not None:
+                size = min(size, limit)
+            if size == 0:
+                # Empty files cannot be mapped
+                yield b""
+                return
+            buffer = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            try:
+                yield buffer
+            finally:
+                buffer.close()
+
+
+class ArchiveSourceTree(SourceTree):
+    """
+    Source tree read by streaming the members of an archive, without extracting it.
+    Only the content of the files selected by wants_content is kept (in memory), up to content_limit bytes,
+    of all other files only the name is recorded.
+    The members are accounted to guard, which stops the stream when the archive breaks a limit.
+    """
+    def __init__(self, archive_path: Path, wants_content: Callable[[str], bool], use_commands: bool=True, prune_rules: PruneRules=NO_PRUNING, content_limit: Callable[[str], Optional[int]]=_no_limit, guard: Optional[LimitGuard]=None):
+        self._root_name = None
+        self._use_commands = use_commands
+        self._prune_rules = prune_rules
+        self._inventory = FileInventory()
+        self._contents: Dict[PurePosixPath, bytes] = {}
+        self._wants_content = wants_content
+        self._content_limit = content_limit
+        self._guard = guard
+
+        if zipfile.is_zipfile(str(archive_path)):
+            self._read_zip(archive_path)
+        else:
+            self._read_tar(archive_path)
+        if self._root_name is None:
+            raise Exception("Archive '{}' is empty".format(archive_path))
+        self._inventory.finish()
+
+    @property
+    def name(self) -> str:
+        return self._root_name
+
+    def _build_inventory(self) -> FileInventory:
+        return self._inventory
+
+    def _add_member(self, name: str, is_dir: bool, size: int) -> Optional[PurePosixPath]:
+        """Add a member to the inventory, and return its path if its content must be read"""
+        parts = tuple(p for p in PurePosixPath(name).parts if p not in ("", ".", "/"))
+        if not parts:
+            return None
+        if self._root_name is None:
+            self._root_name = parts[0]
+        elif parts[0] != self._root_name:
+            raise Exception("Don't know how to handle archives (yet) that extract more than one file")
+        parts = parts[1:]
+        if not parts:
+            return None
+        if is_dir:
+            self._inventory.add_dir(parts)
+            return None
+        if self._guard is not None:
+            self._guard.add_file(size)
+        self._inventory.add_file(parts, size)
+        if not self._wants_content(parts[-1]):
+            return None
+        path = PurePosixPath(*parts)
+        if self._prune_rules.is_pruned(path.parent):
+            return None
+        return path
+
+    def _read_tar(self, archive_path: Path) -> None:
+        # Stream mode: the members are visited in archive order, the archive is never seeked
+        with open_tar_stream(archive_path, use_commands=self._use_commands) as tar:
+            for member in tar:
+                path = self._add_member(member.name, member.isdir(), member.size)
+                if path and member.isfile():
+                    self._contents[path] = tar.extractfile(member).read(self._content_limit(path.name))
+
+    def _read_zip(self, archive_path: Path) -> None:
+        with zipfile.ZipFile(str(archive_path)) as zip:
+            for info in zip.infolist():
+                path = self._add_member(info.filename, info.is_dir(), info.file_size)
+                if path:
+                    limit = self._content_limit(path.name)
+                    with zip.open(info) as f:
+                        self._contents[path] = f.read(-1 if limit is None else limit)
+
+    def read_bytes(self, path: Path) -> bytes:
+        try:
+            return self._contents[PurePosixPath(path.as_posix())]
+        except KeyError:
+            raise FileNotFoundError("'{}' has not been read from the archive".format(path))
+
+
+class GitError(Exception):
+    pass
+
+
+def _git(repository: Path, *args: str, input: Optional[bytes]=None) -> bytes:
+    try:
+        result = subprocess.run(("git", "-C", str(repository)) + args, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise GitError("Cannot run git: {}".format(e)) from e
+    if result.returncode != 0:
+        raise GitError("git {} failed: {}".format(" ".join(args), result.stderr.decode(errors="replace").strip()))
+    return result.stdout
+
+
+def resolve_git_commit(repository: Path, ref: str) -> str:
+    """Return the commit id of a ref (tag, branch or commit) of a git repository"""
+    return _git(repository, "rev-parse", "--verify", "--end-of-options", ref + "^{commit}").decode().strip()
+
+
+class GitSourceTree(SourceTree):
+    """
+    Source tree of a commit of a git repository, read from the object database without checkout.
+    The inventory is built from the tree entries (git ls-tree), only the blobs selected by wants_content
+    are read (by a single git cat-file --batch), and only their first content_limit bytes are kept.
+    """
+    SYMLINK_MODE = "120000"
+
+    def __init__(self, repository: Path, commit: str, name: str, wants_content: Callable[[str], bool], prune_rules: PruneRules=NO_PRUNING, content_limit: Callable[[str], Optional[int]]=_no_limit, guard: Optional[LimitGuard]=None):
+        self._name = name
+        self._prune_rules = prune_rules
+        self._inventory = FileInventory()
+        self._contents: Dict[PurePosixPath, bytes] = {}
+
+        wanted: Dict[str, List[PurePosixPath]] = {}
+        for entry in _git(repository, "ls-tree", "-r", "-t", "-z", "--long", commit).split(b"\0"):
+            if not entry:
+                continue
+            meta, _, name_bytes = entry.partition(b"\t")
+            mode, kind, object_id, size = meta.decode().split()
+            parts = PurePosixPath(os.fsdecode(name_bytes)).parts
+            if kind in ("tree", "commit"):
+                # Submodules are empty directories, as in a checkout
+                self._inventory.add_dir(parts)
+                continue
+            if guard is not None:
+                guard.add_file(int(size))
+            self._inventory.add_file(parts, int(size))
+            if mode != self.SYMLINK_MODE and wants_content(parts[-1]):
+                path = PurePosixPath(*parts)
+                if not prune_rules.is_pruned(path.parent):
+                    wanted.setdefault(object_id, []).append(path)
+        self._inventory.finish()
+
+        if wanted:
+            self._read_blobs(repository, wanted, content_limit)
+
+    def _read_blobs(self, repository: Path, wanted: Dict[str, List[PurePosixPath]], content_limit: Callable[[str], Optional[int]]) -> None:
+        output = _git(repository, "cat-file", "--batch", input="".join(object_id + "\n" for object_id in wanted).encode())
+        offset = 0
+        for object_id, paths in wanted.items():
+            header_end = output.index(b"\n", offset)
+            header = output[offset:header_end].decode().split()
+            if len(header) != 3 or header[0] != object_id:
+                raise GitError("Unexpected output of git cat-file for '{}': '{}'".format(object_id, " ".join(header)))
+            size = int(header[2])
+            content = output[header_end + 1:header_end + 1 + size]
+            offset = header_end + 1 + size + 1
+            for path in paths:
+                limit = content_limit(path.name)
+                self._contents[path] = content if limit is None or size <= limit else content[:limit]
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def _build_inventory(self) -> FileInventory:
+        return self._inventory
+
+    def read_bytes(self, path: Path) -> bytes:
+        try:
+            return self._contents[PurePosixPath(path.as_posix())]
+        except KeyError:
+            raise FileNotFoundError("'{}' has not been read from the repository".format(path))
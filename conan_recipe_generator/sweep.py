@@ -0,0 +1,162 @@
+# Generate one recipe for many versions of a project
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import dataclasses
+from pathlib import Path
+import sys
+from typing import List, Optional, Sequence, TextIO, Tuple
+
+from .batch import BatchEntry, BatchResult, _error_message, _run_entries
+from .detect_properties import DetectorOptions
+from .metrics import Metrics
+from .pipeline import detect_recipe_properties
+from .properties import ConanRecipeProperties, ReleaseProperties
+
+
+VERSION_PLACEHOLDER = "{version}"
+
+
+@dataclasses.dataclass(frozen=True)
+class VersionChange(object):
+    """A property that differs between two consecutive versions"""
+    old_version: str
+    new_version: str
+    what: str
+    old: str
+    new: str
+
+    def __str__(self) -> str:
+        return "{} changed from {} to {}: {} -> {}".format(self.what, self.old_version, self.new_version, self.old, self.new)
+
+
+@dataclasses.dataclass(frozen=True)
+class SweepResult(object):
+    versions: Tuple[str, ...]
+    # The result of every version, in the order of versions
+    results: Tuple[BatchResult, ...]
+    # The merged properties, None if no version was detected
+    properties: Optional[ConanRecipeProperties]
+    changes: Tuple[VersionChange, ...]
+
+    @property
+    def success(self) -> bool:
+        return all(result.success for result in self.results)
+
+
+def parse_versions(text: str) -> Tuple[str, ...]:
+    """Split a comma separated list of versions"""
+    versions = tuple(version.strip() for version in text.split(",") if version.strip())
+    if not versions:
+        raise ValueError("no versions")
+    duplicates = sorted(set(version for version in versions if versions.count(version) > 1))
+    if duplicates:
+        raise ValueError("duplicate versions: {}".format(", ".join(duplicates)))
+    return versions
+
+
+def version_url(url_pattern: str, version: str) -> str:
+    return url_pattern.replace(VERSION_PLACEHOLDER, version)
+
+
+def _detect_job(entry: BatchEntry, workpath: Path, options: Optional[DetectorOptions]) -> BatchResult:
+    metrics = Metrics()
+    try:
+        props = detect_recipe_properties(workpath=workpath, download_url=entry.url, download_sha256=entry.sha256, options=options, metrics=metrics)
+        return BatchResult(entry=entry, properties=props, metrics=metrics.to_dict())
+    except Exception as e:
+        return BatchResult(entry=entry, error=_error_message(e), metrics=metrics.to_dict())
+
+
+def _build_systems(props: ConanRecipeProperties) -> str:
+    names = [field.name for field in dataclasses.fields(props.build_systems) if field.name != "path" and getattr(props.build_systems, field.name)]
+    return ", ".join(names) or "none"
+
+
+def _license_files(props: ConanRecipeProperties) -> str:
+    return ", ".join(sorted(Path(path).as_posix() for path in props.package.license_paths)) or "none"
+
+
+def _license_texts(props: ConanRecipeProperties) -> str:
+    """The (shortened) digests of the license files: renaming a license file does not change them, editing it does"""
+    return ", ".join(sorted(set(digest[:12] for digest in props.package.license_digests.values()))) or "none"
+
+
+def version_changes(releases: Sequence[Tuple[str, ConanRecipeProperties]]) -> List[VersionChange]:
+    """Compare the name, build systems, license files and license texts of consecutive versions"""
+    changes = []
+    aspects = (
+        ("name", lambda props: props.name),
+        ("build system", _build_systems),
+        ("license files", _license_files),
+        ("license", _license_texts),
+    )
+    for (old_version, old), (new_version, new) in zip(releases, releases[1:]):
+        for what, describe in aspects:
+            if describe(old) != describe(new):
+                changes.append(VersionChange(old_version=old_version, new_version=new_version, what=what, old=describe(old), new=describe(new)))
+    return changes
+
+
+def merge_releases(releases: Sequence[Tuple[str, ConanRecipeProperties]]) -> ConanRecipeProperties:
+    """
+    Merge the properties of the versions of a project into the properties of a single recipe.
+    The last version is the reference: the recipe gets its build systems and license files, and lists all versions.
+    """
+    version, reference = releases[-1]
+    return dataclasses.replace(
+        reference,
+        version=version,
+        releases=tuple(ReleaseProperties(version=version, download_url=props.download_url, download_sha256=props.download_sha256) for version, props in releases),
+        # The top directory of every version must be found by the recipe
+        package=dataclasses.replace(reference.package, glob_rename=any(props.package.glob_rename for _, props in releases)),
+    )
+
+
+def run_sweep(url_pattern: str, versions: Sequence[str], workpath: Path, jobs: Optional[int]=None, options: Optional[DetectorOptions]=None, downloads: int=4) -> SweepResult:
+    """
+    Download and detect the versions concurrently, with the same pool of downloads and worker processes as the batch mode.
+    url_pattern contains '{version}', which is replaced by every version.
+    """
+    versions = tuple(versions)
+    entries = [BatchEntry(url=version_url(url_pattern, version)) for version in versions]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = asyncio.run(_run_entries(entries, workpath, options, executor, downloads, job=_detect_job))
+    releases = [(version, result.properties) for version, result in zip(versions, results) if result.success]
+    for version, props in releases:
+        if props.version != version:
+            print("Warning: detected version '{}' of version '{}'".format(props.version, version), file=sys.stderr)
+    return SweepResult(
+        versions=versions,
+        results=tuple(results),
+        properties=merge_releases(releases) if releases else None,
+        changes=tuple(version_changes(releases)),
+    )
+
+
+def print_sweep_summary(sweep: SweepResult, file: TextIO=sys.stdout) -> None:
+    nb_failed = sum(1 for result in sweep.results if not result.success)
+    print("Summary: {} versions detected, {} failed".format(len(sweep.results) - nb_failed, nb_failed), file=file)
+    for version, result in zip(sweep.versions, sweep.results):
+        if result.success:
+            print("  OK     {} ({})".format(version, result.entry.url), file=file)
+        else:
+            print("  FAILED {} ({}): {}".format(version, result.entry.url, result.error), file=file)
+    if sweep.changes:
+        print("Changes between versions:", file=file)
+        for change in sweep.changes:
+            print("  {}".format(change), file=file)
@@ -16,11 +16,12 @@
 
 import dataclasses
 from pathlib import Path
-from typing import Optional, Tuple, Union
+from typing import Optional
 
-from jinja2 import Environment, FileSystemLoader, StrictUndefined
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, StrictUndefined
 
 from .extensions import ConditionalIndentationExtension
+from ..metrics import Metrics
 from ..properties import ConanRecipeProperties
 
 
@@ -31,10 +32,19 @@ def global_optlen(d):
 class ConanRecipeGenerator(object):
     TEMPLATE_DIR = Path(__file__).resolve().parent / "files"
 
-    def __init__(self):
+    def __init__(self, bytecode_cache_path: Optional[Path]=None):
         self._loader = FileSystemLoader(searchpath=self.TEMPLATE_DIR)
+        # The bytecode cache stores compiled templates by the checksum of their source,
+        # so later runs skip parsing and compiling of unmodified templates.
+        self._bytecode_cache = None
+        if bytecode_cache_path is not None:
+            bytecode_cache_path.mkdir(parents=True, exist_ok=True)
+            self._bytecode_cache = FileSystemBytecodeCache(directory=str(bytecode_cache_path))
         self._environment = Environment(
             loader=self._loader,
+            bytecode_cache=self._bytecode_cache,
+            # The templates are part of the package: do not check them for changes on every use
+            auto_reload=False,
             undefined=StrictUndefined,
             extensions=(
                 ConditionalIndentationExtension,
@@ -53,6 +63,11 @@ class ConanRecipeGenerator(object):
             "optlen": global_optlen,
         })
 
+    def precompile(self) -> None:
+        """Compile all templates ahead of their use, filling the bytecode cache"""
+        for name in self._environment.list_templates():
+            self._environment.get_template(name)
+
     @staticmethod
     def props_to_context(props: ConanRecipeProperties):
         context = dataclasses.asdict(props)
@@ -60,9 +75,11 @@ class ConanRecipeGenerator(object):
         context.update({
             "generators": props.package.extra_generators.union(props.build_systems.generators),
         })
+        if not props.releases:
+            context["releases"] = [{"version": props.version, "download_url": props.download_url, "download_sha256": props.download_sha256}]
         return context
 
-    def generate(self, props: ConanRecipeProperties, target_path: Optional[Path]=None):
+    def generate(self, props: ConanRecipeProperties, target_path: Optional[Path]=None, metrics: Optional[Metrics]=None):
         if target_path is None:
             target_path = Path(props.name)
 
@@ -90,15 +107,21 @@ class ConanRecipeGenerator(object):
         else:
             files.append("all/test_package/test_package.c")
 
-        target_path.mkdir()
-        ctx = self.props_to_context(props)
-        for file in files:
-            file_path = target_path / file
-            file_path.parent.mkdir(parents=True, exist_ok=True)
+        if metrics is None:
+            metrics = Metrics()
+        with metrics.phase("render") as phase:
+            target_path.mkdir()
+            ctx = self.props_to_context(props)
+            for file in files:
+                file_path = target_path / file
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+
+                template = self._environment.get_template(file)
+                with file_path.open("w") as f:
+                    template.stream(ctx).dump(f)
+                phase.files += 1
+                phase.bytes_written += file_path.stat().st_size
 
-            template = self._environment.get_template(file)
-            template.stream(ctx).dump((target_path / file).open("w"))
-        
         return target_path
 
 
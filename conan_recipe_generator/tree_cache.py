@@ -0,0 +1,172 @@
+# Cache of extracted source archives, with least recently used eviction
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Callable, List, Optional, Tuple
+
+from .locking import FileLock
+
+
+def tree_size(path: Path) -> int:
+    size = 0
+    for root, dirs, files in os.walk(str(path)):
+        for file in files:
+            try:
+                size += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class CachedTree(object):
+    """
+    An entry of the cache, in use by this process.
+    The entry is not evicted before it is released.
+    """
+    def __init__(self, path: Path, lock: FileLock, extracted: bool, size: int=0):
+        self.path = path
+        self.extracted = extracted
+        # Size of the tree, only known when it has just been extracted
+        self.size = size
+        self._lock = lock
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self) -> "CachedTree":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
+
+
+class ExtractedTreeCache(object):
+    """
+    Extracted archives, stored by the sha256 digest of their archive.
+    Every entry has a metadata file next to it, whose modification time records when the entry was last used.
+    When the total size of all entries exceeds the quota, the least recently used entries are removed.
+
+    Every entry has a lock: users of an entry hold it shared, it is held exclusively while extracting or evicting.
+    """
+    def __init__(self, path: Path, quota: Optional[int]=None):
+        self._path = path
+        self._quota = quota
+
+    def _entry_path(self, digest: str) -> Path:
+        return self._path / digest
+
+    def _meta_path(self, digest: str) -> Path:
+        return self._path / (digest + ".json")
+
+    def _lock_path(self, digest: str) -> Path:
+        return self._path / "locks" / (digest + ".lock")
+
+    def _lookup(self, digest: str) -> Optional[Path]:
+        entry_path = self._entry_path(digest)
+        meta_path = self._meta_path(digest)
+        if not meta_path.exists() or not entry_path.is_dir():
+            return None
+        os.utime(str(meta_path))
+        return entry_path
+
+    def open(self, digest: str, extract: Callable[[Path], None], tmp_dir: Optional[Path]=None) -> CachedTree:
+        """
+        Return the entry of digest.
+        If it does not exist, it is extracted by calling extract with a (temporary) destination directory.
+        """
+        lock = FileLock(self._lock_path(digest))
+        lock.acquire(shared=True)
+        try:
+            entry_path = self._lookup(digest)
+            if entry_path is not None:
+                return CachedTree(entry_path, lock, extracted=False)
+
+            lock.acquire(shared=False)
+            # Another process might have extracted the archive while waiting for the exclusive lock
+            entry_path = self._lookup(digest)
+            extracted = entry_path is None
+            size = 0
+            if extracted:
+                entry_path, size = self._add(digest, extract, tmp_dir)
+            lock.acquire(shared=True)
+        except BaseException:
+            lock.release()
+            raise
+        if extracted:
+            self.evict(keep=digest)
+        return CachedTree(entry_path, lock, extracted=extracted, size=size)
+
+    def _add(self, digest: str, extract: Callable[[Path], None], tmp_dir: Optional[Path]) -> Tuple[Path, int]:
+        self._path.mkdir(parents=True, exist_ok=True)
+        tmp_path = Path(tempfile.mkdtemp(dir=str(tmp_dir or self._path), prefix="tmp-"))
+        try:
+            extract(tmp_path)
+            size = tree_size(tmp_path)
+            entry_path = self._entry_path(digest)
+            shutil.rmtree(str(entry_path), ignore_errors=True)
+            os.replace(str(tmp_path), str(entry_path))
+        except BaseException:
+            shutil.rmtree(str(tmp_path), ignore_errors=True)
+            raise
+        with self._meta_path(digest).open("w") as f:
+            json.dump({"size": size}, f)
+        return entry_path, size
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """Return (last use, size, digest) of all entries"""
+        entries = []
+        for meta_path in self._path.glob("*.json"):
+            try:
+                last_used = meta_path.stat().st_mtime
+                with meta_path.open() as f:
+                    size = int(json.load(f)["size"])
+            except (IOError, ValueError, KeyError, TypeError):
+                continue
+            entries.append((last_used, size, meta_path.stem))
+        return entries
+
+    def evict(self, keep: Optional[str]=None) -> None:
+        if self._quota is None:
+            return
+        with FileLock(self._path / "locks" / "evict.lock"):
+            entries = self._entries()
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for _, size, digest in entries:
+                if total <= self._quota:
+                    break
+                if digest == keep:
+                    continue
+                lock = FileLock(self._lock_path(digest))
+                # Entries in use by other processes are skipped
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    self._remove(digest)
+                finally:
+                    lock.release()
+                total -= size
+
+    def _remove(self, digest: str) -> None:
+        try:
+            self._meta_path(digest).unlink()
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(str(self._entry_path(digest)), ignore_errors=True)
@@ -0,0 +1,78 @@
+# Private work directories of concurrently running jobs
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
+from .locking import FileLock
+
+
+class JobWorkspace(object):
+    """
+    Private directory of one job, below <work>/jobs.
+    The job holds a lock in its directory while running,
+    such that directories of killed jobs can be told apart from those of running jobs.
+    """
+    LOCK_NAME = ".lock"
+    STALE_AGE = 60
+
+    def __init__(self, workpath: Path):
+        jobs_path = workpath / "jobs"
+        jobs_path.mkdir(parents=True, exist_ok=True)
+        self.remove_stale(jobs_path)
+        self._path = Path(tempfile.mkdtemp(dir=str(jobs_path), prefix="job-"))
+        self._lock = FileLock(self._path / self.LOCK_NAME)
+        self._lock.acquire()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def close(self) -> None:
+        if not self._lock.locked:
+            return
+        shutil.rmtree(str(self._path), ignore_errors=True)
+        self._lock.release()
+
+    def __enter__(self) -> "JobWorkspace":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @classmethod
+    def remove_stale(cls, jobs_path: Path) -> None:
+        """Remove the directories of jobs that were killed"""
+        now = time.time()
+        for job_path in jobs_path.glob("job-*"):
+            try:
+                # Skip young directories, whose job might not have taken its lock yet
+                if now - job_path.stat().st_mtime < cls.STALE_AGE:
+                    continue
+            except OSError:
+                continue
+            lock = FileLock(job_path / cls.LOCK_NAME)
+            try:
+                if not lock.acquire(blocking=False):
+                    continue
+            except OSError:
+                continue
+            try:
+                shutil.rmtree(str(job_path), ignore_errors=True)
+            finally:
+                lock.release()
@@ -18,7 +18,6 @@ setup(
     },
     include_package_data=True,
     install_requires=[
-        "conan>=1.28.0",
         "jinja2>=2.9",
     ],
     author="Anonymous Maarten",
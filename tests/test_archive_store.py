@@ -0,0 +1,62 @@
+# Tests of the store of downloaded archives
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+
+import pytest
+
+from conan_recipe_generator.archive_store import ArchiveStore
+from conan_recipe_generator.fetch import DownloadError
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def release(tmp_path):
+    path = tmp_path / "foo-1.0.tar.gz"
+    path.write_bytes(b"first")
+    return path
+
+
+def test_known_url_is_not_downloaded_again(tmp_path, release):
+    store = ArchiveStore(tmp_path / "store")
+    path, digest = store.fetch(str(release), ".tar.gz")
+    assert digest == _sha256(b"first")
+    assert path.read_bytes() == b"first"
+    release.unlink()
+    assert store.fetch(str(release), ".tar.gz") == (path, digest)
+
+
+def test_changed_archive_replaces_indexed_digest(tmp_path, release):
+    store = ArchiveStore(tmp_path / "store")
+    old_path, _ = store.fetch(str(release), ".tar.gz")
+    # The object of the indexed digest is gone, and the archive at the url changed
+    old_path.unlink()
+    release.write_bytes(b"second")
+    path, digest = store.fetch(str(release), ".tar.gz")
+    assert digest == _sha256(b"second")
+    assert path.read_bytes() == b"second"
+    assert store.fetch(str(release), ".tar.gz") == (path, digest)
+
+
+def test_checksum_of_caller_is_enforced(tmp_path, release):
+    store = ArchiveStore(tmp_path / "store")
+    with pytest.raises(DownloadError):
+        store.fetch(str(release), ".tar.gz", sha256=_sha256(b"other"))
+    path, digest = store.fetch(str(release), ".tar.gz", sha256=_sha256(b"first").upper())
+    assert digest == _sha256(b"first")
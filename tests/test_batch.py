@@ -0,0 +1,40 @@
+# Tests of the batch mode
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+
+import pytest
+
+from conan_recipe_generator.batch import BatchEntry, read_manifest
+from conan_recipe_generator.main import main
+
+
+def test_read_manifest():
+    manifest = io.StringIO("# releases\nhttps://example.com/foo-1.0.tar.gz\n\n  https://example.com/bar-2.0.zip  abc123\n")
+    assert read_manifest(manifest) == [
+        BatchEntry(url="https://example.com/foo-1.0.tar.gz"),
+        BatchEntry(url="https://example.com/bar-2.0.zip", sha256="abc123"),
+    ]
+
+
+def test_malformed_manifest_is_a_usage_error(tmp_path, capsys, monkeypatch):
+    monkeypatch.setenv("CRG_CACHE", str(tmp_path / "work"))
+    manifest = tmp_path / "releases.txt"
+    manifest.write_text("https://example.com/foo-1.0.tar.gz\nhttps://example.com/bar-2.0.zip abc123 extra\n")
+    with pytest.raises(SystemExit) as excinfo:
+        main(["--batch", str(manifest)])
+    assert excinfo.value.code == 2
+    assert "manifest line 2" in capsys.readouterr().err
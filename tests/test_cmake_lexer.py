@@ -0,0 +1,102 @@
+# Tests of the lexer of CMake scripts
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+from conan_recipe_generator.cmake_lexer import CMakeCommandIndex, tokenize_cmake
+from conan_recipe_generator.script_parsers import parse_cmake_script
+
+
+def _commands(content: str):
+    return [(command.name, command.arguments, command.line) for command in tokenize_cmake(content)]
+
+
+def test_line_comments():
+    content = "# project(bad)\nproject(foo) # trailing (comment\n  # add_subdirectory(bad)\nadd_subdirectory(src)\n"
+    assert _commands(content) == [("project", ["foo"], 2), ("add_subdirectory", ["src"], 4)]
+
+
+def test_comments_inside_arguments():
+    assert _commands("project(foo # not ) an argument\n  VERSION 1.0)\n") == [("project", ["foo", "VERSION", "1.0"], 1)]
+
+
+def test_bracket_comments():
+    content = "#[[ project(bad)\n]] project(foo)\n#[==[ a ]] or ]=] does not close\nproject(bad) ]==]\nproject(bar #[[ ) ]] VERSION 2.0)\n"
+    assert _commands(content) == [("project", ["foo"], 2), ("project", ["bar", "VERSION", "2.0"], 5)]
+
+
+def test_bracket_arguments():
+    content = "set(A [[x ) \"y\" ${z}]] [=[\nline ]] #\n]=])\n"
+    assert _commands(content) == [("set", ["A", "x ) \"y\" ${z}", "line ]] #\n"], 1)]
+
+
+@pytest.mark.parametrize("content, arguments", [
+    ('set(A "a b" "c;d")', ["A", "a b", "c;d"]),
+    ('set(A "a \\"quoted\\" ) \\\\")', ["A", 'a "quoted" ) \\']),
+    ('set(A "tab\\tnewline\\n")', ["A", "tab\tnewline\n"]),
+    ('set(A "continued \\\nline")', ["A", "continued line"]),
+    ('set(A a\\ b \\(c\\) ${x}/y)', ["A", "a b", "(c)", "${x}/y"]),
+    ('set(A [a] x[=])', ["A", "[a]", "x[=]"]),
+])
+def test_quoted_and_escaped_arguments(content, arguments):
+    assert _commands(content) == [("set", arguments, 1)]
+
+
+def test_nested_parentheses():
+    content = "if((A AND (B OR C)) OR D)\n  message(\"(\")\nendif()\n"
+    assert _commands(content) == [("if", ["A", "AND", "B", "OR", "C", "OR", "D"], 1), ("message", ["("], 2), ("endif", [], 3)]
+
+
+def test_command_names_are_case_insensitive():
+    index = CMakeCommandIndex.from_content("PROJECT(foo)\nProject(bar)\n")
+    assert [command.arguments for command in index.commands("Project")] == [["foo"], ["bar"]]
+
+
+@pytest.mark.parametrize("content", [
+    "project(foo)\nset(A \"unterminated\n",
+    "project(foo)\nset(A [[unterminated\n",
+    "project(foo)\nset(A (B)\n",
+    "project(foo)\nset(A\\",
+])
+def test_unterminated_input(content):
+    assert _commands(content) == [("project", ["foo"], 1)]
+
+
+def test_project_keywords():
+    content = """cmake_minimum_required(VERSION 3.12)
+project(
+    foo  # the name
+    VERSION 1.2.3
+    DESCRIPTION "A library (of things)"
+    HOMEPAGE_URL [[https://example.com/foo]]
+    LANGUAGES C CXX
+)
+add_subdirectory("src")
+"""
+    parsed = parse_cmake_script(content)
+    assert parsed.names == ["foo"]
+    assert parsed.versions == ["1.2.3"]
+    assert parsed.descriptions == ["A library (of things)"]
+    assert parsed.homepages == ["https://example.com/foo"]
+    assert parsed.subdirectories == ["src"]
+
+
+def test_project_without_keywords():
+    parsed = parse_cmake_script("project(foo C)\nproject()\n")
+    assert parsed.names == ["foo"]
+    assert parsed.versions == []
+    assert parsed.descriptions == []
+    assert parsed.homepages == []
@@ -0,0 +1,73 @@
+# Tests of the detection of the properties of source releases
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+import tarfile
+
+import pytest
+
+from conan_recipe_generator.decompress import CODECS
+from conan_recipe_generator.detect_properties import ConanPackageDetector, DetectorOptions, url_archive_extension
+from conan_recipe_generator.metrics import Metrics
+from conan_recipe_generator.scan_budget import ScanBudget
+
+
+def _make_tarball(tmp_path: Path, files) -> Path:
+    root = tmp_path / "src" / "foo-1.0"
+    for name, content in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(content)
+    archive_path = tmp_path / "foo-1.0.tar.gz"
+    with tarfile.open(str(archive_path), "w:gz") as tar:
+        tar.add(str(root), arcname=root.name)
+    return archive_path
+
+
+def _detect(tmp_path: Path, archive_path: Path, extract: bool, budget: ScanBudget=ScanBudget()) -> ConanPackageDetector:
+    options = DetectorOptions(extract=extract, parse_jobs=1, use_detection_cache=False, budget=budget)
+    workpath = tmp_path / ("work-extract" if extract else "work-stream")
+    with ConanPackageDetector(workpath=workpath, download_url=str(archive_path), download_sha256=None, options=options) as detector:
+        detector.detect()
+    return detector
+
+
+@pytest.mark.parametrize("files, with_cxx", [
+    ({"CMakeLists.txt": "project(foo C)\n", "foo.c": "", "tests/test.cpp": ""}, False),
+    ({"CMakeLists.txt": "project(foo CXX)\n", "foo.cpp": "", "tests/test.c": ""}, True),
+])
+def test_cxx_ignores_pruned_directories(tmp_path, files, with_cxx):
+    archive_path = _make_tarball(tmp_path, files)
+    extracted = _detect(tmp_path, archive_path, extract=True)
+    streamed = _detect(tmp_path, archive_path, extract=False)
+    assert extracted.detected_cpp is with_cxx
+    assert streamed.detected_cpp is with_cxx
+
+
+@pytest.mark.parametrize("extract", [True, False])
+def test_budget_hits_are_listed_in_metrics(tmp_path, extract):
+    archive_path = _make_tarball(tmp_path, {"CMakeLists.txt": "project(foo)\n" + "# padding\n" * 100, "src/CMakeLists.txt": "add_library(foo)\n"})
+    detector = _detect(tmp_path, archive_path, extract=extract, budget=ScanBudget(max_bytes=64))
+    parse = detector.metrics.get("parse")
+    assert parse.budget_hits == 1
+    assert parse.budget_hit_files == [{"path": "CMakeLists.txt", "reason": "only the first 64 of 1013 bytes are scanned"}]
+    # The list survives the round trip through the metrics of a batch job
+    assert Metrics.from_dict(detector.metrics.to_dict()).get("parse").budget_hit_files == parse.budget_hit_files
+
+
+def test_archive_extensions_match_codecs():
+    for codec in CODECS:
+        for suffix in codec.suffixes:
+            assert url_archive_extension("https://example.com/foo-1.0{}?download=1".format(suffix)) == suffix
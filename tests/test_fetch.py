@@ -0,0 +1,227 @@
+# Tests of the downloads, against a local http server
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+
+from conan_recipe_generator import fetch
+from conan_recipe_generator.fetch import Backoff, ConnectionPool, DownloadError, Downloader, DownloadSink, TransientDownloadError
+
+
+CONTENT = bytes(range(256)) * 1024
+ETAG = '"v1"'
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers every request with the next reply of the script of the server, and records the request headers"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        reply = self.server.script.pop(0)
+        reply(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def full(handler):
+    handler.send_response(200)
+    handler.send_header("Content-Length", str(len(CONTENT)))
+    handler.send_header("ETag", ETAG)
+    handler.end_headers()
+    handler.wfile.write(CONTENT)
+
+
+def dropped(handler):
+    """Announce the complete content, send a third of it and close the connection"""
+    handler.send_response(200)
+    handler.send_header("Content-Length", str(len(CONTENT)))
+    handler.send_header("ETag", ETAG)
+    handler.end_headers()
+    handler.wfile.write(CONTENT[:len(CONTENT) // 3])
+    handler.close_connection = True
+
+
+def full_then_close(handler):
+    """Send the complete content as if the connection stays open, and close it"""
+    full(handler)
+    handler.close_connection = True
+
+
+def partial(handler):
+    start = int(handler.headers["Range"][len("bytes="):].rstrip("-"))
+    handler.send_response(206)
+    handler.send_header("Content-Length", str(len(CONTENT) - start))
+    handler.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(CONTENT) - 1, len(CONTENT)))
+    handler.send_header("ETag", ETAG)
+    handler.end_headers()
+    handler.wfile.write(CONTENT[start:])
+
+
+def status(code):
+    def reply(handler):
+        handler.send_response(code)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+    return reply
+
+
+@pytest.fixture
+def server(monkeypatch):
+    for name in ("http_proxy", "HTTP_PROXY", "all_proxy", "ALL_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    httpd.script = []
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": .05}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """The upper bounds of the backoff delays, the waits themselves are skipped"""
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append(high)
+        return 0.
+    monkeypatch.setattr(fetch.random, "uniform", uniform)
+    return bounds
+
+
+def download(server, tmp_path, backoff=Backoff(retries=3, base=1., maximum=30.)):
+    downloader = Downloader(pool=ConnectionPool(), backoff=backoff)
+    path = tmp_path / "archive.tar.gz"
+    with path.open("wb") as f:
+        sink = DownloadSink(f)
+        downloader.download("http://127.0.0.1:{}/archive.tar.gz".format(server.server_port), sink)
+    return path, sink.hexdigest()
+
+
+def test_download(server, tmp_path, delays):
+    server.script = [full]
+    path, digest = download(server, tmp_path)
+    assert path.read_bytes() == CONTENT
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert "Range" not in server.requests[0]
+    assert delays == []
+
+
+def test_resume_after_dropped_connection(server, tmp_path, delays):
+    server.script = [dropped, partial]
+    path, digest = download(server, tmp_path)
+    assert path.read_bytes() == CONTENT
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert server.requests[1]["Range"] == "bytes={}-".format(len(CONTENT) // 3)
+    assert server.requests[1]["If-Range"] == ETAG
+    assert len(delays) == 1
+
+
+def test_resume_ignored_by_server(server, tmp_path, delays):
+    # The content changed (If-Range does not match), the server sends all of it
+    server.script = [dropped, full]
+    path, digest = download(server, tmp_path)
+    assert path.read_bytes() == CONTENT
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_retry_503_with_backoff(server, tmp_path, delays):
+    server.script = [status(503), status(503), full]
+    path, digest = download(server, tmp_path, backoff=Backoff(retries=3, base=.5, maximum=30.))
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert len(server.requests) == 3
+    # Exponentially growing bounds
+    assert delays == [.5, 1.]
+
+
+def test_retry_gives_up(server, tmp_path, delays):
+    server.script = [status(503)] * 3
+    with pytest.raises(DownloadError) as excinfo:
+        download(server, tmp_path, backoff=Backoff(retries=2, base=1., maximum=1.5))
+    assert "503" in str(excinfo.value)
+    assert len(server.requests) == 3
+    assert delays == [1., 1.5]
+
+
+def test_range_not_satisfiable_restarts(server, tmp_path, delays):
+    server.script = [dropped, status(416), full]
+    path, digest = download(server, tmp_path)
+    assert path.read_bytes() == CONTENT
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert "Range" in server.requests[1]
+    assert "Range" not in server.requests[2]
+
+
+def test_not_found_is_not_retried(server, tmp_path, delays):
+    server.script = [status(404)]
+    with pytest.raises(DownloadError) as excinfo:
+        download(server, tmp_path)
+    assert not isinstance(excinfo.value, TransientDownloadError)
+    assert "404" in str(excinfo.value)
+    assert len(server.requests) == 1
+    assert delays == []
+
+
+def test_backoff_delay_bounds():
+    backoff = Backoff(retries=10, base=2., maximum=10.)
+    for attempt in range(10):
+        assert 0 <= backoff.delay(attempt) <= min(10., 2. * 2 ** attempt)
+
+
+def test_missing_file_is_not_retried(tmp_path, delays):
+    downloader = Downloader(pool=ConnectionPool(), backoff=Backoff(retries=3, base=1., maximum=30.))
+    with (tmp_path / "archive.tar.gz").open("wb") as f:
+        with pytest.raises(DownloadError) as excinfo:
+            downloader.download((tmp_path / "missing.tar.gz").as_uri(), DownloadSink(f))
+    assert not isinstance(excinfo.value, TransientDownloadError)
+    assert delays == []
+
+
+class FailingPool(ConnectionPool):
+    """A pool of one connection per host, that cannot make new connections once failing is set"""
+    failing = False
+
+    def _connect(self, scheme, netloc):
+        if self.failing:
+            raise OSError("no route to host")
+        return super()._connect(scheme, netloc)
+
+
+def test_failed_reconnect_releases_slot_once(server, tmp_path, delays):
+    server.script = [full_then_close, full]
+    pool = FailingPool(max_per_host=1)
+    downloader = Downloader(pool=pool, backoff=Backoff(retries=0, base=1., maximum=1.))
+    url = "http://127.0.0.1:{}/archive.tar.gz".format(server.server_port)
+    with (tmp_path / "archive.tar.gz").open("wb") as f:
+        downloader.download(url, DownloadSink(f))
+    # The idle connection was closed by the server, and no new connection can be made
+    pool.failing = True
+    with (tmp_path / "archive.tar.gz").open("wb") as f:
+        with pytest.raises(OSError, match="no route to host"):
+            downloader.download(url, DownloadSink(f))
+    # The only slot is available again
+    pool.failing = False
+    with (tmp_path / "archive.tar.gz").open("wb") as f:
+        sink = DownloadSink(f)
+        downloader.download(url, sink)
+    assert sink.hexdigest() == hashlib.sha256(CONTENT).hexdigest()
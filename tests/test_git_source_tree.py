@@ -0,0 +1,92 @@
+# Tests of source trees read from a git repository
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+import shutil
+import subprocess
+
+import pytest
+
+from conan_recipe_generator.source_tree import GitError, GitSourceTree, resolve_git_commit
+
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+CMAKE = "project(foo VERSION 1.2.3)\n" + "# padding\n" * 20
+
+
+def _git(repository: Path, *args: str) -> str:
+    command = ("git", "-C", str(repository), "-c", "user.name=test", "-c", "user.email=test@example.com") + args
+    return subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout.decode().strip()
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = tmp_path / "repository"
+    files = {
+        "CMakeLists.txt": CMAKE,
+        "my lib/CMakeLists.txt": "add_library(foo foo.c)\n",
+        "my lib/foo bar.c": "int foo;\n",
+        # Same content, different limit
+        "docs/LICENSE": CMAKE,
+    }
+    for name, content in files.items():
+        (repository / name).parent.mkdir(parents=True, exist_ok=True)
+        (repository / name).write_text(content)
+    _git(repository, "init", "-q")
+    _git(repository, "add", ".")
+    # A submodule: a commit entry in the tree, without checkout
+    _git(repository, "update-index", "--add", "--cacheinfo", "160000,{},vendor/sub module".format("1" * 40))
+    _git(repository, "commit", "-q", "-m", "Release")
+    _git(repository, "tag", "v1.2.3")
+    return repository
+
+
+def _tree(repository: Path, limits=None) -> GitSourceTree:
+    limits = limits or {}
+    return GitSourceTree(repository, resolve_git_commit(repository, "v1.2.3"), "foo", wants_content=lambda name: name in ("CMakeLists.txt", "LICENSE"),
+                         content_limit=limits.get)
+
+
+def test_names_with_spaces(repository):
+    tree = _tree(repository)
+    walked = {path.as_posix(): sorted(files) for path, files in tree.walk()}
+    assert walked["my lib"] == ["CMakeLists.txt", "foo bar.c"]
+    assert tree.inventory.size(Path("my lib/foo bar.c")) == len("int foo;\n")
+    assert tree.read_text(Path("my lib/CMakeLists.txt")) == "add_library(foo foo.c)\n"
+    with pytest.raises(FileNotFoundError):
+        tree.read_bytes(Path("my lib/foo bar.c"))
+
+
+def test_submodules_are_empty_directories(repository):
+    tree = _tree(repository)
+    walked = {path.as_posix(): files for path, files in tree.walk()}
+    assert walked["vendor/sub module"] == []
+    assert tree.exists(Path("vendor/sub module"))
+
+
+def test_content_limit(repository):
+    tree = _tree(repository, {"CMakeLists.txt": 16})
+    assert tree.read_text(Path("CMakeLists.txt")) == CMAKE[:16]
+    # The limit is per file name: a file with the same blob is read completely
+    assert tree.read_text(Path("docs/LICENSE")) == CMAKE
+    # The inventory has the size of the blob
+    assert tree.inventory.size(Path("CMakeLists.txt")) == len(CMAKE)
+
+
+def test_unknown_ref(repository):
+    with pytest.raises(GitError):
+        resolve_git_commit(repository, "v0.0")
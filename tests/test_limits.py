@@ -0,0 +1,101 @@
+# Tests of the limits on the size of source releases
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+from pathlib import Path
+import tarfile
+import zipfile
+
+import pytest
+
+from conan_recipe_generator.decompress import extract_archive
+from conan_recipe_generator.detect_properties import ConanPackageDetector, DetectorOptions
+from conan_recipe_generator.limits import LimitExceeded, LimitGuard, ResourceLimits
+
+
+def _make_archive(tmp_path: Path, kind: str, files) -> Path:
+    """An archive with the members of files (name, size) in order, all zeros"""
+    if kind == "zip":
+        archive_path = tmp_path / "foo-1.0.zip"
+        with zipfile.ZipFile(str(archive_path), "w", compression=zipfile.ZIP_DEFLATED) as zip:
+            for name, size in files:
+                zip.writestr("foo-1.0/" + name, bytes(size))
+    else:
+        archive_path = tmp_path / "foo-1.0.tar.gz"
+        with tarfile.open(str(archive_path), "w:gz") as tar:
+            for name, size in files:
+                info = tarfile.TarInfo("foo-1.0/" + name)
+                info.size = size
+                tar.addfile(info, io.BytesIO(bytes(size)))
+    return archive_path
+
+
+def _extract(tmp_path: Path, archive_path: Path, limits: ResourceLimits) -> Path:
+    destination = tmp_path / "extracted"
+    guard = LimitGuard(limits, archive_path.name, archive_size=archive_path.stat().st_size)
+    extract_archive(archive_path, destination, use_commands=False, guard=guard)
+    return destination
+
+
+@pytest.fixture
+def ratio_from_start(monkeypatch):
+    # Check the ratio of small archives too
+    monkeypatch.setattr(ResourceLimits, "RATIO_MIN_BYTES", 0)
+
+
+@pytest.mark.parametrize("kind", ["tar", "zip"])
+@pytest.mark.parametrize("files, limits, message", [
+    ([("CMakeLists.txt", 10), ("big.bin", 4000)], ResourceLimits(max_extracted_bytes=1000), "max_extracted_bytes"),
+    ([("file{}".format(i), 1) for i in range(5)], ResourceLimits(max_files=3), "max_files"),
+    ([("zeros.bin", 1 << 20)], ResourceLimits(max_compression_ratio=10.), "max_compression_ratio"),
+])
+def test_limit_exceeded(tmp_path, ratio_from_start, kind, files, limits, message):
+    archive_path = _make_archive(tmp_path, kind, files)
+    with pytest.raises(LimitExceeded, match=message):
+        _extract(tmp_path, archive_path, limits)
+
+
+@pytest.mark.parametrize("kind", ["tar", "zip"])
+def test_within_limits(tmp_path, kind):
+    archive_path = _make_archive(tmp_path, kind, [("CMakeLists.txt", 10), ("big.bin", 4000)])
+    destination = _extract(tmp_path, archive_path, ResourceLimits(max_extracted_bytes=4010, max_files=2))
+    assert (destination / "foo-1.0" / "big.bin").stat().st_size == 4000
+
+
+def test_zip_is_checked_before_extraction(tmp_path):
+    archive_path = _make_archive(tmp_path, "zip", [("CMakeLists.txt", 10), ("big.bin", 4000)])
+    with pytest.raises(LimitExceeded):
+        _extract(tmp_path, archive_path, ResourceLimits(max_extracted_bytes=1000))
+    assert not (tmp_path / "extracted" / "foo-1.0").exists()
+
+
+def test_tar_is_checked_per_member(tmp_path):
+    # A tarball has no index: members before the one that breaks the limit are already written
+    archive_path = _make_archive(tmp_path, "tar", [("CMakeLists.txt", 10), ("big.bin", 4000)])
+    with pytest.raises(LimitExceeded):
+        _extract(tmp_path, archive_path, ResourceLimits(max_extracted_bytes=1000))
+    assert (tmp_path / "extracted" / "foo-1.0" / "CMakeLists.txt").exists()
+    assert not (tmp_path / "extracted" / "foo-1.0" / "big.bin").exists()
+
+
+@pytest.mark.parametrize("kind", ["tar", "zip"])
+@pytest.mark.parametrize("extract", [True, False])
+def test_detector_aborts(tmp_path, kind, extract):
+    archive_path = _make_archive(tmp_path, kind, [("file{}".format(i), 1) for i in range(5)])
+    options = DetectorOptions(extract=extract, parse_jobs=1, use_detection_cache=False, limits=ResourceLimits(max_files=3))
+    with pytest.raises(LimitExceeded, match="max_files"):
+        with ConanPackageDetector(workpath=tmp_path / "work", download_url=str(archive_path), download_sha256=None, options=options) as detector:
+            detector.detect()
@@ -0,0 +1,92 @@
+# Tests of the cache of parse results
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import dataclasses
+from pathlib import Path
+import tarfile
+
+from conan_recipe_generator import detect_properties
+from conan_recipe_generator.detect_properties import ConanPackageDetector, DetectorOptions
+from conan_recipe_generator.detectors import BUILTIN_DETECTORS, DetectorRegistry
+from conan_recipe_generator.parse_cache import ParseCache, content_digest
+from conan_recipe_generator.script_parsers import ParsedScript
+
+
+FILES = {
+    "CMakeLists.txt": "project(foo VERSION 1.0)\nadd_subdirectory(src)\n",
+    "src/CMakeLists.txt": "add_library(foo foo.c)\n",
+    "LICENSE": "MIT License\n",
+}
+
+
+def _make_tarball(tmp_path: Path, version: str, files) -> Path:
+    root = tmp_path / "src" / "foo-{}".format(version)
+    for name, content in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(content)
+    archive_path = tmp_path / "foo-{}.tar.gz".format(version)
+    with tarfile.open(str(archive_path), "w:gz") as tar:
+        tar.add(str(root), arcname=root.name)
+    return archive_path
+
+
+def _parse(tmp_path: Path, version: str, files=FILES, registry=None):
+    """Detect a release in a shared work folder, return the parse phase and the detected names"""
+    archive_path = _make_tarball(tmp_path, version, files)
+    # Every release is a different archive: the detection cache misses, the parse cache is used
+    options = DetectorOptions(parse_jobs=1)
+    with ConanPackageDetector(workpath=tmp_path / "work", download_url=str(archive_path), download_sha256=None, options=options, registry=registry) as detector:
+        detector.detect()
+    return detector.metrics.get("parse"), detector
+
+
+def test_round_trip(tmp_path):
+    parsed = ParsedScript(names=["foo"], versions=["1.0"], subdirectories=["src"], content_digest="abc")
+    digest = content_digest(b"project(foo VERSION 1.0)")
+    cache = ParseCache(tmp_path / "parses.sqlite")
+    cache.save(digest, "cmake-1", parsed)
+    cache.close()
+    cache = ParseCache(tmp_path / "parses.sqlite")
+    assert cache.load(digest, "cmake-1") == parsed
+    assert cache.load(digest, "cmake-2") is None
+    assert cache.load(content_digest(b"project(bar)"), "cmake-1") is None
+    cache.close()
+
+
+def test_unchanged_files_are_not_parsed_again(tmp_path):
+    first, _ = _parse(tmp_path, "1.0")
+    assert (first.files, first.cache_hits) == (3, 0)
+    files = dict(FILES, **{"src/CMakeLists.txt": "add_library(foo foo.c bar.c)\n"})
+    second, detector = _parse(tmp_path, "1.1", files)
+    # Only the changed src/CMakeLists.txt is parsed
+    assert (second.files, second.cache_hits) == (3, 2)
+    assert {text.text for text in detector.detected_names} == {"foo"}
+    assert detector.detected_license_digests == {Path("LICENSE"): content_digest(FILES["LICENSE"].encode())}
+
+
+def test_changed_parser_key(tmp_path):
+    _parse(tmp_path, "1.0")
+    registry = DetectorRegistry(dataclasses.replace(detector, version=detector.version + 1) if detector.kind == "cmake" else detector for detector in BUILTIN_DETECTORS)
+    second, _ = _parse(tmp_path, "1.1", registry=registry)
+    # The cmake scripts are parsed again, only the license is found in the cache
+    assert second.cache_hits == 1
+
+
+def test_changed_detector_version(tmp_path, monkeypatch):
+    _parse(tmp_path, "1.0")
+    monkeypatch.setattr(detect_properties, "DETECTOR_VERSION", detect_properties.DETECTOR_VERSION + 1)
+    second, _ = _parse(tmp_path, "1.1")
+    assert second.cache_hits == 0
@@ -0,0 +1,39 @@
+# Tests of the parsers of build scripts
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+
+from conan_recipe_generator.script_parsers import parse_autoconf_script
+
+
+@pytest.mark.parametrize("content, name, version", [
+    (b"AC_INIT([foo], [1.0], [bugs@example.com], [foo-tar])\n", "foo-tar", "1.0"),
+    (b"AC_INIT([GNU Hello], [2.12])\n", "hello", "2.12"),
+    (b"dnl AC_INIT(bad, 0)\nAC_INIT([foo], [1.0])\n", "foo", "1.0"),
+    (b"# AC_INIT(bad, 0)\nAC_INIT([foo], [1.0])\n", "foo", "1.0"),
+    (b"AC_INIT([foo], dnl the version follows\n        [2.0])\n", "foo", "2.0"),
+    (b"AC_INIT([foo], [1.0]\nAM_INIT_AUTOMAKE([foreign])\nAC_OUTPUT\n", "foo", "1.0"),
+])
+def test_autoconf_init(content, name, version):
+    parsed = parse_autoconf_script(content)
+    assert parsed.names == [name]
+    assert parsed.versions == [version]
+
+
+def test_autoconf_computed_version():
+    parsed = parse_autoconf_script(b"AC_INIT([foo], m4_esyscmd([build-aux/git-version-gen .tarball-version]))\n")
+    assert parsed.names == ["foo"]
+    assert parsed.versions == []
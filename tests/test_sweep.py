@@ -0,0 +1,63 @@
+# Tests of the generation of one recipe for many versions
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from pathlib import Path
+import tarfile
+
+from conan_recipe_generator.detect_properties import DetectorOptions
+from conan_recipe_generator.sweep import parse_versions, run_sweep
+
+
+def _make_release(tmp_path: Path, version: str, files) -> None:
+    root = tmp_path / "src" / "foo-{}".format(version)
+    for name, content in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(content)
+    with tarfile.open(str(tmp_path / "foo-{}.tar.gz".format(version)), "w:gz") as tar:
+        tar.add(str(root), arcname=root.name)
+
+
+def _sweep(tmp_path: Path, versions):
+    options = DetectorOptions(parse_jobs=1)
+    return run_sweep(str(tmp_path / "foo-{version}.tar.gz"), parse_versions(versions), workpath=tmp_path / "work", jobs=1, options=options)
+
+
+def _changes(sweep):
+    return {change.what: (change.old_version, change.new_version) for change in sweep.changes}
+
+
+def test_sweep_lists_all_versions(tmp_path):
+    for version in ("1.0", "1.1"):
+        _make_release(tmp_path, version, {"CMakeLists.txt": "project(foo VERSION {})\n".format(version), "LICENSE": "MIT License\n"})
+    sweep = _sweep(tmp_path, "1.0,1.1,2.0")
+    assert [result.success for result in sweep.results] == [True, True, False]
+    assert [release.version for release in sweep.properties.releases] == ["1.0", "1.1"]
+    assert sweep.properties.version == "1.1"
+    assert sweep.changes == ()
+
+
+def test_sweep_reports_license_text_change(tmp_path):
+    cmake = "project(foo VERSION 1.0)\n"
+    _make_release(tmp_path, "1.2.3", {"CMakeLists.txt": cmake, "LICENSE": "MIT License\n\nPermission is hereby granted...\n"})
+    _make_release(tmp_path, "1.3.0", {"CMakeLists.txt": cmake, "LICENSE": "GNU GENERAL PUBLIC LICENSE\nVersion 3\n"})
+    assert _changes(_sweep(tmp_path, "1.2.3,1.3.0")) == {"license": ("1.2.3", "1.3.0")}
+
+
+def test_sweep_reports_build_system_and_license_file_change(tmp_path):
+    _make_release(tmp_path, "1.0", {"CMakeLists.txt": "project(foo VERSION 1.0)\n", "LICENSE": "MIT License\n"})
+    _make_release(tmp_path, "2.0", {"meson.build": "project('foo', 'c', version: '2.0')\n", "COPYING": "MIT License\n"})
+    # The license file is renamed, its text is unchanged
+    assert _changes(_sweep(tmp_path, "1.0,2.0")) == {"build system": ("1.0", "2.0"), "license files": ("1.0", "2.0")}
@@ -0,0 +1,105 @@
+# Tests of the cache of extracted archives
+# Copyright (C) 2020 Anonymous Maarten
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+from pathlib import Path
+
+from conan_recipe_generator.locking import FileLock
+from conan_recipe_generator.tree_cache import ExtractedTreeCache
+
+
+def _extract(size: int):
+    def extract(destination: Path) -> None:
+        (destination / "content").write_bytes(bytes(size))
+    return extract
+
+
+def _add(cache: ExtractedTreeCache, digest: str, size: int=100) -> None:
+    with cache.open(digest, _extract(size)):
+        pass
+
+
+def _last_used(tmp_path: Path, digest: str, when: float) -> None:
+    os.utime(str(tmp_path / "cache" / (digest + ".json")), (when, when))
+
+
+def _entries(tmp_path: Path):
+    return sorted(path.name for path in (tmp_path / "cache").iterdir() if path.is_dir() and path.name != "locks")
+
+
+def test_reuse(tmp_path):
+    cache = ExtractedTreeCache(tmp_path / "cache")
+    with cache.open("a", _extract(100)) as tree:
+        assert tree.extracted
+        assert tree.size == 100
+
+    def fail(destination: Path) -> None:
+        raise AssertionError("extracted twice")
+    with cache.open("a", fail) as tree:
+        assert not tree.extracted
+        assert (tree.path / "content").stat().st_size == 100
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = ExtractedTreeCache(tmp_path / "cache", quota=250)
+    _add(cache, "a")
+    _add(cache, "b")
+    _last_used(tmp_path, "a", 1000.)
+    _last_used(tmp_path, "b", 2000.)
+    # Using a makes b the least recently used entry
+    _add(cache, "a")
+    _add(cache, "c")
+    assert _entries(tmp_path) == ["a", "c"]
+    _add(cache, "d")
+    assert _entries(tmp_path) == ["c", "d"]
+
+
+def test_new_entry_is_kept(tmp_path):
+    cache = ExtractedTreeCache(tmp_path / "cache", quota=50)
+    _add(cache, "a")
+    assert _entries(tmp_path) == ["a"]
+    _add(cache, "b")
+    assert _entries(tmp_path) == ["b"]
+
+
+def test_entries_in_use_are_not_evicted(tmp_path):
+    cache = ExtractedTreeCache(tmp_path / "cache", quota=250)
+    _add(cache, "a")
+    _last_used(tmp_path, "a", 1000.)
+    with cache.open("a", _extract(100)) as tree:
+        _last_used(tmp_path, "a", 1000.)
+        _add(cache, "b")
+        _add(cache, "c")
+        # a is the least recently used entry, but it is in use: b is evicted
+        assert _entries(tmp_path) == ["a", "c"]
+        assert (tree.path / "content").exists()
+    _add(cache, "d")
+    assert _entries(tmp_path) == ["c", "d"]
+
+
+def test_entries_locked_by_other_readers_are_not_evicted(tmp_path):
+    cache = ExtractedTreeCache(tmp_path / "cache", quota=150)
+    _add(cache, "a")
+    # The shared lock of a job of another process
+    reader = FileLock(tmp_path / "cache" / "locks" / "a.lock")
+    assert reader.acquire(shared=True)
+    try:
+        _add(cache, "b")
+        assert _entries(tmp_path) == ["a", "b"]
+    finally:
+        reader.release()
+    cache.evict()
+    assert _entries(tmp_path) == ["b"]